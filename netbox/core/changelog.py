@@ -0,0 +1,84 @@
+from functools import partial
+
+from django.db import transaction
+
+from core.models import ObjectChange
+
+__all__ = (
+    'ObjectChangeQueue',
+    'enqueue_objectchange',
+    'find_queued_objectchange',
+)
+
+# Number of ObjectChanges written per INSERT statement
+BULK_CREATE_BATCH_SIZE = 1000
+
+
+class ObjectChangeQueue:
+    """
+    A queue of the ObjectChanges recorded while processing a request, indexed by changed object so that the most recent
+    change recorded for an object can be retrieved without scanning the queue.
+
+    Each change is written once the transaction in which it was recorded has been committed. An on_commit() callback is
+    registered for every change; the callback for the most recently recorded change writes all of the changes committed
+    up to that point in bulk. (A change recorded outside of a transaction is written immediately.) Changes recorded
+    within a transaction or savepoint which is rolled back are discarded along with their callbacks.
+    """
+    def __init__(self):
+        self._latest = {}
+        self._committed = []
+        self._sequence = 0
+
+    def append(self, objectchange):
+        self._sequence += 1
+        self._latest[(objectchange.changed_object_type_id, objectchange.changed_object_id)] = objectchange
+        transaction.on_commit(partial(self._commit, objectchange, self._sequence))
+
+    def get_latest(self, object_type_id, object_id):
+        """
+        Return the most recently queued change for the specified object, or None.
+        """
+        return self._latest.get((object_type_id, object_id))
+
+    def _commit(self, objectchange, sequence):
+        self._committed.append(objectchange)
+        if sequence == self._sequence:
+            self.flush()
+
+    def flush(self):
+        """
+        Write any changes which have been committed but not yet written, preserving the order in which they were
+        committed.
+        """
+        if self._committed:
+            objectchanges, self._committed = self._committed, []
+            with transaction.atomic():
+                ObjectChange.objects.bulk_create(objectchanges, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+def enqueue_objectchange(queue, objectchange):
+    """
+    Append an ObjectChange to the queue of changes to be written once the current transaction has been committed. If
+    no queue is active, the ObjectChange is saved immediately.
+    """
+    if queue is None:
+        objectchange.save()
+        return
+
+    # Populate the attributes normally set by ObjectChange.save()
+    if not objectchange.user_name:
+        objectchange.user_name = objectchange.user.username
+    if not objectchange.object_repr:
+        objectchange.object_repr = str(objectchange.changed_object)
+
+    queue.append(objectchange)
+
+
+def find_queued_objectchange(queue, object_type, object_id, request_id):
+    """
+    Return the most recent queued ObjectChange recorded for the specified object by the specified request, or None.
+    """
+    if queue is None or (objectchange := queue.get_latest(object_type.pk, object_id)) is None:
+        return None
+    if objectchange.request_id == request_id:
+        return objectchange
@@ -5,6 +5,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from mptt.models import MPTTModel
 
@@ -25,9 +26,10 @@ class ObjectChange(models.Model):
     indicate an object related to the one being changed. For example, a change to an interface may also indicate the
     parent device. This will ensure changes made to component models appear in the parent model's changelog.
     """
+    # Stamped when the change is recorded, as change records may be written some time later
     time = models.DateTimeField(
         verbose_name=_('time'),
-        auto_now_add=True,
+        default=timezone.now,
         editable=False,
         db_index=True
     )
@@ -8,13 +8,14 @@ from django.dispatch import receiver, Signal
 from django.utils.translation import gettext_lazy as _
 from django_prometheus.models import model_deletes, model_inserts, model_updates
 
+from core.changelog import enqueue_objectchange, find_queued_objectchange
 from core.choices import ObjectChangeActionChoices
 from core.events import *
 from core.models import ObjectChange
 from extras.events import enqueue_event
 from extras.utils import run_validators
 from netbox.config import get_config
-from netbox.context import current_request, events_queue
+from netbox.context import changelog_queue, current_request, events_queue
 from netbox.models.features import ChangeLoggingMixin
 from utilities.exceptions import AbortRequest
 from .models import ConfigRevision
@@ -43,6 +44,25 @@ clear_events = Signal()
 # Change logging & event handling
 #
 
+def clear_m2m_cache(instance, through):
+    """
+    Discard any prefetched objects cached on the instance for the many-to-many relationship(s) employing the given
+    through model, so that subsequent access reflects the current assignments.
+    """
+    if not (cache := getattr(instance, '_prefetched_objects_cache', None)):
+        return
+
+    for field in instance._meta.get_fields():
+        if not field.many_to_many:
+            continue
+        if type(field) is ManyToManyRel:
+            # Reverse relationship
+            if field.through is through:
+                cache.pop(field.field.related_query_name(), None)
+        elif getattr(field.remote_field, 'through', None) is through:
+            cache.pop(field.name, None)
+
+
 @receiver((post_save, m2m_changed))
 def handle_changed_object(sender, instance, **kwargs):
     """
@@ -70,6 +90,10 @@ def handle_changed_object(sender, instance, **kwargs):
     else:
         return
 
+    # Ensure that we're working with fresh M2M assignments
+    if m2m_changed:
+        clear_m2m_cache(instance, sender)
+
     # Create/update an ObjectChange record for this change
     action = {
         OBJECT_CREATED: ObjectChangeActionChoices.ACTION_CREATE,
@@ -77,25 +101,32 @@ def handle_changed_object(sender, instance, **kwargs):
         OBJECT_DELETED: ObjectChangeActionChoices.ACTION_DELETE,
     }[event_type]
     objectchange = instance.to_objectchange(action)
+    changes = changelog_queue.get()
     # If this is a many-to-many field change, check for a previous ObjectChange instance recorded
-    # for this object by this request and update it
-    if m2m_changed and (
-        prev_change := ObjectChange.objects.filter(
+    # for this object by this request and update it. While a request is being processed, all of
+    # its changes are held in the queue, so the database needs to be consulted only otherwise.
+    if m2m_changed and changes is not None:
+        prev_change = find_queued_objectchange(
+            changes, ContentType.objects.get_for_model(instance), instance.pk, request.id
+        )
+    elif m2m_changed:
+        prev_change = ObjectChange.objects.filter(
             changed_object_type=ContentType.objects.get_for_model(instance),
             changed_object_id=instance.pk,
             request_id=request.id
         ).first()
-    ):
+    else:
+        prev_change = None
+
+    if prev_change:
         prev_change.postchange_data = objectchange.postchange_data
-        prev_change.save()
+        if prev_change.pk:
+            prev_change.save()
     elif objectchange and objectchange.has_changes:
+        # Queue the change record to be written once the request has completed
         objectchange.user = request.user
         objectchange.request_id = request.id
-        objectchange.save()
-
-    # Ensure that we're working with fresh M2M assignments
-    if m2m_changed:
-        instance.refresh_from_db()
+        enqueue_objectchange(changes, objectchange)
 
     # Enqueue the object for event processing
     queue = events_queue.get()
@@ -138,7 +169,7 @@ def handle_deleted_object(sender, instance, **kwargs):
         objectchange = instance.to_objectchange(ObjectChangeActionChoices.ACTION_DELETE)
         objectchange.user = request.user
         objectchange.request_id = request.id
-        objectchange.save()
+        enqueue_objectchange(changelog_queue.get(), objectchange)
 
     # Django does not automatically send an m2m_changed signal for the reverse direction of a
     # many-to-many relationship (see https://code.djangoproject.com/ticket/17688), so we need to
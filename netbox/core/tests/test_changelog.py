@@ -1,14 +1,23 @@
+import uuid
+
 from django.contrib.contenttypes.models import ContentType
-from django.test import override_settings
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
 from core.choices import ObjectChangeActionChoices
+from core.signals import clear_m2m_cache
 from core.models import ObjectChange, ObjectType
 from dcim.choices import SiteStatusChoices
 from dcim.models import Site
 from extras.choices import *
-from extras.models import CustomField, CustomFieldChoiceSet, Tag
+from extras.models import CustomField, CustomFieldChoiceSet, Tag, TaggedItem
+from ipam.models import ASN, RIR
+from netbox.context_managers import event_tracking
+from utilities.exceptions import AbortTransaction
 from utilities.testing import APITestCase
 from utilities.testing.utils import create_tags, post_data
 from utilities.testing.views import ModelViewTestCase
@@ -514,3 +523,67 @@ class ChangeLogAPITest(APITestCase):
         self.assertEqual(objectchange.prechange_data['name'], 'Site 1')
         self.assertEqual(objectchange.prechange_data['slug'], 'site-1')
         self.assertEqual(objectchange.postchange_data, None)
+
+    def test_discard_rolled_back_changes(self):
+        request = RequestFactory().get(reverse('dcim:site_add'))
+        request.id = uuid.uuid4()
+        request.user = self.user
+
+        with self.captureOnCommitCallbacks(execute=True), event_tracking(request):
+            Site.objects.create(name='Site 1', slug='site-1')
+            try:
+                with transaction.atomic():
+                    Site.objects.create(name='Site 2', slug='site-2')
+                    raise AbortTransaction()
+            except AbortTransaction:
+                pass
+            recorded = timezone.now()
+
+            # Change records are written only once the transaction has been committed
+            self.assertEqual(ObjectChange.objects.count(), 0)
+
+        # The change record should be stamped with the time at which it was recorded
+        objectchange = ObjectChange.objects.get()
+        self.assertLess(objectchange.time, recorded)
+        self.assertEqual(objectchange.object_repr, 'Site 1')
+        self.assertEqual(objectchange.user_name, self.user.username)
+        self.assertEqual(objectchange.request_id, request.id)
+
+    def test_merge_m2m_changes(self):
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        site = Site.objects.prefetch_related('tags').get(pk=site.pk)
+        tags = list(Tag.objects.order_by('name'))
+        request = RequestFactory().get(reverse('dcim:site_add'))
+        request.id = uuid.uuid4()
+        request.user = self.user
+
+        # Repeated M2M changes within a request should update a single change record, without querying for it
+        with self.captureOnCommitCallbacks(execute=True), event_tracking(request):
+            with CaptureQueriesContext(connection) as queries:
+                site.tags.add(tags[0])
+                site.tags.add(tags[1], tags[2])
+                site.tags.remove(tags[0])
+        self.assertFalse([q['sql'] for q in queries if ObjectChange._meta.db_table in q['sql']])
+
+        objectchange = ObjectChange.objects.get()
+        self.assertEqual(objectchange.action, ObjectChangeActionChoices.ACTION_UPDATE)
+        self.assertEqual(objectchange.postchange_data['tags'], ['Tag 2', 'Tag 3'])
+
+    def test_clear_m2m_cache(self):
+        asn = ASN.objects.create(asn=65000, rir=RIR.objects.create(name='RIR 1', slug='rir-1'))
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        site.asns.add(asn)
+
+        # Forward relationships: only the cache for the relationship employing the through model is discarded
+        site = Site.objects.prefetch_related('asns', 'tags').get(pk=site.pk)
+        clear_m2m_cache(site, Site.asns.through)
+        self.assertNotIn('asns', site._prefetched_objects_cache)
+        self.assertIn('tags', site._prefetched_objects_cache)
+        clear_m2m_cache(site, TaggedItem)
+        self.assertNotIn('tags', site._prefetched_objects_cache)
+
+        # Reverse relationships
+        asn = ASN.objects.prefetch_related('sites', 'tags').get(pk=asn.pk)
+        clear_m2m_cache(asn, Site.asns.through)
+        self.assertNotIn('sites', asn._prefetched_objects_cache)
+        self.assertIn('tags', asn._prefetched_objects_cache)
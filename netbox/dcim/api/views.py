@@ -1,6 +1,8 @@
 from django.contrib.contenttypes.prefetch import GenericPrefetch
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework.decorators import action
@@ -53,7 +55,18 @@ class PathEndpointMixin(object):
             except (ValueError, TypeError):
                 width = CABLE_TRACE_SVG_DEFAULT_WIDTH
             drawing = CableTraceSVG(obj, base_url=request.build_absolute_uri('/'), width=width)
-            return HttpResponse(drawing.render().tostring(), content_type='image/svg+xml')
+
+            # Answer conditional requests for an unchanged trace without rendering it. No Last-Modified time is sent, as
+            # a rebuilt path may include only objects which are older than those it replaced.
+            version = drawing.get_version()
+            etag = quote_etag(version)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = HttpResponse(drawing.render_cached(version), content_type='image/svg+xml')
+            response.headers['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+
+            return response
 
         # Serialize path objects, iterating over each three-tuple in the path
         for near_ends, cable, far_ends in obj.trace():
@@ -95,6 +95,9 @@ MODULAR_COMPONENT_MODELS = Q(
 
 CABLE_TRACE_SVG_DEFAULT_WIDTH = 400
 
+# Lifetime of rendered cable trace SVG documents in the cache (in seconds)
+CABLE_TRACE_SVG_CACHE_TIMEOUT = 3600
+
 # Cable endpoint types
 CABLE_TERMINATION_MODELS = Q(
     Q(app_label='circuits', model__in=(
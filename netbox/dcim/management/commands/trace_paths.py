@@ -1,10 +1,17 @@
-from django.core.management.base import BaseCommand
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
 from django.core.management.color import no_style
-from django.db import connection
-from django.db.models import Q
+from django.db import connection, connections, transaction
+from django.db.models import Count, Q
 
-from dcim.models import CablePath, ConsolePort, ConsoleServerPort, Interface, PowerFeed, PowerOutlet, PowerPort
-from dcim.signals import create_cablepath
+from dcim.models import (
+    CablePath, ConsolePort, ConsoleServerPort, Interface, PowerFeed, PowerOutlet, PowerPort, Site,
+)
+from dcim.topology import CableTopology
+from dcim.utils import bulk_create_cablepaths
 
 ENDPOINT_MODELS = (
     ConsolePort,
@@ -15,6 +22,45 @@ ENDPOINT_MODELS = (
     PowerPort
 )
 
+# The field by which each type of endpoint is assigned to a site
+SITE_FIELDS = {
+    PowerFeed: 'power_panel__site',
+}
+
+
+def get_origins(model, force=False):
+    """
+    Return all cabled endpoints of the given type (or only those lacking a path, unless force is True).
+    """
+    params = Q(cable__isnull=False)
+    if hasattr(model, 'wireless_link'):
+        params |= Q(wireless_link__isnull=False)
+    origins = model.objects.filter(params)
+    if not force:
+        origins = origins.filter(_path__isnull=True)
+    return origins
+
+
+def trace_site(site_id, force=False):
+    """
+    Trace the CablePaths originating from all cabled endpoints within the specified site and save them in bulk.
+    Returns the site ID, the number of paths created, and the elapsed time in seconds.
+    """
+    start_time = time.monotonic()
+    topology = CableTopology.load(site=site_id)
+
+    cable_paths = []
+    for model in ENDPOINT_MODELS:
+        origins = get_origins(model, force).filter(**{SITE_FIELDS.get(model, 'device__site'): site_id})
+        for origin in origins:
+            if cable_path := CablePath.from_origin([origin], topology=topology):
+                cable_paths.append(cable_path)
+
+    with transaction.atomic():
+        bulk_create_cablepaths(cable_paths)
+
+    return site_id, len(cable_paths), time.monotonic() - start_time
+
 
 class Command(BaseCommand):
     help = "Generate any missing cable paths among all cable termination objects in NetBox"
@@ -28,6 +74,10 @@ class Command(BaseCommand):
             "--no-input", action='store_true', dest='no_input',
             help="Do not prompt user for any input/confirmation"
         )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Number of worker processes to use (default: 1)"
+        )
 
     def draw_progress_bar(self, percentage):
         """
@@ -37,6 +87,8 @@ class Command(BaseCommand):
         self.stdout.write(f"\r  [{'#' * bar_size}{' ' * (20 - bar_size)}] {int(percentage)}%", ending='')
 
     def handle(self, *model_names, **options):
+        if options['workers'] < 1:
+            raise CommandError("The number of workers must be at least 1.")
 
         # If --force was passed, first delete all existing CablePaths
         if options['force']:
@@ -66,25 +118,50 @@ class Command(BaseCommand):
                 for sql in sequence_sql:
                     cursor.execute(sql)
 
-        # Retrace paths
+        # Count the endpoints to be traced within each site, tracing the largest sites first
+        origin_counts = {}
         for model in ENDPOINT_MODELS:
-            params = Q(cable__isnull=False)
-            if hasattr(model, 'wireless_link'):
-                params |= Q(wireless_link__isnull=False)
-            origins = model.objects.filter(params)
-            if not options['force']:
-                origins = origins.filter(_path__isnull=True)
-            origins_count = origins.count()
-            if not origins_count:
-                self.stdout.write(f'Found no missing {model._meta.verbose_name} paths; skipping')
-                continue
-            self.stdout.write(f'Retracing {origins_count} cabled {model._meta.verbose_name_plural}...')
-            i = 0
-            for i, obj in enumerate(origins, start=1):
-                create_cablepath([obj])
-                if not i % 100:
-                    self.draw_progress_bar(i * 100 / origins_count)
-            self.draw_progress_bar(100)
-            self.stdout.write(self.style.SUCCESS(f'\n  Retraced {i} {model._meta.verbose_name_plural}'))
-
-        self.stdout.write(self.style.SUCCESS('Finished.'))
+            site_field = SITE_FIELDS.get(model, 'device__site')
+            for row in get_origins(model, options['force']).order_by().values(site_field).annotate(count=Count('pk')):
+                origin_counts[row[site_field]] = origin_counts.get(row[site_field], 0) + row['count']
+        if not origin_counts:
+            self.stdout.write('Found no missing cable paths; skipping')
+            return
+        origins_count = sum(origin_counts.values())
+        site_names = dict(Site.objects.filter(pk__in=origin_counts).values_list('pk', 'name'))
+        site_ids = sorted(origin_counts, key=lambda site_id: origin_counts[site_id], reverse=True)
+        self.stdout.write(
+            f'Retracing {origins_count} cabled endpoints in {len(site_ids)} sites '
+            f'using {options["workers"]} workers...'
+        )
+        start_time = time.monotonic()
+        progress = {'endpoints': 0, 'paths': 0}
+
+        def record(result):
+            site_id, paths_count, elapsed = result
+            progress['endpoints'] += origin_counts[site_id]
+            progress['paths'] += paths_count
+            self.draw_progress_bar(progress['endpoints'] * 100 / origins_count)
+            rate = progress['paths'] / (time.monotonic() - start_time)
+            self.stdout.write(
+                f' {site_names[site_id]}: {paths_count} paths in {elapsed:.1f}s ({rate:.0f} paths/s overall)'
+            )
+
+        if options['workers'] == 1:
+            for site_id in site_ids:
+                record(trace_site(site_id, options['force']))
+        else:
+            # Close any open database connections prior to forking worker processes
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('fork')
+            ) as executor:
+                futures = [executor.submit(trace_site, site_id, options['force']) for site_id in site_ids]
+                for future in as_completed(futures):
+                    record(future.result())
+
+        elapsed = time.monotonic() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {progress["paths"]} cable paths in {elapsed:.1f}s ({progress["paths"] / elapsed:.0f} paths/s).'
+        ))
@@ -1,6 +1,7 @@
 import itertools
 
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.dispatch import Signal
@@ -10,6 +11,7 @@ from core.models import ObjectType
 from dcim.choices import *
 from dcim.constants import *
 from dcim.fields import PathField
+from dcim.querysets import CablePathQuerySet
 from dcim.utils import decompile_path_node, object_to_path_node
 from netbox.models import ChangeLoggedModel, PrimaryModel
 from utilities.conversion import to_meters
@@ -458,9 +460,14 @@ class CablePath(models.Model):
     )
     _nodes = PathField()
 
+    objects = CablePathQuerySet.as_manager()
+
     _netbox_private = True
 
     class Meta:
+        indexes = (
+            GinIndex(fields=('_nodes',), name='dcim_cablepath_nodes'),
+        )
         verbose_name = _('cable path')
         verbose_name_plural = _('cable paths')
 
@@ -524,23 +531,36 @@ class CablePath(models.Model):
         return int(len(self.path) / 3)
 
     @classmethod
-    def from_origin(cls, terminations):
+    def from_origin(cls, terminations, position_stack=None, topology=None):
         """
         Create a new CablePath instance as traced from the given termination objects. These can be any object to which a
         Cable or WirelessLink connects (interfaces, console ports, circuit termination, etc.). All terminations must be
         of the same type and must belong to the same parent object.
+
+        A trace may also be resumed partway along an existing path by passing the near-end terminations of a hop along
+        with the stack of rear port positions in effect at that point (which may be empty). The returned instance then
+        holds only the remainder of the path, starting with the given terminations.
+
+        If a CableTopology is specified, the path is traced against it rather than querying the database for each hop.
         """
         from circuits.models import CircuitTermination
 
         if not terminations:
             return None
 
+        if topology is not None:
+            terminations = topology.get_terminations(terminations)
+
+        is_resumed = position_stack is not None
+
         # Ensure all originating terminations are attached to the same link
-        if len(terminations) > 1 and not all(t.link == terminations[0].link for t in terminations[1:]):
+        if not is_resumed and len(terminations) > 1 and not all(
+            t.link == terminations[0].link for t in terminations[1:]
+        ):
             raise UnsupportedCablePath(_("All originating terminations must be attached to the same link"))
 
         path = []
-        position_stack = []
+        position_stack = [list(positions) for positions in position_stack or []]
         is_complete = False
         is_active = True
         is_split = False
@@ -572,7 +592,7 @@ class CablePath(models.Model):
             # Step 2: Determine the attached links (Cable or WirelessLink), if any
             links = [termination.link for termination in terminations if termination.link is not None]
             if len(links) == 0:
-                if len(path) == 1:
+                if len(path) == 1 and not is_resumed:
                     # If this is the start of the path and no link exists, return None
                     return None
                 # Otherwise, halt the trace if no link exists
@@ -601,7 +621,13 @@ class CablePath(models.Model):
                 is_active = False
 
             # Step 6: Determine the far-end terminations
-            if isinstance(links[0], Cable):
+            if isinstance(links[0], Cable) and topology is not None:
+                remote_terminations = topology.get_far_end(terminations)
+
+                # As below, stop if no CableTerminations were found
+                if remote_terminations is None:
+                    break
+            elif isinstance(links[0], Cable):
                 termination_type = ObjectType.objects.get_for_model(terminations[0])
                 local_cable_terminations = CableTermination.objects.filter(
                     termination_type=termination_type,
@@ -642,9 +668,12 @@ class CablePath(models.Model):
 
             if isinstance(remote_terminations[0], FrontPort):
                 # Follow FrontPorts to their corresponding RearPorts
-                rear_ports = RearPort.objects.filter(
-                    pk__in=[t.rear_port_id for t in remote_terminations]
-                )
+                if topology is not None:
+                    rear_ports = topology.get_rear_ports(remote_terminations)
+                else:
+                    rear_ports = RearPort.objects.filter(
+                        pk__in=[t.rear_port_id for t in remote_terminations]
+                    )
                 if len(rear_ports) > 1 or rear_ports[0].positions > 1:
                     position_stack.append([fp.rear_port_position for fp in remote_terminations])
 
@@ -652,10 +681,13 @@ class CablePath(models.Model):
 
             elif isinstance(remote_terminations[0], RearPort):
                 if len(remote_terminations) == 1 and remote_terminations[0].positions == 1:
-                    front_ports = FrontPort.objects.filter(
-                        rear_port_id__in=[rp.pk for rp in remote_terminations],
-                        rear_port_position=1
-                    )
+                    if topology is not None:
+                        front_ports = topology.get_front_ports([(remote_terminations[0].pk, [1])])
+                    else:
+                        front_ports = FrontPort.objects.filter(
+                            rear_port_id__in=[rp.pk for rp in remote_terminations],
+                            rear_port_position=1
+                        )
                 # Obtain the individual front ports based on the termination and all positions
                 elif len(remote_terminations) > 1 and position_stack:
                     positions = position_stack.pop()
@@ -668,21 +700,34 @@ class CablePath(models.Model):
 
                     # Get our front ports
                     q_filter = Q()
+                    rear_port_positions = []
                     for rt in remote_terminations:
                         position = positions.pop()
                         q_filter |= Q(rear_port_id=rt.pk, rear_port_position=position)
+                        rear_port_positions.append((rt.pk, [position]))
                     if q_filter is Q():
                         raise UnsupportedCablePath(_("Remote termination position filter is missing"))
-                    front_ports = FrontPort.objects.filter(q_filter)
+                    if topology is not None:
+                        front_ports = topology.get_front_ports(rear_port_positions)
+                    else:
+                        front_ports = FrontPort.objects.filter(q_filter)
                 # Obtain the individual front ports based on the termination and position
                 elif position_stack:
-                    front_ports = FrontPort.objects.filter(
-                        rear_port_id=remote_terminations[0].pk,
-                        rear_port_position__in=position_stack.pop()
-                    )
+                    if topology is not None:
+                        front_ports = topology.get_front_ports([(remote_terminations[0].pk, position_stack.pop())])
+                    else:
+                        front_ports = FrontPort.objects.filter(
+                            rear_port_id=remote_terminations[0].pk,
+                            rear_port_position__in=position_stack.pop()
+                        )
                 # If all rear ports have a single position, we can just get the front ports
                 elif all([rp.positions == 1 for rp in remote_terminations]):
-                    front_ports = FrontPort.objects.filter(rear_port_id__in=[rp.pk for rp in remote_terminations])
+                    if topology is not None:
+                        front_ports = topology.get_front_ports([(rp.pk, None) for rp in remote_terminations])
+                    else:
+                        front_ports = FrontPort.objects.filter(
+                            rear_port_id__in=[rp.pk for rp in remote_terminations]
+                        )
 
                     if len(front_ports) != len(remote_terminations):
                         # Some rear ports does not have a front port
@@ -700,10 +745,13 @@ class CablePath(models.Model):
                 if len(remote_terminations) > 1:
                     is_split = True
                     break
-                circuit_termination = CircuitTermination.objects.filter(
-                    circuit=remote_terminations[0].circuit,
-                    term_side='Z' if remote_terminations[0].term_side == 'A' else 'A'
-                ).first()
+                if topology is not None:
+                    circuit_termination = topology.get_peer_termination(remote_terminations[0])
+                else:
+                    circuit_termination = CircuitTermination.objects.filter(
+                        circuit=remote_terminations[0].circuit,
+                        term_side='Z' if remote_terminations[0].term_side == 'A' else 'A'
+                    ).first()
                 if circuit_termination is None:
                     break
                 elif circuit_termination._provider_network:
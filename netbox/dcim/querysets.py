@@ -0,0 +1,17 @@
+from django.db import models
+
+from dcim.utils import object_to_path_node
+
+__all__ = (
+    'CablePathQuerySet',
+)
+
+
+class CablePathQuerySet(models.QuerySet):
+
+    def traversing(self, objects):
+        """
+        Return all CablePaths which traverse any of the specified objects. Matching paths are found with a single query,
+        which is served by the GIN index on the flattened list of path nodes.
+        """
+        return self.filter(_nodes__overlap=[object_to_path_node(obj) for obj in objects])
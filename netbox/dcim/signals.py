@@ -8,7 +8,7 @@ from .models import (
     Cable, CablePath, CableTermination, Device, FrontPort, PathEndpoint, PowerPanel, Rack, Location, VirtualChassis,
 )
 from .models.cables import trace_paths
-from .utils import create_cablepath, rebuild_paths
+from .utils import compile_path_node, create_cablepath, object_to_path_node, rebuild_paths, splice_paths
 
 
 #
@@ -113,8 +113,7 @@ def retrace_cable_paths(instance, **kwargs):
     """
     When a Cable is deleted, check for and update its connected endpoints
     """
-    for cablepath in CablePath.objects.filter(_nodes__contains=instance):
-        cablepath.retrace()
+    rebuild_paths([instance])
 
 
 @receiver(post_delete, sender=CableTermination)
@@ -125,11 +124,17 @@ def nullify_connected_endpoints(instance, **kwargs):
     model = instance.termination_type.model_class()
     model.objects.filter(pk=instance.termination_id).update(cable=None, cable_end='')
 
+    termination_node = compile_path_node(instance.termination_type_id, instance.termination_id)
+    cable_paths = []
     for cablepath in CablePath.objects.filter(_nodes__contains=instance.cable):
         # Remove the deleted CableTermination if it's one of the path's originating nodes
-        if instance.termination in cablepath.origins:
-            cablepath.origins.remove(instance.termination)
-        cablepath.retrace()
+        if termination_node in cablepath.path[0]:
+            if instance.termination in cablepath.origins:
+                cablepath.origins.remove(instance.termination)
+            cablepath.retrace()
+        else:
+            cable_paths.append(cablepath)
+    splice_paths(cable_paths, [object_to_path_node(instance.cable)])
 
 
 @receiver(post_save, sender=FrontPort)
@@ -138,6 +143,4 @@ def extend_rearport_cable_paths(instance, created, raw, **kwargs):
     When a new FrontPort is created, add it to any CablePaths which end at its corresponding RearPort.
     """
     if created and not raw:
-        rearport = instance.rear_port
-        for cablepath in CablePath.objects.filter(_nodes__contains=rearport):
-            cablepath.retrace()
+        rebuild_paths([instance.rear_port])
@@ -1,11 +1,18 @@
+import hashlib
+import json
+
 import svgwrite
 from svgwrite.container import Group, Hyperlink
 from svgwrite.shapes import Line, Polyline, Rect
 from svgwrite.text import Text
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Max
 
-from dcim.constants import CABLE_TRACE_SVG_DEFAULT_WIDTH
+from dcim.constants import CABLE_TRACE_SVG_CACHE_TIMEOUT, CABLE_TRACE_SVG_DEFAULT_WIDTH
+from dcim.utils import decompile_path_node, object_to_path_node
 from utilities.html import foreground_color
 
 __all__ = (
@@ -19,6 +26,24 @@ FANOUT_HEIGHT = 35
 FANOUT_LEG_HEIGHT = 15
 CABLE_HEIGHT = 5 * LINE_HEIGHT + FANOUT_HEIGHT + FANOUT_LEG_HEIGHT
 
+CACHE_KEY_PREFIX = 'cable_trace_svg'
+
+# Objects related to a traced object (e.g. its parent device and the device's role) which are drawn alongside it
+RELATED_OBJECTS = (
+    'device',
+    'device__role',
+    'device__device_type',
+    'device__device_type__manufacturer',
+    'device__site',
+    'device__location',
+    'device__rack',
+    'circuit',
+    'circuit__type',
+    'circuit__provider',
+    'power_panel',
+    'provider',
+)
+
 
 class Node(Hyperlink):
     """
@@ -337,6 +362,74 @@ class CableTraceSVG:
 
         return group
 
+    def get_version(self):
+        """
+        Return a digest identifying the current state of the trace. It covers the node list and status of each
+        CablePath along the trace and the last-modified times of the objects those paths include and of the related
+        objects drawn alongside them, so it changes whenever a path is rebuilt or any drawn object is modified.
+        """
+        from dcim.models import CablePath
+
+        # Collect each CablePath along the trace, following bridged interfaces as trace() does
+        path_states = []
+        nodes = {object_to_path_node(self.origin)}
+        path_id = self.origin._path_id
+        visited = set()
+        while path_id is not None and path_id not in visited:
+            visited.add(path_id)
+            state = CablePath.objects.filter(pk=path_id).values_list(
+                'pk', 'path', 'is_active', 'is_complete', 'is_split'
+            ).first()
+            if state is None:
+                break
+            path_states.append(state)
+            pk, path, is_active, is_complete, is_split = state
+            for step in path:
+                nodes.update(step)
+
+            path_id = None
+            if is_complete and len(path[-1]) == 1:
+                ct_id, object_id = decompile_path_node(path[-1][0])
+                model = ContentType.objects.get_for_id(ct_id).model_class()
+                if any(field.name == 'bridge' for field in model._meta.get_fields()):
+                    path_id = model.objects.filter(pk=object_id).values_list('bridge___path', flat=True).first()
+
+        # Retrieve the most recent modification time of the traced objects of each type and of their related objects
+        object_ids = {}
+        for node in nodes:
+            ct_id, object_id = decompile_path_node(node)
+            object_ids.setdefault(ct_id, []).append(object_id)
+        timestamps = []
+        for ct_id in sorted(object_ids):
+            model = ContentType.objects.get_for_id(ct_id).model_class()
+            field_names = {field.name for field in model._meta.get_fields()}
+            aggregates = [Max('last_updated')]
+            for related_object in RELATED_OBJECTS:
+                if related_object.split('__')[0] in field_names:
+                    aggregates.append(Max(f'{related_object}__last_updated'))
+            timestamps.extend(model.objects.filter(pk__in=object_ids[ct_id]).aggregate(
+                **{f'last_updated_{i}': aggregate for i, aggregate in enumerate(aggregates)}
+            ).values())
+
+        return hashlib.sha256(
+            json.dumps([self.width, self.base_url, path_states, timestamps], default=str).encode()
+        ).hexdigest()
+
+    def render_cached(self, version=None):
+        """
+        Return the SVG document as a string, reusing a cached rendering of the same version of the trace if one exists.
+        """
+        if version is None:
+            version = self.get_version()
+        cache_key = f'{CACHE_KEY_PREFIX}:{version}'
+
+        svg = cache.get(cache_key)
+        if svg is None:
+            svg = self.render().tostring()
+            cache.set(cache_key, svg, CABLE_TRACE_SVG_CACHE_TIMEOUT)
+
+        return svg
+
     def render(self):
         """
         Return an SVG document representing a cable trace.
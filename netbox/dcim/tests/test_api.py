@@ -66,6 +66,50 @@ class Mixins:
             self.assertEqual(segment1[1]['label'], cable.label)
             self.assertEqual(segment1[2][0]['name'], peer_obj.name)
 
+        def test_trace_svg_conditional(self):
+            """
+            Test conditional requests for the SVG rendering of a device component's trace.
+            """
+            obj = self.model.objects.first()
+            peer_device = Device.objects.create(
+                site=Site.objects.first(),
+                device_type=DeviceType.objects.first(),
+                role=DeviceRole.objects.first(),
+                name='Peer Device'
+            )
+            peer_obj = self.peer_termination_type.objects.create(
+                device=peer_device,
+                name='Peer Termination'
+            )
+            Cable(a_terminations=[obj], b_terminations=[peer_obj], label='Cable 1').save()
+
+            self.add_permissions(f'dcim.view_{self.model._meta.model_name}')
+            url = reverse(f'dcim-api:{self.model._meta.model_name}-trace', kwargs={'pk': obj.pk})
+            response = self.client.get(f'{url}?render=svg', **self.header)
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            etag = response.headers['ETag']
+
+            # An unchanged trace is not re-sent
+            response = self.client.get(f'{url}?render=svg', HTTP_IF_NONE_MATCH=etag, **self.header)
+            self.assertHttpStatus(response, status.HTTP_304_NOT_MODIFIED)
+
+            # Modifying a traced object produces a new version
+            peer_obj.label = 'Peer Label'
+            peer_obj.save()
+            response = self.client.get(f'{url}?render=svg', HTTP_IF_NONE_MATCH=etag, **self.header)
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            self.assertNotEqual(response.headers['ETag'], etag)
+            etag = response.headers['ETag']
+
+            # Modifying a related object drawn alongside the trace (the device role's color) produces a new version
+            role = obj.device.role
+            role.color = 'ff0000' if role.color != 'ff0000' else '00ff00'
+            role.save()
+            response = self.client.get(f'{url}?render=svg', HTTP_IF_NONE_MATCH=etag, **self.header)
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            self.assertNotEqual(response.headers['ETag'], etag)
+            self.assertNotIn('Last-Modified', response.headers)
+
 
 class RegionTest(APIViewTestCases.APIViewTestCase):
     model = Region
@@ -1,9 +1,14 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 
 from circuits.models import *
 from dcim.choices import LinkStatusChoices
 from dcim.models import *
 from dcim.svg import CableTraceSVG
+from dcim.topology import CableTopology
 from dcim.utils import object_to_path_node
 from utilities.exceptions import AbortRequest
 
@@ -2421,6 +2426,115 @@ class CablePathTestCase(TestCase):
             is_active=True
         )
 
+    def test_304_repatch_trunk_cable(self):
+        """
+        [IF1] --C1-- [FP1:1] [RP1] --C3-- [RP2] [FP2:1] --C4-- [IF2]
+        [IF3] --C2-- [FP1:2]                    [FP2:2] --C5-- [IF4]
+
+                                                [RP3] [FP3:1] --C6-- [IF5]
+                                                      [FP3:2] --C7-- [IF6]
+        """
+        interface1 = Interface.objects.create(device=self.device, name='Interface 1')
+        interface2 = Interface.objects.create(device=self.device, name='Interface 2')
+        interface3 = Interface.objects.create(device=self.device, name='Interface 3')
+        interface4 = Interface.objects.create(device=self.device, name='Interface 4')
+        interface5 = Interface.objects.create(device=self.device, name='Interface 5')
+        interface6 = Interface.objects.create(device=self.device, name='Interface 6')
+        rearport1 = RearPort.objects.create(device=self.device, name='Rear Port 1', positions=2)
+        rearport2 = RearPort.objects.create(device=self.device, name='Rear Port 2', positions=2)
+        rearport3 = RearPort.objects.create(device=self.device, name='Rear Port 3', positions=2)
+        frontport1_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1:1', rear_port=rearport1, rear_port_position=1
+        )
+        frontport1_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1:2', rear_port=rearport1, rear_port_position=2
+        )
+        frontport2_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 2:1', rear_port=rearport2, rear_port_position=1
+        )
+        frontport2_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 2:2', rear_port=rearport2, rear_port_position=2
+        )
+        frontport3_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 3:1', rear_port=rearport3, rear_port_position=1
+        )
+        frontport3_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 3:2', rear_port=rearport3, rear_port_position=2
+        )
+
+        # Create cables
+        cable1 = Cable(a_terminations=[interface1], b_terminations=[frontport1_1])
+        cable1.save()
+        cable2 = Cable(a_terminations=[interface3], b_terminations=[frontport1_2])
+        cable2.save()
+        cable3 = Cable(a_terminations=[rearport1], b_terminations=[rearport2])
+        cable3.save()
+        cable4 = Cable(a_terminations=[frontport2_1], b_terminations=[interface2])
+        cable4.save()
+        cable5 = Cable(a_terminations=[frontport2_2], b_terminations=[interface4])
+        cable5.save()
+        cable6 = Cable(a_terminations=[frontport3_1], b_terminations=[interface5])
+        cable6.save()
+        cable7 = Cable(a_terminations=[frontport3_2], b_terminations=[interface6])
+        cable7.save()
+        path1 = self.assertPathExists(
+            (interface1, cable1, frontport1_1, rearport1, cable3, rearport2, frontport2_1, cable4, interface2),
+            is_complete=True,
+            is_active=True
+        )
+        path2 = self.assertPathExists(
+            (interface3, cable2, frontport1_2, rearport1, cable3, rearport2, frontport2_2, cable5, interface4),
+            is_complete=True,
+            is_active=True
+        )
+        self.assertPathExists(
+            (interface5, cable6, frontport3_1, rearport3),
+            is_complete=False
+        )
+        self.assertEqual(CablePath.objects.count(), 6)
+
+        # Re-patch cable 3 from RP2 to RP3
+        cable3 = Cable.objects.get(pk=cable3.pk)
+        cable3.b_terminations = [rearport3]
+        cable3.save()
+
+        # Paths traversing cable 3 are spliced in place
+        self.assertEqual(
+            self.assertPathExists(
+                (interface1, cable1, frontport1_1, rearport1, cable3, rearport3, frontport3_1, cable6, interface5),
+                is_complete=True,
+                is_active=True
+            ).pk,
+            path1.pk
+        )
+        self.assertEqual(
+            self.assertPathExists(
+                (interface3, cable2, frontport1_2, rearport1, cable3, rearport3, frontport3_2, cable7, interface6),
+                is_complete=True,
+                is_active=True
+            ).pk,
+            path2.pk
+        )
+        self.assertPathExists(
+            (interface2, cable4, frontport2_1, rearport2),
+            is_complete=False
+        )
+        self.assertPathExists(
+            (interface4, cable5, frontport2_2, rearport2),
+            is_complete=False
+        )
+        self.assertPathExists(
+            (interface5, cable6, frontport3_1, rearport3, cable3, rearport1, frontport1_1, cable1, interface1),
+            is_complete=True,
+            is_active=True
+        )
+        self.assertPathExists(
+            (interface6, cable7, frontport3_2, rearport3, cable3, rearport1, frontport1_2, cable2, interface3),
+            is_complete=True,
+            is_active=True
+        )
+        self.assertEqual(CablePath.objects.count(), 6)
+
     def test_401_exclude_midspan_devices(self):
         """
         [IF1] --C1-- [FP1][Test Device][RP1] --C2-- [RP2][Test Device][FP2] --C3-- [IF2]
@@ -2510,3 +2624,111 @@ class CablePathTestCase(TestCase):
             is_active=True
         )
         self.assertEqual(CablePath.objects.count(), 0)
+
+    def test_501_trace_against_topology(self):
+        """
+        [IF1] --C1-- [FP1:1] [RP1] --C3-- [RP2] [FP2:1] --C4-- [IF2]
+        [IF3] --C2-- [FP1:2]                    [FP2:2] --C5-- [CT1] [CT2] --C6-- [IF4]
+        """
+        interface1 = Interface.objects.create(device=self.device, name='Interface 1')
+        interface2 = Interface.objects.create(device=self.device, name='Interface 2')
+        interface3 = Interface.objects.create(device=self.device, name='Interface 3')
+        interface4 = Interface.objects.create(device=self.device, name='Interface 4')
+        rearport1 = RearPort.objects.create(device=self.device, name='Rear Port 1', positions=2)
+        rearport2 = RearPort.objects.create(device=self.device, name='Rear Port 2', positions=2)
+        frontport1_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1:1', rear_port=rearport1, rear_port_position=1
+        )
+        frontport1_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1:2', rear_port=rearport1, rear_port_position=2
+        )
+        frontport2_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 2:1', rear_port=rearport2, rear_port_position=1
+        )
+        frontport2_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 2:2', rear_port=rearport2, rear_port_position=2
+        )
+        circuittermination1 = CircuitTermination.objects.create(
+            circuit=self.circuit, termination=self.site, term_side='A'
+        )
+        circuittermination2 = CircuitTermination.objects.create(
+            circuit=self.circuit, termination=self.site, term_side='Z'
+        )
+        Cable(a_terminations=[interface1], b_terminations=[frontport1_1]).save()
+        Cable(a_terminations=[interface3], b_terminations=[frontport1_2]).save()
+        Cable(a_terminations=[rearport1], b_terminations=[rearport2]).save()
+        Cable(a_terminations=[frontport2_1], b_terminations=[interface2]).save()
+        Cable(a_terminations=[frontport2_2], b_terminations=[circuittermination1]).save()
+        Cable(a_terminations=[circuittermination2], b_terminations=[interface4]).save()
+
+        # Paths traced against the topology must match those traced against the database, without querying it
+        topology = CableTopology.load(devices=[self.device])
+        for interface in (interface1, interface2, interface3, interface4):
+            interface = Interface.objects.get(pk=interface.pk)
+            cablepath = CablePath.objects.get(pk=interface._path_id)
+            with self.assertNumQueries(0):
+                traced_path = CablePath.from_origin([interface], topology=topology)
+            self.assertEqual(traced_path.path, cablepath.path)
+            self.assertEqual(traced_path.is_complete, cablepath.is_complete)
+            self.assertEqual(traced_path.is_active, cablepath.is_active)
+
+    def test_502_trace_paths_command(self):
+        """
+        [IF1] --C1-- [FP1] [RP1] --C2-- [IF2]
+        """
+        interface1 = Interface.objects.create(device=self.device, name='Interface 1')
+        interface2 = Interface.objects.create(device=self.device, name='Interface 2')
+        rearport1 = RearPort.objects.create(device=self.device, name='Rear Port 1', positions=1)
+        frontport1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1', rear_port=rearport1, rear_port_position=1
+        )
+        cable1 = Cable(a_terminations=[interface1], b_terminations=[frontport1])
+        cable1.save()
+        cable2 = Cable(a_terminations=[rearport1], b_terminations=[interface2])
+        cable2.save()
+        paths = sorted(CablePath.objects.values_list('path', flat=True))
+
+        # Delete and retrace all paths
+        call_command('trace_paths', force=True, no_input=True, stdout=StringIO())
+        self.assertEqual(sorted(CablePath.objects.values_list('path', flat=True)), paths)
+        path1 = self.assertPathExists(
+            (interface1, cable1, frontport1, rearport1, cable2, interface2),
+            is_complete=True,
+            is_active=True
+        )
+        path2 = self.assertPathExists(
+            (interface2, cable2, rearport1, frontport1, cable1, interface1),
+            is_complete=True,
+            is_active=True
+        )
+        interface1.refresh_from_db()
+        interface2.refresh_from_db()
+        self.assertPathIsSet(interface1, path1)
+        self.assertPathIsSet(interface2, path2)
+
+    def test_503_paths_traversing_nodes(self):
+        """
+        [IF1] --C1-- [IF2]
+        [IF3] --C2-- [IF4]
+        [IF5] --C3-- [IF6]
+        """
+        interfaces = [
+            Interface.objects.create(device=self.device, name=f'Interface {i}') for i in range(1, 7)
+        ]
+        cable1 = Cable(a_terminations=[interfaces[0]], b_terminations=[interfaces[1]])
+        cable1.save()
+        cable2 = Cable(a_terminations=[interfaces[2]], b_terminations=[interfaces[3]])
+        cable2.save()
+        cable3 = Cable(a_terminations=[interfaces[4]], b_terminations=[interfaces[5]])
+        cable3.save()
+
+        cable_paths = CablePath.objects.traversing([cable1, interfaces[3]])
+        self.assertEqual(
+            {cp._nodes[0] for cp in cable_paths},
+            {object_to_path_node(interface) for interface in interfaces[:4]}
+        )
+
+        # The lookup must be served by the GIN index
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('dcim_cablepath_nodes', cable_paths.explain())
@@ -0,0 +1,238 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+
+from circuits.models import CircuitTermination
+from dcim.models import CableTermination, FrontPort, RearPort
+
+__all__ = (
+    'CableTopology',
+)
+
+# Relations of termination objects which are consulted while tracing a CablePath
+TERMINATION_RELATED_FIELDS = ('cable', 'device', 'circuit', 'power_panel', '_provider_network')
+
+
+class CableTopology:
+    """
+    An in-memory snapshot of cables, their terminations, and the mappings between front and rear pass-through ports.
+    CablePath.from_origin() can trace paths against a snapshot without querying the database for each hop.
+
+    A snapshot is loaded for a site or a set of devices (or for all cabling). Any cable, device, or circuit reached
+    during a trace which falls outside the initial scope is loaded on demand and retained for subsequent traces.
+    """
+    def __init__(self):
+        # (termination type ID, termination ID) -> termination object
+        self.terminations = {}
+        # (termination type ID, termination ID) -> CableTermination
+        self.cable_terminations = {}
+        # (cable ID, cable end) -> [CableTermination, ...]
+        self.cable_ends = defaultdict(list)
+        # RearPort ID -> RearPort
+        self.rear_ports = {}
+        # RearPort ID -> {position: FrontPort}
+        self.front_ports = defaultdict(dict)
+        # (circuit ID, term side) -> CircuitTermination
+        self.circuit_terminations = {}
+        # (termination type ID, termination ID) -> position of pass-through ports within their default ordering
+        self.port_order = {}
+
+        self._cable_ids = set()
+        self._device_ids = set()
+        self._circuit_ids = set()
+
+    def __len__(self):
+        return len(self._cable_ids)
+
+    @classmethod
+    def load(cls, site=None, devices=None):
+        """
+        Load all cables terminating within the specified site and/or to the specified devices. If neither is given,
+        all cables are loaded.
+        """
+        cable_terminations = CableTermination.objects.all()
+        if site is not None:
+            cable_terminations = cable_terminations.filter(_site=site)
+        if devices is not None:
+            cable_terminations = cable_terminations.filter(_device__in=devices)
+
+        topology = cls()
+        topology.load_cables(cable_terminations.values('cable'))
+
+        return topology
+
+    #
+    # Loaders
+    #
+
+    def load_cables(self, cable_ids):
+        """
+        Load the specified cables along with all their terminations.
+        """
+        cable_terminations = CableTermination.objects.filter(cable__in=cable_ids).exclude(
+            cable__in=self._cable_ids
+        )
+
+        termination_ids = defaultdict(set)
+        for ct in cable_terminations:
+            key = (ct.termination_type_id, ct.termination_id)
+            self._cable_ids.add(ct.cable_id)
+            self.cable_terminations[key] = ct
+            self.cable_ends[(ct.cable_id, ct.cable_end)].append(ct)
+            if key not in self.terminations:
+                termination_ids[ct.termination_type_id].add(ct.termination_id)
+
+        self.load_terminations(termination_ids)
+
+    def load_terminations(self, termination_ids):
+        """
+        Load termination objects, along with the pass-through ports of their devices and the terminations of their
+        circuits.
+
+        :param termination_ids: Mapping of termination type IDs to sets of object IDs
+        """
+        device_ids = set()
+        circuit_ids = set()
+        for termination_type_id, object_ids in termination_ids.items():
+            model = ContentType.objects.get_for_id(termination_type_id).model_class()
+            for termination in self._get_queryset(model).filter(pk__in=object_ids):
+                self.terminations.setdefault((termination_type_id, termination.pk), termination)
+                if model in (FrontPort, RearPort):
+                    device_ids.add(termination.device_id)
+                elif model is CircuitTermination:
+                    circuit_ids.add(termination.circuit_id)
+
+        self.load_ports(device_ids)
+        self.load_circuits(circuit_ids)
+
+    def load_ports(self, device_ids):
+        """
+        Load all front and rear ports belonging to the specified devices.
+        """
+        device_ids = set(device_ids) - self._device_ids
+        if not device_ids:
+            return
+        self._device_ids.update(device_ids)
+
+        for model in (RearPort, FrontPort):
+            termination_type_id = ContentType.objects.get_for_model(model).pk
+            for port in self._get_queryset(model).filter(device__in=device_ids):
+                key = (termination_type_id, port.pk)
+                port = self.terminations.setdefault(key, port)
+                self.port_order[key] = len(self.port_order)
+                if model is RearPort:
+                    self.rear_ports[port.pk] = port
+                else:
+                    self.front_ports[port.rear_port_id][port.rear_port_position] = port
+
+    def load_circuits(self, circuit_ids):
+        """
+        Load the terminations of the specified circuits.
+        """
+        circuit_ids = set(circuit_ids) - self._circuit_ids
+        if not circuit_ids:
+            return
+        self._circuit_ids.update(circuit_ids)
+
+        termination_type_id = ContentType.objects.get_for_model(CircuitTermination).pk
+        for termination in self._get_queryset(CircuitTermination).filter(circuit__in=circuit_ids):
+            termination = self.terminations.setdefault((termination_type_id, termination.pk), termination)
+            self.circuit_terminations[(termination.circuit_id, termination.term_side)] = termination
+
+    @staticmethod
+    def _get_queryset(model):
+        field_names = {field.name for field in model._meta.get_fields()}
+        queryset = model.objects.select_related(
+            *[name for name in TERMINATION_RELATED_FIELDS if name in field_names]
+        )
+        if model is CircuitTermination:
+            queryset = queryset.prefetch_related('termination')
+        return queryset
+
+    #
+    # Lookups
+    #
+
+    def get_terminations(self, objects):
+        """
+        Return the snapshot's instances of the given termination objects, loading their cables if necessary. Objects
+        which are not attached to a cable are returned as-is.
+        """
+        keys = [(ContentType.objects.get_for_model(obj).pk, obj.pk) for obj in objects]
+        cable_ids = {obj.cable_id for obj, key in zip(objects, keys) if key not in self.terminations and obj.cable_id}
+        if cable_ids:
+            self.load_cables(cable_ids)
+
+        return [self.terminations.get(key, obj) for obj, key in zip(objects, keys)]
+
+    def get_far_end(self, terminations):
+        """
+        Return the termination objects on the opposite end(s) of the cable(s) attached to the given terminations,
+        ordered as CableTerminations are. Returns None if none of the terminations are attached to a cable.
+        """
+        keys = [(ContentType.objects.get_for_model(t).pk, t.pk) for t in terminations]
+        cable_ids = {t.cable_id for t, key in zip(terminations, keys) if key not in self.cable_terminations}
+        cable_ids.discard(None)
+        if cable_ids - self._cable_ids:
+            self.load_cables(cable_ids - self._cable_ids)
+
+        cable_ends = {
+            (ct.cable_id, 'A' if ct.cable_end == 'B' else 'B')
+            for ct in (self.cable_terminations.get(key) for key in keys) if ct is not None
+        }
+        if not cable_ends:
+            return None
+
+        remote_cable_terminations = sorted(
+            (ct for cable_end in cable_ends for ct in self.cable_ends[cable_end]),
+            key=lambda ct: (ct.cable_id, ct.cable_end, ct.pk)
+        )
+        return [self.terminations.get((ct.termination_type_id, ct.termination_id)) for ct in remote_cable_terminations]
+
+    def get_rear_ports(self, front_ports):
+        """
+        Return the RearPorts to which the given FrontPorts map.
+        """
+        self.load_ports({fp.device_id for fp in front_ports if fp.rear_port_id not in self.rear_ports})
+
+        return self._sort_ports({
+            self.rear_ports[fp.rear_port_id] for fp in front_ports if fp.rear_port_id in self.rear_ports
+        })
+
+    def get_front_ports(self, rear_port_positions):
+        """
+        Return the FrontPorts which map to the given rear port positions.
+
+        :param rear_port_positions: Iterable of (RearPort ID, positions) tuples, where positions is an iterable of
+            position numbers or None to indicate all positions
+        """
+        rear_port_positions = list(rear_port_positions)
+        self.load_ports({
+            self.rear_ports[rear_port_id].device_id for rear_port_id, _ in rear_port_positions
+            if rear_port_id in self.rear_ports
+        })
+
+        front_ports = set()
+        for rear_port_id, positions in rear_port_positions:
+            rear_port_front_ports = self.front_ports.get(rear_port_id, {})
+            if positions is None:
+                front_ports.update(rear_port_front_ports.values())
+            else:
+                front_ports.update(rear_port_front_ports[p] for p in positions if p in rear_port_front_ports)
+
+        return self._sort_ports(front_ports)
+
+    def get_peer_termination(self, circuit_termination):
+        """
+        Return the CircuitTermination on the opposite side of the given CircuitTermination's circuit, if any.
+        """
+        self.load_circuits([circuit_termination.circuit_id])
+        term_side = 'Z' if circuit_termination.term_side == 'A' else 'A'
+
+        return self.circuit_terminations.get((circuit_termination.circuit_id, term_side))
+
+    def _sort_ports(self, ports):
+        """
+        Order pass-through ports as the database would by default.
+        """
+        return sorted(ports, key=lambda port: self.port_order[(ContentType.objects.get_for_model(port).pk, port.pk)])
@@ -1,3 +1,5 @@
+import itertools
+
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
 
@@ -30,29 +32,209 @@ def path_node_to_object(repr):
     return ct.model_class().objects.filter(pk=object_id).first()
 
 
-def create_cablepath(terminations):
+def create_cablepath(terminations, topology=None):
     """
     Create CablePaths for all paths originating from the specified set of nodes.
 
     :param terminations: Iterable of CableTermination objects
+    :param topology: A CableTopology against which to trace the path (optional)
     """
     from dcim.models import CablePath
 
-    cp = CablePath.from_origin(terminations)
+    cp = CablePath.from_origin(terminations, topology=topology)
     if cp:
         cp.save()
 
 
+def bulk_create_cablepaths(cable_paths):
+    """
+    Save new CablePaths in bulk and record a reference to each on its originating object(s).
+
+    :param cable_paths: Iterable of unsaved CablePath instances
+    """
+    from dcim.models import CablePath
+
+    cable_paths = list(cable_paths)
+    for cable_path in cable_paths:
+        cable_path._nodes = list(itertools.chain(*cable_path.path))
+    CablePath.objects.bulk_create(cable_paths, batch_size=1000)
+
+    origins = {}
+    for cable_path in cable_paths:
+        for ct_id, object_id in map(decompile_path_node, cable_path.path[0]):
+            origins.setdefault(ct_id, {})[object_id] = cable_path.pk
+    for ct_id, path_ids in origins.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        model.objects.bulk_update(
+            [model(pk=pk, _path_id=path_id) for pk, path_id in path_ids.items()], ('_path',), batch_size=1000
+        )
+
+
 def rebuild_paths(terminations):
     """
     Rebuild all CablePaths which traverse the specified nodes.
     """
     from dcim.models import CablePath
 
-    for obj in terminations:
-        cable_paths = CablePath.objects.filter(_nodes__contains=obj)
+    nodes = [object_to_path_node(obj) for obj in terminations]
+    cable_paths = CablePath.objects.traversing(terminations)
+
+    with transaction.atomic():
+        splice_paths(cable_paths, nodes)
+
+
+def get_splice_step(path, nodes):
+    """
+    Return the index of the step within a CablePath's path at which tracing must resume to reflect a change to any of
+    the specified nodes. This is the near end of the first hop which includes an affected node. Returns zero if the path
+    must be traced from its origin.
+    """
+    for i, step in enumerate(path):
+        if not nodes.isdisjoint(step):
+            break
+    else:
+        return 0
+    step = i - i % 3
+
+    # A circuit terminating to a provider network or site appends its far-end CircuitTermination and the terminating
+    # object to the path as a final partial hop, which can be reached only by retracing the hop preceding it.
+    if len(path) % 3 == 2 and step >= len(path) - 2:
+        step -= 3
+
+    return max(step, 0)
+
+
+def get_position_stack(path, step, front_ports, rear_ports):
+    """
+    Replay the rear port positions pushed and popped by CablePath.from_origin() while tracing the given path up to the
+    specified step, and return the resulting position stack.
+
+    :param path: The CablePath's path
+    :param step: Index of the step at which tracing is to be resumed
+    :param front_ports: Mapping of FrontPort IDs to (rear port ID, rear port position) tuples
+    :param rear_ports: Mapping of RearPort IDs to position counts
+    """
+    from dcim.models import FrontPort, RearPort
+
+    frontport_ct = ContentType.objects.get_for_model(FrontPort).pk
+    rearport_ct = ContentType.objects.get_for_model(RearPort).pk
+
+    position_stack = []
+    for far_end in path[2:step:3]:
+        if not far_end:
+            continue
+        ct_id = decompile_path_node(far_end[0])[0]
+        object_ids = [decompile_path_node(node)[1] for node in far_end]
+        if ct_id == frontport_ct:
+            rear_port_ids = {front_ports[pk][0] for pk in object_ids}
+            if len(rear_port_ids) > 1 or rear_ports[rear_port_ids.pop()] > 1:
+                position_stack.append([front_ports[pk][1] for pk in object_ids])
+        elif ct_id == rearport_ct:
+            if position_stack and not (len(object_ids) == 1 and rear_ports[object_ids[0]] == 1):
+                position_stack.pop()
+
+    return position_stack
+
 
-        with transaction.atomic():
-            for cp in cable_paths:
-                cp.delete()
-                create_cablepath(cp.origins)
+def splice_paths(cable_paths, nodes):
+    """
+    Update the given CablePaths to reflect a change to any of the specified nodes. Rather than retracing each path from
+    its origin, the portion of the path preceding the first affected hop is retained and only the remainder is traced
+    anew. Paths which arrive at that hop in the same state share a single trace, and all modified paths are saved in
+    bulk. Paths affected from their first hop, and those which have split, are retraced in full.
+
+    :param cable_paths: Iterable of CablePath instances
+    :param nodes: Iterable of path nodes, in the form <ContentType ID>:<Object ID>
+    """
+    from dcim.choices import LinkStatusChoices
+    from dcim.models import CablePath, FrontPort, RearPort
+
+    nodes = set(nodes)
+    frontport_ct = ContentType.objects.get_for_model(FrontPort).pk
+    rearport_ct = ContentType.objects.get_for_model(RearPort).pk
+
+    # Determine the step at which to resume tracing each path
+    retrace = []
+    splices = []
+    for cablepath in cable_paths:
+        step = get_splice_step(cablepath.path, nodes)
+        if step and not cablepath.is_split:
+            splices.append((cablepath, step))
+        else:
+            retrace.append(cablepath)
+
+    # Gather the ports and links traversed by the retained portion of each path
+    port_ids = {frontport_ct: set(), rearport_ct: set()}
+    link_ids = {}
+    for cablepath, step in splices:
+        for far_end in cablepath.path[2:step:3]:
+            for ct_id, object_id in map(decompile_path_node, far_end):
+                if ct_id in port_ids:
+                    port_ids[ct_id].add(object_id)
+        for links in cablepath.path[1:step:3]:
+            for ct_id, object_id in map(decompile_path_node, links):
+                link_ids.setdefault(ct_id, set()).add(object_id)
+
+    front_ports = {
+        pk: (rear_port_id, position) for pk, rear_port_id, position in FrontPort.objects.filter(
+            pk__in=port_ids[frontport_ct]
+        ).values_list('pk', 'rear_port_id', 'rear_port_position')
+    }
+    rear_port_ids = port_ids[rearport_ct].union(rear_port_id for rear_port_id, _ in front_ports.values())
+    rear_ports = dict(RearPort.objects.filter(pk__in=rear_port_ids).values_list('pk', 'positions'))
+    link_status = {}
+    for ct_id, object_ids in link_ids.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        for pk, status in model.objects.filter(pk__in=object_ids).values_list('pk', 'status'):
+            link_status[compile_path_node(ct_id, pk)] = status
+
+    # Group paths by the terminations & position stack at which tracing resumes
+    groups = {}
+    for cablepath, step in splices:
+        try:
+            position_stack = get_position_stack(cablepath.path, step, front_ports, rear_ports)
+            is_active = all(
+                link_status[node] == LinkStatusChoices.STATUS_CONNECTED
+                for links in cablepath.path[1:step:3] for node in links
+            )
+        except KeyError:
+            # An object within the retained portion of the path no longer exists
+            retrace.append(cablepath)
+            continue
+        key = (tuple(cablepath.path[step]), tuple(tuple(positions) for positions in position_stack))
+        groups.setdefault(key, []).append((cablepath, step, is_active))
+
+    # Trace the remainder of each group of paths once and splice it onto each
+    updated = []
+    for (near_end, position_stack), members in groups.items():
+        ct_ids, object_ids = zip(*map(decompile_path_node, near_end))
+        model = ContentType.objects.get_for_id(ct_ids[0]).model_class()
+        terminations = model.objects.in_bulk(object_ids)
+        if len(set(ct_ids)) > 1 or len(terminations) < len(set(object_ids)):
+            retrace.extend(cablepath for cablepath, _, _ in members)
+            continue
+        remainder = CablePath.from_origin(
+            [terminations[pk] for pk in object_ids],
+            position_stack=[list(positions) for positions in position_stack]
+        )
+
+        for cablepath, step, is_active in members:
+            path = cablepath.path[:step] + remainder.path
+            is_active = is_active and remainder.is_active
+            if (path, is_active, remainder.is_complete, remainder.is_split) == (
+                cablepath.path, cablepath.is_active, cablepath.is_complete, cablepath.is_split
+            ):
+                continue
+            cablepath.path = path
+            cablepath.is_active = is_active
+            cablepath.is_complete = remainder.is_complete
+            cablepath.is_split = remainder.is_split
+            cablepath._nodes = list(itertools.chain(*path))
+            updated.append(cablepath)
+
+    CablePath.objects.bulk_update(
+        updated, ('path', 'is_active', 'is_complete', 'is_split', '_nodes'), batch_size=100
+    )
+
+    for cablepath in retrace:
+        cablepath.retrace()
@@ -1,4 +1,3 @@
-import functools
 import re
 from django.utils.translation import gettext as _
 
@@ -21,7 +20,8 @@ def is_ruleset(data):
 
 class Condition:
     """
-    An individual conditional rule that evaluates a single attribute and its value.
+    An individual conditional rule that evaluates a single attribute and its value. The rule is compiled upon
+    initialization so that it can be evaluated repeatedly at minimal cost.
 
     :param attr: The name of the attribute being evaluated
     :param value: The value being compared
@@ -64,18 +64,25 @@ class Condition:
         self.eval_func = getattr(self, f'eval_{op}')
         self.negate = negate
 
+        # Pre-compile the attribute path & any regular expression
+        self.path = tuple(attr.split('.'))
+        if op == self.REGEX:
+            try:
+                self.pattern = re.compile(value)
+            except re.error as e:
+                raise ValueError(_("Invalid regular expression: {value} ({error})").format(value=value, error=e))
+
     def eval(self, data):
         """
         Evaluate the provided data to determine whether it matches the condition.
         """
-        def _get(obj, key):
-            if isinstance(obj, list):
-                return [dict.get(i, key) for i in obj]
-
-            return dict.get(obj, key)
-
+        value = data
         try:
-            value = functools.reduce(_get, self.attr.split('.'), data)
+            for key in self.path:
+                if isinstance(value, list):
+                    value = [dict.get(i, key) for i in value]
+                else:
+                    value = dict.get(value, key)
         except TypeError:
             # Invalid key path
             value = None
@@ -118,7 +125,7 @@ class Condition:
     # Regular expressions
 
     def eval_regex(self, value):
-        return re.match(self.value, value) is not None
+        return self.pattern.match(value) is not None
 
 
 class ConditionSet:
@@ -140,6 +147,7 @@ class ConditionSet:
             self.logic = (list(ruleset.keys())[0]).lower()
             if self.logic not in (AND, OR):
                 raise ValueError(_("Invalid logic type: must be 'AND' or 'OR'. Please check documentation."))
+            self.eval_func = any if self.logic == OR else all
 
             # Compile the set of Conditions
             self.conditions = [
@@ -149,6 +157,7 @@ class ConditionSet:
         else:
             try:
                 self.logic = None
+                self.eval_func = all
                 self.conditions = [Condition(**ruleset)]
             except TypeError:
                 raise ValueError(_("Incorrect key(s) informed. Please check documentation."))
@@ -157,5 +166,4 @@ class ConditionSet:
         """
         Evaluate the provided data to determine whether it matches this set of conditions.
         """
-        func = any if self.logic == 'or' else all
-        return func(d.eval(data) for d in self.conditions)
+        return self.eval_func(d.eval(data) for d in self.conditions)
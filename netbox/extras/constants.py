@@ -6,6 +6,10 @@ CUSTOMFIELD_EMPTY_VALUES = (None, '', [])
 
 # Webhooks
 HTTP_CONTENT_TYPE_JSON = 'application/json'
+WEBHOOK_BATCH_SIZE_MAX = 1000
+
+# Maximum number of webhook deliveries conveyed by a single background job (when delivering concurrently or in batches)
+WEBHOOK_JOB_SIZE = 500
 
 WEBHOOK_EVENT_TYPES = {
     # Map registered event types to public webhook "event" equivalents
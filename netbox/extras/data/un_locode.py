@@ -0,0 +1 @@
+UN_LOCODE = ()
@@ -1,8 +1,12 @@
+import copy
 import logging
+import threading
 from collections import defaultdict
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext as _
@@ -17,10 +21,114 @@ from utilities.api import get_serializer_for_model
 from utilities.rqworker import get_rq_retry
 from utilities.serialization import serialize_object
 from .choices import EventRuleActionChoices
-from .models import EventRule
+from .constants import WEBHOOK_JOB_SIZE
+from .models import EventRule, Webhook
 
 logger = logging.getLogger('netbox.events_processor')
 
+# The events pipeline handler which processes EventRules
+EVENT_RULES_PIPELINE = 'extras.events.process_event_queue'
+
+# Cache key under which the version of the EventRule index is shared among processes
+EVENT_RULES_VERSION_KEY = 'event_rules_version'
+
+
+class EventRuleIndex:
+    """
+    A process-wide index of enabled EventRules, keyed by object type and event type. The index is rebuilt whenever
+    its version (shared among all NetBox processes) changes, which happens each time a change to an EventRule is
+    committed.
+    """
+    def __init__(self):
+        self.version = None
+        self._index = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _build(self):
+        index = defaultdict(list)
+        for event_rule in EventRule.objects.filter(enabled=True).prefetch_related('object_types'):
+            # Compile the rule's conditions once, omitting any rule whose stored conditions are invalid
+            try:
+                event_rule.compile_conditions()
+            except ValueError as e:
+                logger.error(_("Ignoring event rule {name}: invalid conditions ({error})").format(
+                    name=event_rule.name, error=e
+                ))
+                continue
+            for object_type in event_rule.object_types.all():
+                for event_type in event_rule.event_types:
+                    index[(object_type.pk, event_type)].append(event_rule)
+        return dict(index)
+
+    def _commit(self):
+        self._local.pending = False
+        cache.add(EVENT_RULES_VERSION_KEY, 0, None)
+        cache.incr(EVENT_RULES_VERSION_KEY)
+        self.invalidate()
+
+    def _has_uncommitted_changes(self):
+        """
+        Return True if EventRules have been modified within the current, uncommitted transaction.
+        """
+        if not getattr(self._local, 'pending', False):
+            return False
+        # A transaction which is no longer open has been rolled back (or its changes would have been committed)
+        if not transaction.get_connection().in_atomic_block:
+            self._local.pending = False
+            return False
+        return True
+
+    def invalidate(self):
+        """
+        Discard the local copy of the index.
+        """
+        with self._lock:
+            self._index = None
+
+    def refresh(self):
+        """
+        Discard the local copy of the index if its version no longer matches the shared version.
+        """
+        version = cache.get(EVENT_RULES_VERSION_KEY, 0)
+        with self._lock:
+            if self.version != version:
+                self._index = None
+                self.version = version
+
+    def update(self):
+        """
+        Record a change to EventRules. The local copy of the index is discarded immediately, and the shared version is
+        incremented once the current transaction has been committed.
+        """
+        self.invalidate()
+        # EventRules are modified infrequently, so a callback is registered for each change. (Skipping it while a
+        # change is pending would lose the increment for a new transaction following one which was rolled back.)
+        self._local.pending = True
+        transaction.on_commit(self._commit)
+
+    def get_rules(self, object_type, event_type):
+        """
+        Return a list of enabled EventRules which apply to the given type of event for the given type of object, or
+        None if the index cannot be used because EventRules have been modified within the current transaction. A copy
+        of each rule is returned, so that callers may use it freely.
+
+        The index is checked against the shared version only by refresh(), which is called once for each batch of
+        events.
+        """
+        if self._has_uncommitted_changes():
+            return None
+
+        with self._lock:
+            if self._index is None:
+                self._index = self._build()
+            event_rules = self._index.get((object_type.pk, event_type), [])
+
+        return [copy.copy(event_rule) for event_rule in event_rules]
+
+
+event_rule_index = EventRuleIndex()
+
 
 def serialize_for_event(instance):
     """
@@ -50,10 +158,43 @@ def get_snapshots(instance, event_type):
     return snapshots
 
 
+def get_event_rules(object_type, event_type):
+    """
+    Return all enabled EventRules which apply to the given type of event for the given type of object.
+    """
+    event_rules = event_rule_index.get_rules(object_type, event_type)
+    if event_rules is None:
+        event_rules = list(EventRule.objects.filter(
+            event_types__contains=[event_type],
+            object_types=object_type,
+            enabled=True
+        ))
+
+    return event_rules
+
+
+def is_event_relevant(object_type, event_type):
+    """
+    Return True if an event must be serialized for processing by the events pipeline. Unless additional pipeline
+    handlers have been configured, only events to which at least one enabled EventRule applies are relevant.
+    """
+    if set(settings.EVENTS_PIPELINE) != {EVENT_RULES_PIPELINE}:
+        return True
+    return bool(get_event_rules(object_type, event_type))
+
+
+def serialize_event(event, instance):
+    """
+    Populate the serialized data and post-change snapshot of a queued event from the current state of the object.
+    """
+    event['data'] = serialize_for_event(instance)
+    event['snapshots']['postchange'] = get_snapshots(instance, event['event_type'])['postchange']
+
+
 def enqueue_event(queue, instance, user, request_id, event_type):
     """
-    Enqueue a serialized representation of a created/updated/deleted object for the processing of
-    events once the request has completed.
+    Enqueue a serialized representation of a created/updated/deleted object for the processing of events once the
+    request has completed. The object is serialized only if the event is relevant to the events pipeline.
     """
     # Determine whether this type of object supports event rules
     app_label = instance._meta.app_label
@@ -64,8 +205,6 @@ def enqueue_event(queue, instance, user, request_id, event_type):
     assert instance.pk is not None
     key = f'{app_label}.{model_name}:{instance.pk}'
     if key in queue:
-        queue[key]['data'] = serialize_for_event(instance)
-        queue[key]['snapshots']['postchange'] = get_snapshots(instance, event_type)['postchange']
         # If the object is being deleted, update any prior "update" event to "delete"
         if event_type == OBJECT_DELETED:
             queue[key]['event_type'] = event_type
@@ -74,15 +213,47 @@ def enqueue_event(queue, instance, user, request_id, event_type):
             'object_type': ContentType.objects.get_for_model(instance),
             'object_id': instance.pk,
             'event_type': event_type,
-            'data': serialize_for_event(instance),
-            'snapshots': get_snapshots(instance, event_type),
+            'data': None,
+            'snapshots': {
+                'prechange': getattr(instance, '_prechange_snapshot', None),
+                'postchange': None,
+            },
             'username': user.username,
             'request_id': request_id
         }
 
+    # Capture the object's current state, so that it is unaffected by any later changes within the request
+    if is_event_relevant(queue[key]['object_type'], queue[key]['event_type']):
+        serialize_event(queue[key], instance)
 
-def process_event_rules(event_rules, object_type, event_type, data, username=None, snapshots=None, request_id=None):
-    user = User.objects.get(username=username) if username else None
+
+def enqueue_webhooks(deliveries):
+    """
+    Enqueue background jobs for the delivery of webhooks. Unless concurrent delivery has been enabled or a webhook
+    conveys events in batches, a separate job is enqueued for each delivery.
+
+    :param deliveries: A list of dictionaries, each holding the arguments for send_webhook()
+    """
+    rq_queue = get_queue(get_config().QUEUE_MAPPINGS.get('webhook', RQ_QUEUE_DEFAULT))
+    webhook_ids = {delivery['event_rule'].action_object_id for delivery in deliveries}
+
+    if settings.WEBHOOK_CONCURRENCY == 1 and not Webhook.objects.filter(pk__in=webhook_ids, batch_size__gt=1).exists():
+        for delivery in deliveries:
+            rq_queue.enqueue("extras.webhooks.send_webhook", retry=get_rq_retry(), **delivery)
+    else:
+        for i in range(0, len(deliveries), WEBHOOK_JOB_SIZE):
+            rq_queue.enqueue(
+                "extras.webhooks.send_webhooks", retry=get_rq_retry(), deliveries=deliveries[i:i + WEBHOOK_JOB_SIZE]
+            )
+
+
+def process_event_rules(event_rules, object_type, event_type, data, username=None, snapshots=None, request_id=None,
+                        webhooks=None):
+    """
+    Execute the actions of all event rules whose conditions are met by the given event data. If a list is passed as
+    `webhooks`, webhook deliveries are appended to it rather than being enqueued immediately.
+    """
+    user = None
 
     for event_rule in event_rules:
 
@@ -91,16 +262,11 @@ def process_event_rules(event_rules, object_type, event_type, data, username=Non
             continue
 
         # Compile event data
-        event_data = event_rule.action_data or {}
-        event_data.update(data)
+        event_data = {**(event_rule.action_data or {}), **data}
 
         # Webhooks
         if event_rule.action_type == EventRuleActionChoices.WEBHOOK:
 
-            # Select the appropriate RQ queue
-            queue_name = get_config().QUEUE_MAPPINGS.get('webhook', RQ_QUEUE_DEFAULT)
-            rq_queue = get_queue(queue_name)
-
             # Compile the task parameters
             params = {
                 "event_rule": event_rule,
@@ -110,7 +276,6 @@ def process_event_rules(event_rules, object_type, event_type, data, username=Non
                 "snapshots": snapshots,
                 "timestamp": timezone.now().isoformat(),
                 "username": username,
-                "retry": get_rq_retry()
             }
             if snapshots:
                 params["snapshots"] = snapshots
@@ -118,10 +283,10 @@ def process_event_rules(event_rules, object_type, event_type, data, username=Non
                 params["request_id"] = request_id
 
             # Enqueue the task
-            rq_queue.enqueue(
-                "extras.webhooks.send_webhook",
-                **params
-            )
+            if webhooks is not None:
+                webhooks.append(params)
+            else:
+                enqueue_webhooks([params])
 
         # Scripts
         elif event_rule.action_type == EventRuleActionChoices.SCRIPT:
@@ -130,6 +295,8 @@ def process_event_rules(event_rules, object_type, event_type, data, username=Non
 
             # Enqueue a Job to record the script's execution
             from extras.jobs import ScriptJob
+            if user is None and username:
+                user = User.objects.get(username=username)
             ScriptJob.enqueue(
                 instance=event_rule.action_object,
                 name=script.name,
@@ -158,6 +325,7 @@ def process_event_queue(events):
     Flush a list of object representation to RQ for EventRule processing.
     """
     events_cache = defaultdict(dict)
+    webhooks = []
 
     for event in events:
         event_type = event['event_type']
@@ -165,12 +333,10 @@ def process_event_queue(events):
 
         # Cache applicable Event Rules
         if object_type not in events_cache[event_type]:
-            events_cache[event_type][object_type] = EventRule.objects.filter(
-                event_types__contains=[event['event_type']],
-                object_types=object_type,
-                enabled=True
-            )
+            events_cache[event_type][object_type] = get_event_rules(object_type, event_type)
         event_rules = events_cache[event_type][object_type]
+        if not event_rules:
+            continue
 
         process_event_rules(
             event_rules=event_rules,
@@ -179,14 +345,22 @@ def process_event_queue(events):
             data=event['data'],
             username=event['username'],
             snapshots=event['snapshots'],
-            request_id=event['request_id']
+            request_id=event['request_id'],
+            webhooks=webhooks
         )
 
+    # Enqueue all webhook deliveries together, so that they may be delivered concurrently and/or in batches
+    if webhooks:
+        enqueue_webhooks(webhooks)
+
 
 def flush_events(events):
     """
-    Flush a list of object representations to RQ for event processing.
+    Flush a list of object representations to RQ for event processing. Events which are not relevant to the events
+    pipeline (and so were not serialized) are discarded.
     """
+    events = [event for event in events if event['data'] is not None]
+
     if events:
         for name in settings.EVENTS_PIPELINE:
             try:
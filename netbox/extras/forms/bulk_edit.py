@@ -2,6 +2,7 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 
 from extras.choices import *
+from extras.constants import WEBHOOK_BATCH_SIZE_MAX
 from extras.models import *
 from netbox.events import get_event_type_choices
 from netbox.forms import NetBoxModelBulkEditForm
@@ -231,6 +232,12 @@ class WebhookBulkEditForm(NetBoxModelBulkEditForm):
         required=False,
         label=_('CA file path')
     )
+    batch_size = forms.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=WEBHOOK_BATCH_SIZE_MAX,
+        label=_('Batch size')
+    )
 
     nullable_fields = ('secret', 'ca_file_path')
 
@@ -1,10 +1,36 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max, Min
 from django.utils.translation import gettext as _
 
 from netbox.registry import registry
 from netbox.search.backends import search_backend
 
+# Number of primary keys spanned by each unit of work
+CHUNK_SIZE = 10000
+
+# Cache key under which the progress of an interrupted reindex is recorded
+CHECKPOINT_KEY = 'reindex_checkpoints'
+
+
+def index_chunk(label, start, end):
+    """
+    Cache all objects of the given model whose primary keys fall within the specified range. Returns the model label,
+    the start of the range, and the numbers of objects and entries cached.
+    """
+    indexer = registry['search'][label]
+    instances = list(indexer.model.objects.filter(pk__gte=start, pk__lt=end))
+    with transaction.atomic():
+        entries = search_backend.load(instances, indexer=indexer)
+
+    return label, start, len(instances), entries
+
 
 class Command(BaseCommand):
     help = 'Reindex objects for search'
@@ -21,6 +47,17 @@ class Command(BaseCommand):
             action='store_true',
             help="For each model, reindex objects only if no cache entries already exist"
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Number of worker processes to use (default: 1)"
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help="Resume an interrupted reindex, skipping any work which has already been completed"
+        )
 
     def _get_indexers(self, *model_names):
         indexers = {}
@@ -59,7 +96,24 @@ class Command(BaseCommand):
 
         return indexers
 
+    def _get_chunks(self, model, completed):
+        """
+        Return the starting primary key of each chunk of the model's objects which has yet to be indexed.
+        """
+        pk_range = model.objects.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+        if pk_range['min_pk'] is None:
+            return []
+        first = pk_range['min_pk'] - pk_range['min_pk'] % CHUNK_SIZE
+
+        return [
+            start for start in range(first, pk_range['max_pk'] + 1, CHUNK_SIZE) if start not in completed
+        ]
+
     def handle(self, *model_labels, **kwargs):
+        if kwargs['workers'] < 1:
+            raise CommandError(_("The number of workers must be at least 1."))
+        if kwargs['lazy'] and kwargs['resume']:
+            raise CommandError(_("The --lazy and --resume options are mutually exclusive."))
 
         # Determine which models to reindex
         indexers = self._get_indexers(*model_labels)
@@ -67,8 +121,16 @@ class Command(BaseCommand):
             raise CommandError(_("No indexers found!"))
         self.stdout.write(f'Reindexing {len(indexers)} models.')
 
-        # Clear cached values for the specified models (if not being lazy)
-        if not kwargs['lazy']:
+        # Retrieve the progress recorded by a previous run, or start afresh
+        if kwargs['resume']:
+            checkpoints = cache.get(CHECKPOINT_KEY) or {}
+            self.stdout.write(f'Resuming from {sum(len(v) for v in checkpoints.values())} completed chunks.')
+        else:
+            checkpoints = {}
+            cache.delete(CHECKPOINT_KEY)
+
+        # Clear cached values for the specified models (if not being lazy or resuming)
+        if not kwargs['lazy'] and not kwargs['resume']:
             if model_labels:
                 content_types = [ContentType.objects.get_for_model(model) for model in indexers.keys()]
             else:
@@ -79,25 +141,75 @@ class Command(BaseCommand):
             deleted_count = search_backend.clear(object_types=content_types)
             self.stdout.write(f'{deleted_count} entries deleted.')
 
-        # Index models
-        self.stdout.write('Indexing models')
+        # Divide each model's objects into chunks by primary key
+        pending = {}
         for model, idx in indexers.items():
-            app_label = model._meta.app_label
-            model_name = model._meta.model_name
-            self.stdout.write(f'  {app_label}.{model_name}... ', ending='')
-            self.stdout.flush()
+            label = f'{model._meta.app_label}.{model._meta.model_name}'
 
             if kwargs['lazy']:
                 content_type = ContentType.objects.get_for_model(model)
                 if cached_count := search_backend.count(object_types=[content_type]):
-                    self.stdout.write(f'Skipping (found {cached_count} existing).')
+                    self.stdout.write(f'  {label}: Skipping (found {cached_count} existing).')
                     continue
 
-            i = search_backend.cache(model.objects.iterator(), remove_existing=False)
-            if i:
-                self.stdout.write(f'{i} entries cached.')
+            if chunks := self._get_chunks(model, set(checkpoints.get(label, []))):
+                pending[label] = chunks
+            elif label in checkpoints:
+                self.stdout.write(f'  {label}: Skipping (already completed).')
             else:
-                self.stdout.write('No objects found.')
+                self.stdout.write(f'  {label}: No objects found.')
+
+        # Index models
+        tasks = [
+            (label, start, start + CHUNK_SIZE) for label, chunks in pending.items() for start in chunks
+        ]
+        self.stdout.write(f'Indexing {len(pending)} models ({len(tasks)} chunks) using {kwargs["workers"]} workers')
+        stats = {label: {'objects': 0, 'entries': 0, 'remaining': len(chunks)} for label, chunks in pending.items()}
+        start_time = time.monotonic()
+
+        def record(result):
+            label, start, object_count, entry_count = result
+            checkpoints.setdefault(label, []).append(start)
+            cache.set(CHECKPOINT_KEY, checkpoints, None)
+
+            model_stats = stats[label]
+            model_stats['objects'] += object_count
+            model_stats['entries'] += entry_count
+            model_stats['remaining'] -= 1
+            if self.verbosity >= 2:
+                self.stdout.write(f'    {label}: Indexed {object_count} objects with primary keys from {start}')
+            if not model_stats['remaining']:
+                elapsed = time.monotonic() - start_time
+                self.stdout.write(
+                    f'  {label}: {model_stats["entries"]} entries cached for {model_stats["objects"]} objects '
+                    f'({elapsed:.1f}s elapsed)'
+                )
+
+        if kwargs['workers'] == 1:
+            for task in tasks:
+                record(index_chunk(*task))
+        else:
+            # Close any open database connections prior to forking worker processes
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=kwargs['workers'],
+                mp_context=multiprocessing.get_context('fork')
+            ) as executor:
+                futures = [executor.submit(index_chunk, *task) for task in tasks]
+                for future in as_completed(futures):
+                    record(future.result())
+
+        # All work is complete; discard the recorded checkpoints
+        cache.delete(CHECKPOINT_KEY)
+
+        elapsed = time.monotonic() - start_time
+        object_count = sum(s['objects'] for s in stats.values())
+        entry_count = sum(s['entries'] for s in stats.values())
+        self.stdout.write(
+            f'Indexed {object_count} objects ({entry_count} entries) in {elapsed:.1f}s '
+            f'({object_count / elapsed if elapsed else 0:.0f} objects/s, '
+            f'{entry_count / elapsed if elapsed else 0:.0f} entries/s)'
+        )
 
         msg = 'Completed.'
         if total_count := search_backend.size:
@@ -0,0 +1,47 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+import ipam.fields
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('extras', '0123_journalentry_kind_default'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='cachedvalue',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector('value', config='simple'),
+                name='extras_cachedvalue_vector',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='cachedvalue',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper('value'), name='gin_trgm_ops'
+                ),
+                name='extras_cachedvalue_trgm',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='cachedvalue',
+            index=django.contrib.postgres.indexes.GistIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.comparison.Cast('value', output_field=ipam.fields.IPAddressField()),
+                    name='inet_ops',
+                ),
+                condition=models.Q(('type', 'cidr')),
+                name='extras_cachedvalue_cidr',
+            ),
+        ),
+    ]
@@ -4,16 +4,13 @@ from django.core.validators import ValidationError
 from django.db import models
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
-from jinja2.loaders import BaseLoader
-from jinja2.sandbox import SandboxedEnvironment
 
 from extras.querysets import ConfigContextQuerySet
-from netbox.config import get_config
 from netbox.models import ChangeLoggedModel
 from netbox.models.features import CloningMixin, CustomLinksMixin, ExportTemplatesMixin, SyncedDataMixin, TagsMixin
 from netbox.registry import registry
 from utilities.data import deepmerge
-from utilities.jinja2 import DataFileLoader
+from utilities.jinja2 import DataFileLoader, compile_template, get_environment
 
 __all__ = (
     'ConfigContext',
@@ -278,7 +275,7 @@ class ConfigTemplate(SyncedDataMixin, CustomLinksMixin, ExportTemplatesMixin, Ta
         if self.data_file:
             template = environment.get_template(self.data_file.path)
         else:
-            template = environment.from_string(self.template_code)
+            template = compile_template(environment, self.template_code)
         output = template.render(**_context)
 
         # Replace CRLF-style line terminators
@@ -286,20 +283,16 @@ class ConfigTemplate(SyncedDataMixin, CustomLinksMixin, ExportTemplatesMixin, Ta
 
     def _get_environment(self):
         """
-        Instantiate and return a Jinja2 environment suitable for rendering the ConfigTemplate.
+        Return a Jinja2 environment suitable for rendering the ConfigTemplate.
         """
+        env_params = self.environment_params or {}
+
         # Initialize the template loader & cache the base template code (if applicable)
         if self.data_file:
             loader = DataFileLoader(data_source=self.data_source)
             loader.cache_templates({
                 self.data_file.path: self.template_code
             })
-        else:
-            loader = BaseLoader()
-
-        # Initialize the environment
-        env_params = self.environment_params or {}
-        environment = SandboxedEnvironment(loader=loader, **env_params)
-        environment.filters.update(get_config().JINJA2_FILTERS)
+            return get_environment(loader=loader, **env_params)
 
-        return environment
+        return get_environment(**env_params)
@@ -4,7 +4,7 @@ import urllib.parse
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.postgres.fields import ArrayField
-from django.core.validators import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator, ValidationError
 from django.db import models
 from django.http import HttpResponse
 from django.urls import reverse
@@ -140,7 +140,24 @@ class EventRule(CustomFieldsMixin, ExportTemplatesMixin, TagsMixin, ChangeLogged
         if not self.conditions:
             return True
 
-        return ConditionSet(self.conditions).eval(data)
+        return self.condition_set.eval(data)
+
+    def compile_conditions(self):
+        """
+        Compile the rule's conditions (if any) and retain the resulting ConditionSet for subsequent evaluations. Raises
+        ValueError if the conditions are invalid.
+        """
+        self._condition_set = ConditionSet(self.conditions) if self.conditions else None
+        return self._condition_set
+
+    @property
+    def condition_set(self):
+        """
+        The compiled ConditionSet for this rule's conditions (if any).
+        """
+        if not hasattr(self, '_condition_set'):
+            return self.compile_conditions()
+        return self._condition_set
 
 
 class Webhook(CustomFieldsMixin, ExportTemplatesMixin, TagsMixin, ChangeLoggedModel):
@@ -223,6 +240,18 @@ class Webhook(CustomFieldsMixin, ExportTemplatesMixin, TagsMixin, ChangeLoggedMo
             "The specific CA certificate file to use for SSL verification. Leave blank to use the system defaults."
         )
     )
+    batch_size = models.PositiveSmallIntegerField(
+        verbose_name=_('batch size'),
+        default=1,
+        validators=[
+            MinValueValidator(1),
+            MaxValueValidator(WEBHOOK_BATCH_SIZE_MAX)
+        ],
+        help_text=_(
+            "The maximum number of events to convey in a single request. When greater than one, events sent to the "
+            "same URL are combined, and the request body is a JSON array of the individual event bodies."
+        )
+    )
     events = GenericRelation(
         EventRule,
         content_type_field='action_object_type',
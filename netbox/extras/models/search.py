@@ -1,8 +1,12 @@
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models.functions import Cast, Upper
 from django.utils.translation import gettext_lazy as _
 
+from ipam.fields import IPAddressField
 from netbox.search.utils import get_indexer
 from utilities.fields import RestrictedGenericForeignKey
 from ..fields import CachedValueField
@@ -57,6 +61,13 @@ class CachedValue(models.Model):
         verbose_name_plural = _('cached values')
         indexes = (
             models.Index(fields=('object_type', 'object_id'), name='extras_cachedvalue_object'),
+            GinIndex(SearchVector('value', config='simple'), name='extras_cachedvalue_vector'),
+            GinIndex(OpClass(Upper('value'), name='gin_trgm_ops'), name='extras_cachedvalue_trgm'),
+            GistIndex(
+                OpClass(Cast('value', output_field=IPAddressField()), name='inet_ops'),
+                condition=models.Q(type='cidr'),
+                name='extras_cachedvalue_cidr'
+            ),
         )
 
     def __str__(self):
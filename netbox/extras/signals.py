@@ -1,11 +1,11 @@
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
 from core.events import *
 from core.models import ObjectType
 from core.signals import job_end, job_start
-from extras.events import process_event_rules
+from extras.events import event_rule_index, get_event_rules, process_event_rules
 from extras.models import EventRule, Notification, Subscription
 from netbox.config import get_config
 from netbox.registry import registry
@@ -93,16 +93,22 @@ def validate_assigned_tags(sender, instance, action, model, pk_set, **kwargs):
 # Event rules
 #
 
+@receiver((post_save, post_delete), sender=EventRule)
+@receiver(m2m_changed, sender=EventRule.object_types.through)
+def update_event_rule_index(sender, **kwargs):
+    """
+    Invalidate the index of enabled EventRules whenever an EventRule is modified.
+    """
+    event_rule_index.update()
+
+
 @receiver(job_start)
 def process_job_start_event_rules(sender, **kwargs):
     """
     Process event rules for jobs starting.
     """
-    event_rules = EventRule.objects.filter(
-        event_types__contains=[JOB_STARTED],
-        enabled=True,
-        object_types=sender.object_type
-    )
+    event_rule_index.refresh()
+    event_rules = get_event_rules(sender.object_type, JOB_STARTED)
     username = sender.user.username if sender.user else None
     process_event_rules(
         event_rules=event_rules,
@@ -118,11 +124,8 @@ def process_job_end_event_rules(sender, **kwargs):
     """
     Process event rules for jobs terminating.
     """
-    event_rules = EventRule.objects.filter(
-        event_types__contains=[JOB_COMPLETED],
-        enabled=True,
-        object_types=sender.object_type
-    )
+    event_rule_index.refresh()
+    event_rules = get_event_rules(sender.object_type, JOB_COMPLETED)
     username = sender.user.username if sender.user else None
     process_event_rules(
         event_rules=event_rules,
@@ -42,6 +42,11 @@ class ConditionTestCase(TestCase):
             # 'gt' supports only numeric values
             Condition('x', 'foo', 'gt')
 
+    def test_invalid_regex(self):
+        with self.assertRaises(ValueError):
+            # Unterminated character set
+            Condition('x', '[a-z', 'regex')
+
     #
     # Nested attrs tests
     #
@@ -3,8 +3,9 @@ import uuid
 from unittest.mock import patch
 
 import django_rq
+from django.core.cache import cache
 from django.http import HttpResponse
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
 from requests import Session
 from rest_framework import status
@@ -12,11 +13,11 @@ from rest_framework import status
 from core.events import *
 from core.models import ObjectType
 from dcim.choices import SiteStatusChoices
-from dcim.models import Site
+from dcim.models import Region, Site
 from extras.choices import EventRuleActionChoices
-from extras.events import enqueue_event, flush_events, serialize_for_event
+from extras.events import EVENT_RULES_VERSION_KEY, EventRuleIndex, enqueue_event, flush_events, serialize_for_event
 from extras.models import EventRule, Tag, Webhook
-from extras.webhooks import generate_signature, send_webhook
+from extras.webhooks import generate_signature, send_webhook, send_webhooks
 from netbox.context_managers import event_tracking
 from utilities.testing import APITestCase
 
@@ -390,6 +391,86 @@ class EventRuleTest(APITestCase):
         with patch.object(Session, 'send', dummy_send):
             send_webhook(**job.kwargs)
 
+    @override_settings(WEBHOOK_CONCURRENCY=4)
+    def test_send_webhooks_batched(self):
+        request_bodies = []
+
+        def dummy_send(_, request, **kwargs):
+            request_bodies.append(json.loads(request.body))
+            return HttpResponse()
+
+        webhook = Webhook.objects.get(name='Webhook 1')
+        webhook.batch_size = 2
+        webhook.save()
+
+        # Enqueue webhooks for three new sites
+        webhooks_queue = {}
+        for i in range(1, 4):
+            enqueue_event(
+                webhooks_queue,
+                instance=Site.objects.create(name=f'Site {i}', slug=f'site-{i}'),
+                user=self.user,
+                request_id=uuid.uuid4(),
+                event_type=OBJECT_CREATED
+            )
+        flush_events(list(webhooks_queue.values()))
+
+        # All deliveries should be conveyed by a single job
+        self.assertEqual(self.queue.count, 1)
+        job = self.queue.jobs[0]
+        self.assertEqual(job.func_name, 'extras.webhooks.send_webhooks')
+        self.assertEqual(len(job.kwargs['deliveries']), 3)
+
+        # Events should be combined into batches of up to two
+        with patch.object(Session, 'send', dummy_send):
+            send_webhooks(**job.kwargs)
+        self.assertEqual(sorted(len(body) if type(body) is list else 1 for body in request_bodies), [1, 2])
+
+    @override_settings(WEBHOOK_CONCURRENCY=4)
+    def test_send_webhooks_render_failure(self):
+        webhook = Webhook.objects.get(name='Webhook 1')
+        webhook.body_template = '{{ data.name'
+        webhook.save()
+
+        webhooks_queue = {}
+        enqueue_event(
+            webhooks_queue,
+            instance=Site.objects.create(name='Site 1', slug='site-1'),
+            user=self.user,
+            request_id=uuid.uuid4(),
+            event_type=OBJECT_CREATED
+        )
+        flush_events(list(webhooks_queue.values()))
+        job = self.queue.jobs[0]
+        self.queue.empty()
+
+        # A delivery which cannot be rendered should count as failed and be enqueued again as an individual job
+        with patch.object(Session, 'send') as mock_send:
+            self.assertEqual(send_webhooks(**job.kwargs), '0 of 1 requests succeeded for 1 events.')
+        mock_send.assert_not_called()
+        self.assertEqual(self.queue.count, 1)
+        self.assertEqual(self.queue.jobs[0].func_name, 'extras.webhooks.send_webhook')
+
+    @override_settings(WEBHOOK_CONCURRENCY=4)
+    def test_send_webhooks_unexpected_error(self):
+        webhooks_queue = {}
+        for i in range(1, 3):
+            enqueue_event(
+                webhooks_queue,
+                instance=Site.objects.create(name=f'Site {i}', slug=f'site-{i}'),
+                user=self.user,
+                request_id=uuid.uuid4(),
+                event_type=OBJECT_CREATED
+            )
+        flush_events(list(webhooks_queue.values()))
+        job = self.queue.jobs[0]
+        self.queue.empty()
+
+        # An error other than a RequestException should not prevent failed deliveries from being enqueued again
+        with patch.object(Session, 'send', side_effect=ValueError):
+            self.assertEqual(send_webhooks(**job.kwargs), '0 of 2 requests succeeded for 2 events.')
+        self.assertEqual(self.queue.count, 2)
+
     def test_duplicate_triggers(self):
         """
         Test for erroneous duplicate event triggers resulting from saving an object multiple times
@@ -433,3 +514,81 @@ class EventRuleTest(APITestCase):
         job = self.queue.get_jobs()[0]
         self.assertEqual(job.kwargs['event_type'], OBJECT_DELETED)
         self.queue.empty()
+
+    @override_settings(EVENTS_PIPELINE=['extras.events.process_event_queue'])
+    def test_skip_irrelevant_events(self):
+        """
+        Check that objects are not serialized for events to which no EventRule applies.
+        """
+        request = RequestFactory().get(reverse('dcim:site_add'))
+        request.id = uuid.uuid4()
+        request.user = self.user
+
+        with patch('extras.events.serialize_for_event', wraps=serialize_for_event) as mock_serialize:
+            with event_tracking(request):
+                Region.objects.create(name='Region 1', slug='region-1')
+            mock_serialize.assert_not_called()
+            self.assertEqual(self.queue.count, 0)
+
+            with event_tracking(request):
+                Site.objects.create(name='Site 1', slug='site-1')
+            mock_serialize.assert_called_once()
+            self.assertEqual(self.queue.count, 1)
+
+    def test_event_data_captured_at_enqueue(self):
+        """
+        Check that the data conveyed by an event reflects the object as it was when the event was recorded.
+        """
+        request = RequestFactory().get(reverse('dcim:site_add'))
+        request.id = uuid.uuid4()
+        request.user = self.user
+
+        with event_tracking(request):
+            site = Site.objects.create(name='Site 1', slug='site-1')
+            site.name = 'Site 2'
+        self.assertEqual(self.queue.count, 1)
+        job = self.queue.jobs[0]
+        self.assertEqual(job.kwargs['data']['name'], 'Site 1')
+        self.assertNotIn('instance', job.kwargs)
+
+    def test_event_rule_index(self):
+        site_type = ObjectType.objects.get_for_model(Site)
+        index = EventRuleIndex()
+
+        # Compile the index of enabled event rules
+        self.assertEqual(
+            [event_rule.name for event_rule in index._build()[(site_type.pk, OBJECT_UPDATED)]],
+            ['Event Rule 2']
+        )
+
+        # The local copy of the index should be discarded only if the shared version has changed
+        index.refresh()
+        index.get_rules(site_type, OBJECT_UPDATED)
+        index.refresh()
+        self.assertIsNotNone(index._index)
+        cache.add(EVENT_RULES_VERSION_KEY, 0, None)
+        cache.incr(EVENT_RULES_VERSION_KEY)
+        index.refresh()
+        self.assertIsNone(index._index)
+
+        # The index should not be consulted while changes to event rules remain uncommitted
+        index.update()
+        self.assertIsNone(index.get_rules(site_type, OBJECT_UPDATED))
+
+    def test_event_rule_index_invalid_conditions(self):
+        site_type = ObjectType.objects.get_for_model(Site)
+        index = EventRuleIndex()
+
+        # Save conditions with an invalid regular expression, bypassing validation
+        EventRule.objects.filter(name='Event Rule 3').update(
+            conditions={'attr': 'name', 'value': '[', 'op': 'regex'}
+        )
+
+        # The rule should be omitted from the index without affecting other rules
+        with self.assertLogs('netbox.events_processor', level='ERROR'):
+            rules = index._build()
+        self.assertNotIn((site_type.pk, OBJECT_DELETED), rules)
+        self.assertEqual(
+            [event_rule.name for event_rule in rules[(site_type.pk, OBJECT_UPDATED)]],
+            ['Event Rule 2']
+        )
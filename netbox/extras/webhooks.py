@@ -1,16 +1,28 @@
 import hashlib
 import hmac
 import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.cookiejar import DefaultCookiePolicy
 
 import requests
 from django.conf import settings
-from django_rq import job
+from django_rq import get_queue, job
 from jinja2.exceptions import TemplateError
+from requests.adapters import HTTPAdapter
 
+from netbox.config import get_config
+from netbox.constants import RQ_QUEUE_DEFAULT
+from utilities.rqworker import get_rq_retry
 from .constants import WEBHOOK_EVENT_TYPES
 
 logger = logging.getLogger('netbox.webhooks')
 
+# HTTP sessions shared by all webhook deliveries within the process, keyed by SSL verification setting
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
 def generate_signature(request_body, secret):
     """
@@ -24,14 +36,31 @@ def generate_signature(request_body, secret):
     return hmac_prep.hexdigest()
 
 
-@job('default')
-def send_webhook(event_rule, model_name, event_type, data, timestamp, username, request_id=None, snapshots=None):
+def get_session(webhook):
     """
-    Make a POST request to the defined Webhook
+    Return an HTTP session suitable for delivering the given webhook. Sessions are reused for the life of the process,
+    so that connections to each receiver are kept alive and pooled among deliveries. (Connections are therefore reused
+    among jobs only by a worker which does not fork a new process for each job, such as RQ's SimpleWorker.)
     """
-    webhook = event_rule.action_object
+    verify = webhook.ca_file_path or webhook.ssl_verification
+    with _sessions_lock:
+        if (session := _sessions.get(verify)) is None:
+            session = requests.Session()
+            session.verify = verify
+            # Never retain cookies, which would otherwise be sent with deliveries to unrelated receivers
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_maxsize=max(settings.WEBHOOK_CONCURRENCY, 10))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[verify] = session
+
+    return session
 
-    # Prepare context data for headers & body templates
+
+def get_context(model_name, event_type, data, timestamp, username, request_id=None, snapshots=None):
+    """
+    Return the context data for rendering a webhook's headers, body, and URL.
+    """
     context = {
         'event': WEBHOOK_EVENT_TYPES.get(event_type, event_type),
         'timestamp': timestamp,
@@ -45,6 +74,13 @@ def send_webhook(event_rule, model_name, event_type, data, timestamp, username,
             'snapshots': snapshots
         })
 
+    return context
+
+
+def render_request(webhook, context):
+    """
+    Render the URL, headers, and body of a webhook request for the given context.
+    """
     # Build the headers for the HTTP request
     headers = {
         'Content-Type': webhook.http_content_type,
@@ -62,16 +98,19 @@ def send_webhook(event_rule, model_name, event_type, data, timestamp, username,
         logger.error(f"Error rendering request body for webhook {webhook}: {e}")
         raise e
 
-    # Prepare the HTTP request
+    return webhook.render_payload_url(context), headers, body
+
+
+def prepare_request(webhook, url, headers, body):
+    """
+    Prepare an HTTP request for the given webhook, signing it if a secret has been defined.
+    """
     params = {
         'method': webhook.http_method,
-        'url': webhook.render_payload_url(context),
+        'url': url,
         'headers': headers,
         'data': body.encode('utf8'),
     }
-    logger.info(
-        f"Sending {params['method']} request to {params['url']} ({context['model']} {context['event']})"
-    )
     logger.debug(params)
     try:
         prepared_request = requests.Request(**params).prepare()
@@ -83,12 +122,14 @@ def send_webhook(event_rule, model_name, event_type, data, timestamp, username,
     if webhook.secret != '':
         prepared_request.headers['X-Hook-Signature'] = generate_signature(prepared_request.body, webhook.secret)
 
-    # Send the request
-    with requests.Session() as session:
-        session.verify = webhook.ssl_verification
-        if webhook.ca_file_path:
-            session.verify = webhook.ca_file_path
-        response = session.send(prepared_request, proxies=settings.HTTP_PROXIES)
+    return prepared_request
+
+
+def deliver(webhook, prepared_request):
+    """
+    Send a prepared webhook request, raising an exception if the request does not succeed.
+    """
+    response = get_session(webhook).send(prepared_request, proxies=settings.HTTP_PROXIES)
 
     if 200 <= response.status_code <= 299:
         logger.info(f"Request succeeded; response status {response.status_code}")
@@ -98,3 +139,88 @@ def send_webhook(event_rule, model_name, event_type, data, timestamp, username,
         raise requests.exceptions.RequestException(
             f"Status {response.status_code} returned with content '{response.content}', webhook FAILED to process."
         )
+
+
+@job('default')
+def send_webhook(event_rule, model_name, event_type, data, timestamp, username, request_id=None, snapshots=None):
+    """
+    Make a POST request to the defined Webhook
+    """
+    webhook = event_rule.action_object
+    context = get_context(model_name, event_type, data, timestamp, username, request_id, snapshots)
+    url, headers, body = render_request(webhook, context)
+
+    logger.info(
+        f"Sending {webhook.http_method} request to {url} ({context['model']} {context['event']})"
+    )
+    prepared_request = prepare_request(webhook, url, headers, body)
+
+    return deliver(webhook, prepared_request)
+
+
+@job('default')
+def send_webhooks(deliveries):
+    """
+    Deliver multiple webhooks concurrently, employing up to WEBHOOK_CONCURRENCY threads. Events sent to the same URL
+    by a webhook are combined into batched requests per the webhook's batch size. Each delivery which fails (including
+    any whose request cannot be rendered) is enqueued again as an individual job, subject to the configured retry
+    policy.
+
+    :param deliveries: A list of dictionaries, each holding the arguments for send_webhook()
+    """
+    webhooks = {}
+    pending = defaultdict(list)
+    failed = []
+    for delivery in deliveries:
+        event_rule = delivery['event_rule']
+        if event_rule.action_object_id not in webhooks:
+            webhooks[event_rule.action_object_id] = event_rule.action_object
+        webhook = webhooks[event_rule.action_object_id]
+
+        context = get_context(**{k: v for k, v in delivery.items() if k != 'event_rule'})
+        try:
+            url, headers, body = render_request(webhook, context)
+        except (TemplateError, ValueError) as e:
+            # Retry the delivery individually, so that the failure is recorded by its own job
+            logger.warning(f"Rendering of webhook {webhook} failed: {e}")
+            failed.append(delivery)
+            continue
+        pending[(webhook.pk, url, tuple(headers.items()))].append((delivery, body))
+
+    # Divide the events for each URL into batches
+    batches = []
+    for (webhook_id, url, headers), events in pending.items():
+        webhook = webhooks[webhook_id]
+        for i in range(0, len(events), webhook.batch_size):
+            batches.append((webhook, url, dict(headers), events[i:i + webhook.batch_size]))
+
+    def send_batch(webhook, url, headers, events):
+        if len(events) == 1:
+            body = events[0][1]
+        else:
+            body = '[' + ', '.join(body for _, body in events) + ']'
+        logger.info(f"Sending {webhook.http_method} request to {url} ({len(events)} events)")
+        return deliver(webhook, prepare_request(webhook, url, headers, body))
+
+    render_failures = failed_count = len(failed)
+    with ThreadPoolExecutor(max_workers=settings.WEBHOOK_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(send_batch, *batch): batch for batch in batches
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                # Retry the deliveries of the batch regardless of the error, so that no other deliveries are lost
+                logger.warning(f"Delivery of webhook {futures[future][0]} failed: {e}")
+                failed_count += 1
+                failed.extend(delivery for delivery, _ in futures[future][3])
+
+    # Enqueue each failed delivery to be retried individually
+    if failed:
+        rq_queue = get_queue(get_config().QUEUE_MAPPINGS.get('webhook', RQ_QUEUE_DEFAULT))
+        for delivery in failed:
+            rq_queue.enqueue("extras.webhooks.send_webhook", retry=get_rq_retry(), **delivery)
+
+    request_count = len(batches) + render_failures
+    return f"{request_count - failed_count} of {request_count} requests succeeded for {len(deliveries)} events."
@@ -0,0 +1,141 @@
+import netaddr
+
+from .constants import VLAN_VID_BITMAP_SIZE
+
+__all__ = (
+    'AvailableSpace',
+    'iter_gaps',
+    'iter_set_bits',
+    'vids_to_bitmap',
+)
+
+
+def iter_gaps(first, last, allocations):
+    """
+    Yield a (start, end) tuple for each contiguous block of integers between first and last (inclusive) which is not
+    covered by any allocation. Allocations are (start, end) tuples, which must be sorted by start but may overlap or
+    extend beyond the bounds. Allocations are consumed lazily, so only as many are read as are needed to produce
+    each gap.
+    """
+    cursor = first
+    for start, end in allocations:
+        if cursor > last or start > last:
+            break
+        if start > cursor:
+            yield cursor, start - 1
+        cursor = max(cursor, end + 1)
+    if cursor <= last:
+        yield cursor, last
+
+
+def iter_set_bits(value):
+    """
+    Yield the position of each set bit in the given integer, in ascending order.
+    """
+    while value:
+        lowest_bit = value & -value
+        yield lowest_bit.bit_length() - 1
+        value ^= lowest_bit
+
+
+def vids_to_bitmap(vids):
+    """
+    Return a bitmap of the given VLAN IDs as bytes. Bit N (counting from the least significant bit of the first byte)
+    is set if VLAN ID N is present, consistent with PostgreSQL's get_bit() and set_bit() functions for bytea values.
+    """
+    value = 0
+    for vid in vids:
+        value |= 1 << vid
+    return value.to_bytes(VLAN_VID_BITMAP_SIZE, 'little')
+
+
+class AvailableSpace:
+    """
+    The unallocated portion of a block of IP space, computed from the gaps between sorted allocations rather than by
+    materializing the entire block as an IPSet. Gaps are computed lazily and retained once computed, so that the
+    space may be iterated repeatedly without re-reading its allocations.
+
+    Attributes:
+        version: The IP version (4 or 6)
+        first: The first usable address in the block, as an integer
+        last: The last usable address in the block, as an integer
+    """
+    def __init__(self, version, first, last, allocations=()):
+        self.version = version
+        self.first = first
+        self.last = last
+        self._gaps = []
+        self._iterator = iter_gaps(first, last, allocations)
+
+    def __bool__(self):
+        return next(self._iter_gaps(), None) is not None
+
+    def __iter__(self):
+        """
+        Iterate over each available IP address.
+        """
+        for available_range in self.iter_ranges():
+            yield from available_range
+
+    def _iter_gaps(self):
+        i = 0
+        while True:
+            if i == len(self._gaps):
+                if (gap := next(self._iterator, None)) is None:
+                    return
+                self._gaps.append(gap)
+            yield self._gaps[i]
+            i += 1
+
+    @property
+    def size(self):
+        """
+        The total number of available IP addresses.
+        """
+        return sum(end - start + 1 for start, end in self._iter_gaps())
+
+    def iter_ranges(self):
+        """
+        Iterate over each contiguous range of available IP addresses as an IPRange.
+        """
+        for start, end in self._iter_gaps():
+            yield netaddr.IPRange(netaddr.IPAddress(start, self.version), netaddr.IPAddress(end, self.version))
+
+    def iter_cidrs(self):
+        """
+        Iterate over the largest available CIDR networks, in order.
+        """
+        for available_range in self.iter_ranges():
+            yield from available_range.cidrs()
+
+    def allocate_prefixes(self, prefix_lengths):
+        """
+        Return a list of the first available prefix of each requested length, allocating each prefix in turn.
+        Returns None if there is insufficient space to accommodate all the requested prefixes.
+        """
+        max_length = 32 if self.version == 4 else 128
+        gaps = self._iter_gaps()
+        free = []
+        prefixes = []
+
+        for prefix_length in prefix_lengths:
+            size = 1 << (max_length - prefix_length)
+            i = 0
+            while True:
+                if i == len(free):
+                    if (gap := next(gaps, None)) is None:
+                        return None
+                    free.append(gap)
+                start, end = free[i]
+
+                # Find the first network of the requested size which begins within the gap
+                network = -(-start // size) * size
+                if network + size - 1 <= end:
+                    free[i:i + 1] = [
+                        (a, b) for a, b in ((start, network - 1), (network + size, end)) if a <= b
+                    ]
+                    prefixes.append(netaddr.IPNetwork((network, prefix_length), self.version))
+                    break
+                i += 1
+
+        return prefixes
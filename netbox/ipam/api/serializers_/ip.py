@@ -4,7 +4,7 @@ from rest_framework import serializers
 
 from dcim.constants import LOCATION_SCOPE_TYPES
 from ipam.choices import *
-from ipam.constants import IPADDRESS_ASSIGNMENT_MODELS
+from ipam.constants import IPADDRESS_ASSIGNMENT_MODELS, PREFIX_LENGTH_MIN
 from ipam.models import Aggregate, IPAddress, IPRange, Prefix
 from netbox.api.fields import ChoiceField, ContentTypeField
 from netbox.api.serializers import NetBoxModelSerializer
@@ -21,8 +21,10 @@ __all__ = (
     'AggregateSerializer',
     'AvailableIPSerializer',
     'AvailablePrefixSerializer',
+    'IPAddressAllocationSerializer',
     'IPAddressSerializer',
     'IPRangeSerializer',
+    'PrefixAllocationSerializer',
     'PrefixLengthSerializer',
     'PrefixSerializer',
 )
@@ -33,12 +35,14 @@ class AggregateSerializer(NetBoxModelSerializer):
     rir = RIRSerializer(nested=True)
     tenant = TenantSerializer(nested=True, required=False, allow_null=True)
     prefix = IPNetworkField()
+    # Included only where annotated by annotate_utilization()
+    utilization = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Aggregate
         fields = [
             'id', 'url', 'display_url', 'display', 'family', 'prefix', 'rir', 'tenant', 'date_added', 'description',
-            'comments', 'tags', 'custom_fields', 'created', 'last_updated',
+            'comments', 'tags', 'custom_fields', 'created', 'last_updated', 'utilization',
         ]
         brief_fields = ('id', 'url', 'display', 'family', 'prefix', 'description')
 
@@ -62,6 +66,8 @@ class PrefixSerializer(NetBoxModelSerializer):
     role = RoleSerializer(nested=True, required=False, allow_null=True)
     children = serializers.IntegerField(read_only=True)
     _depth = serializers.IntegerField(read_only=True)
+    # Included only where annotated by annotate_utilization()
+    utilization = serializers.FloatField(read_only=True)
     prefix = IPNetworkField()
 
     class Meta:
@@ -69,7 +75,7 @@ class PrefixSerializer(NetBoxModelSerializer):
         fields = [
             'id', 'url', 'display_url', 'display', 'family', 'prefix', 'vrf', 'scope_type', 'scope_id', 'scope',
             'tenant', 'vlan', 'status', 'role', 'is_pool', 'mark_utilized', 'description', 'comments', 'tags',
-            'custom_fields', 'created', 'last_updated', 'children', '_depth',
+            'custom_fields', 'created', 'last_updated', 'children', '_depth', 'utilization',
         ]
         brief_fields = ('id', 'url', 'display', 'family', 'prefix', 'description', '_depth')
 
@@ -109,6 +115,16 @@ class PrefixLengthSerializer(serializers.Serializer):
         return data
 
 
+class PrefixAllocationSerializer(serializers.Serializer):
+    """
+    A request to allocate one or more child prefixes of the given length from a parent prefix. Any additional
+    attributes are applied to each prefix created.
+    """
+    parent = serializers.IntegerField()
+    prefix_length = serializers.IntegerField(min_value=PREFIX_LENGTH_MIN, max_value=128)
+    count = serializers.IntegerField(min_value=1, default=1)
+
+
 class AvailablePrefixSerializer(serializers.Serializer):
     """
     Representation of a prefix which does not exist in the database.
@@ -190,6 +206,15 @@ class IPAddressSerializer(NetBoxModelSerializer):
         return serializer(obj.assigned_object, nested=True, context=context).data
 
 
+class IPAddressAllocationSerializer(serializers.Serializer):
+    """
+    A request to allocate one or more IP addresses from a parent prefix. Any additional attributes are applied to each
+    IP address created.
+    """
+    parent = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1, default=1)
+
+
 class AvailableIPSerializer(serializers.Serializer):
     """
     Representation of an IP address which does not exist in the database.
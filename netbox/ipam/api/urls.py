@@ -29,6 +29,16 @@ router.register('services', views.ServiceViewSet)
 app_name = 'ipam-api'
 
 urlpatterns = [
+    path(
+        'available-prefixes/',
+        views.BulkAvailablePrefixesView.as_view(),
+        name='available-prefixes'
+    ),
+    path(
+        'available-ips/',
+        views.BulkAvailableIPAddressesView.as_view(),
+        name='available-ips'
+    ),
     path(
         'asn-ranges/<int:pk>/available-asns/',
         views.AvailableASNsView.as_view(),
@@ -39,6 +49,11 @@ urlpatterns = [
         views.IPRangeAvailableIPAddressesView.as_view(),
         name='iprange-available-ips'
     ),
+    path(
+        'prefixes/tree/',
+        views.PrefixTreeView.as_view(),
+        name='prefix-tree'
+    ),
     path(
         'prefixes/<int:pk>/available-prefixes/',
         views.AvailablePrefixesView.as_view(),
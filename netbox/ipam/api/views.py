@@ -1,26 +1,36 @@
+import json
 from copy import deepcopy
+from itertools import islice
 
+import netaddr
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as _
 from django_pglocks import advisory_lock
-from drf_spectacular.utils import extend_schema
-from netaddr import IPSet
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.routers import APIRootView
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
 from ipam import filtersets
+from ipam.constants import BULK_ALLOCATION_MAX_OBJECTS
+from ipam.context import defer_duplicate_checks, duplicate_checks_deferred
+from ipam.locks import allocation_lock
 from ipam.models import *
-from ipam.utils import get_next_available_prefix
+from netbox.api.renderers import NDJSONRenderer
 from netbox.api.viewsets import NetBoxModelViewSet
 from netbox.api.viewsets.mixins import ObjectValidationMixin
 from netbox.config import get_config
 from netbox.constants import ADVISORY_LOCK_KEYS
-from utilities.api import get_serializer_for_model
+from utilities.api import get_related_object_by_attrs, get_serializer_for_model
 from . import serializers
 
 
@@ -36,6 +46,28 @@ class IPAMRootView(APIRootView):
 # Viewsets
 #
 
+class DuplicateCheckMixin:
+    """
+    Check all the Prefixes or IP addresses created by a request for duplicate IP space at once (once they have been
+    saved), rather than querying for the duplicates of each object as it is validated.
+    """
+    def create(self, request, *args, **kwargs):
+        with defer_duplicate_checks():
+            return super().create(request, *args, **kwargs)
+
+    def _validate_objects(self, instance):
+        super()._validate_objects(instance)
+
+        if duplicate_checks_deferred.get():
+            instances = instance if type(instance) is list else [instance]
+            if errors := self.queryset.model.check_duplicates(instances):
+                if type(instance) is list:
+                    raise ValidationError([
+                        errors[i].message_dict if i in errors else {} for i in range(len(instances))
+                    ])
+                raise ValidationError(errors[0].message_dict)
+
+
 class ASNRangeViewSet(NetBoxModelViewSet):
     queryset = ASNRange.objects.all()
     serializer_class = serializers.ASNRangeSerializer
@@ -71,6 +103,13 @@ class AggregateViewSet(NetBoxModelViewSet):
     serializer_class = serializers.AggregateSerializer
     filterset_class = filtersets.AggregateFilterSet
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # Compute utilization for all returned objects at once
+        if self.request.method in SAFE_METHODS and 'utilization' in (self.requested_fields or ['utilization']):
+            qs = qs.annotate_utilization()
+        return qs
+
 
 class RoleViewSet(NetBoxModelViewSet):
     queryset = Role.objects.all()
@@ -78,13 +117,20 @@ class RoleViewSet(NetBoxModelViewSet):
     filterset_class = filtersets.RoleFilterSet
 
 
-class PrefixViewSet(NetBoxModelViewSet):
+class PrefixViewSet(DuplicateCheckMixin, NetBoxModelViewSet):
     queryset = Prefix.objects.all()
     serializer_class = serializers.PrefixSerializer
     filterset_class = filtersets.PrefixFilterSet
 
     parent_model = Prefix  # AvailableIPsMixin
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # Compute utilization for all returned objects at once
+        if self.request.method in SAFE_METHODS and 'utilization' in (self.requested_fields or ['utilization']):
+            qs = qs.annotate_utilization()
+        return qs
+
     def get_serializer_class(self):
         if self.action == "available_prefixes" and self.request.method == "POST":
             return serializers.PrefixLengthSerializer
@@ -99,22 +145,49 @@ class IPRangeViewSet(NetBoxModelViewSet):
     parent_model = IPRange  # AvailableIPsMixin
 
 
-class IPAddressViewSet(NetBoxModelViewSet):
+class IPAddressViewSet(DuplicateCheckMixin, NetBoxModelViewSet):
     queryset = IPAddress.objects.all()
     serializer_class = serializers.IPAddressSerializer
     filterset_class = filtersets.IPAddressFilterSet
 
-    @advisory_lock(ADVISORY_LOCK_KEYS['available-ips'])
+    def get_allocation_spans(self, data, instance=None):
+        """
+        Return a (VRF ID, IPNetwork) tuple identifying the host address of each IP address in the request data, for
+        use with allocation_lock(). Any attributes not specified are taken from the instance being updated (if any).
+        Entries which cannot be resolved are omitted, as they will fail validation.
+        """
+        spans = []
+        for item in data if isinstance(data, list) else [data]:
+            try:
+                address = netaddr.IPNetwork(item['address']) if 'address' in item else instance.address
+                if 'vrf' not in item:
+                    vrf_id = instance.vrf_id if instance else None
+                elif isinstance(item['vrf'], dict):
+                    vrf_id = get_related_object_by_attrs(VRF.objects.all(), item['vrf']).pk
+                else:
+                    vrf_id = int(item['vrf']) if item['vrf'] is not None else None
+            except (AttributeError, KeyError, TypeError, ValueError, netaddr.AddrFormatError, ValidationError):
+                continue
+            spans.append((vrf_id, netaddr.IPNetwork(address.ip)))
+
+        return spans
+
     def create(self, request, *args, **kwargs):
-        return super().create(request, *args, **kwargs)
+        with allocation_lock('available-ips', self.get_allocation_spans(request.data)):
+            return super().create(request, *args, **kwargs)
 
-    @advisory_lock(ADVISORY_LOCK_KEYS['available-ips'])
     def update(self, request, *args, **kwargs):
-        return super().update(request, *args, **kwargs)
+        instance = self.get_object()
+        spans = [
+            *self.get_allocation_spans({}, instance),
+            *self.get_allocation_spans(request.data, instance),
+        ]
+        with allocation_lock('available-ips', spans):
+            return super().update(request, *args, **kwargs)
 
-    @advisory_lock(ADVISORY_LOCK_KEYS['available-ips'])
     def destroy(self, request, *args, **kwargs):
-        return super().destroy(request, *args, **kwargs)
+        with allocation_lock('available-ips', self.get_allocation_spans({}, self.get_object())):
+            return super().destroy(request, *args, **kwargs)
 
 
 class FHRPGroupViewSet(NetBoxModelViewSet):
@@ -212,6 +285,12 @@ class AvailableObjectsView(ObjectValidationMixin, APIView):
         """
         return {}
 
+    def get_lock(self, parent):
+        """
+        Return the advisory lock to be held while allocating objects within the parent.
+        """
+        return advisory_lock(ADVISORY_LOCK_KEYS[self.advisory_lock_key])
+
     def check_sufficient_available(self, requested_objects, available_objects):
         """
         Check if there exist a sufficient number of available objects to satisfy the request.
@@ -256,7 +335,7 @@ class AvailableObjectsView(ObjectValidationMixin, APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with advisory_lock(ADVISORY_LOCK_KEYS[self.advisory_lock_key]):
+        with self.get_lock(parent):
             available_objects = self.get_available_objects(parent, limit)
 
             # Determine if the requested number of objects is available
@@ -340,15 +419,15 @@ class AvailablePrefixesView(AvailableObjectsView):
     def get_parent(self, request, pk):
         return get_object_or_404(Prefix.objects.restrict(request.user), pk=pk)
 
+    def get_lock(self, parent):
+        return allocation_lock(self.advisory_lock_key, [(parent.vrf_id, parent.prefix)])
+
     def get_available_objects(self, parent, limit=None):
-        return parent.get_available_prefixes().iter_cidrs()
+        return parent.get_available_prefix_space()
 
     def check_sufficient_available(self, requested_objects, available_objects):
-        available_prefixes = IPSet(available_objects)
-        for requested_object in requested_objects:
-            if not get_next_available_prefix(available_prefixes, requested_object['prefix_length']):
-                return False
-        return True
+        prefix_lengths = [requested_object['prefix_length'] for requested_object in requested_objects]
+        return available_objects.allocate_prefixes(prefix_lengths) is not None
 
     def get_extra_context(self, parent):
         return {
@@ -357,23 +436,35 @@ class AvailablePrefixesView(AvailableObjectsView):
         }
 
     def prep_object_data(self, requested_objects, available_objects, parent):
-        available_prefixes = IPSet(available_objects)
-        for i, request_data in enumerate(requested_objects):
+        # Find the first available prefix of each requested size
+        prefix_lengths = [request_data['prefix_length'] for request_data in requested_objects]
+        allocated_prefixes = available_objects.allocate_prefixes(prefix_lengths)
+        if allocated_prefixes is None:
+            raise ValidationError(_("Insufficient space is available to accommodate the requested prefix size(s)"))
 
-            # Find the first available prefix equal to or larger than the requested size
-            if allocated_prefix := get_next_available_prefix(available_prefixes, request_data['prefix_length']):
-                request_data.update({
-                    'prefix': allocated_prefix,
-                    'vrf': parent.vrf.pk if parent.vrf else None,
-                })
-            else:
-                raise ValidationError(_("Insufficient space is available to accommodate the requested prefix size(s)"))
+        for request_data, allocated_prefix in zip(requested_objects, allocated_prefixes):
+            request_data.update({
+                'prefix': str(allocated_prefix),
+                'vrf': parent.vrf.pk if parent.vrf else None,
+            })
 
         return requested_objects
 
     @extend_schema(methods=["get"], responses={200: serializers.AvailablePrefixSerializer(many=True)})
     def get(self, request, pk):
-        return super().get(request, pk)
+        parent = self.get_parent(request, pk)
+        available_prefixes = self.get_available_objects(parent).iter_cidrs()
+
+        serializer = self.read_serializer_class(
+            list(islice(available_prefixes, get_results_limit(request))),
+            many=True,
+            context={
+                'request': request,
+                **self.get_extra_context(parent),
+            }
+        )
+
+        return Response(serializer.data)
 
     @extend_schema(
         methods=["post"],
@@ -392,12 +483,7 @@ class AvailableIPAddressesView(AvailableObjectsView):
 
     def get_available_objects(self, parent, limit=None):
         # Calculate available IPs within the parent
-        ip_list = []
-        for index, ip in enumerate(parent.get_available_ips(), start=1):
-            ip_list.append(ip)
-            if index == limit:
-                break
-        return ip_list
+        return list(islice(parent.get_available_ip_space(), limit))
 
     def get_extra_context(self, parent):
         return {
@@ -433,12 +519,18 @@ class PrefixAvailableIPAddressesView(AvailableIPAddressesView):
     def get_parent(self, request, pk):
         return get_object_or_404(Prefix.objects.restrict(request.user), pk=pk)
 
+    def get_lock(self, parent):
+        return allocation_lock(self.advisory_lock_key, [(parent.vrf_id, parent.prefix)])
+
 
 class IPRangeAvailableIPAddressesView(AvailableIPAddressesView):
 
     def get_parent(self, request, pk):
         return get_object_or_404(IPRange.objects.restrict(request.user), pk=pk)
 
+    def get_lock(self, parent):
+        return allocation_lock(self.advisory_lock_key, [(parent.vrf_id, parent.range)])
+
 
 class AvailableVLANsView(AvailableObjectsView):
     queryset = VLAN.objects.all()
@@ -477,3 +569,277 @@ class AvailableVLANsView(AvailableObjectsView):
     )
     def post(self, request, pk):
         return super().post(request, pk)
+
+
+class BulkAvailableObjectsView(ObjectValidationMixin, APIView):
+    """
+    Allocate available child objects from any number of parent prefixes at once. Each request specifies a parent
+    prefix and the number of objects to allocate from it; the available space within each parent is computed only
+    once, and all objects are created within a single transaction.
+    """
+    write_serializer_class = None
+    advisory_lock_key = None
+    allocation_fields = ('parent', 'count')
+
+    def allocate(self, parent, requests):
+        """
+        Return a list of the data for each object allocated from the parent to satisfy each of the requests, or None
+        if insufficient space is available.
+        """
+        raise NotImplementedError()
+
+    def post(self, request):
+        self.queryset = self.queryset.restrict(request.user, 'add')
+
+        # Normalize request data to a list of objects
+        requested_objects = request.data if isinstance(request.data, list) else [request.data]
+
+        # Serialize and validate the request data
+        serializer = self.write_serializer_class(data=requested_objects, many=True, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        allocations = serializer.validated_data
+        if sum(allocation['count'] for allocation in allocations) > BULK_ALLOCATION_MAX_OBJECTS:
+            raise ValidationError(
+                _("No more than {max} objects may be allocated in a single request.").format(
+                    max=BULK_ALLOCATION_MAX_OBJECTS
+                )
+            )
+
+        # Retrieve all parent prefixes at once
+        parent_ids = {allocation['parent'] for allocation in allocations}
+        parents = Prefix.objects.restrict(request.user).in_bulk(parent_ids)
+        if missing_ids := parent_ids - set(parents):
+            raise ValidationError({
+                'parent': _("Prefix(es) not found: {ids}").format(ids=', '.join(str(pk) for pk in sorted(missing_ids)))
+            })
+
+        # Group requests by parent, preserving their order
+        parent_requests = {}
+        for i, allocation in enumerate(allocations):
+            parent_requests.setdefault(allocation['parent'], []).append(i)
+
+        with allocation_lock(self.advisory_lock_key, [(parent.vrf_id, parent.prefix) for parent in parents.values()]):
+            allocated_objects = [None] * len(allocations)
+            for parent_id, indices in parent_requests.items():
+                parent_objects = self.allocate(parents[parent_id], [allocations[i] for i in indices])
+                if parent_objects is None:
+                    return Response(
+                        {"detail": "Insufficient resources are available to satisfy the request"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                for i, objects in zip(indices, parent_objects):
+                    allocated_objects[i] = objects
+
+            # Prepare object data for deserialization, applying any additional attributes from each request and
+            # recording the request from which each object was allocated
+            object_data = []
+            object_requests = []
+            for i, (request_data, objects) in enumerate(zip(requested_objects, allocated_objects)):
+                attrs = {k: v for k, v in request_data.items() if k not in self.allocation_fields}
+                for obj in objects:
+                    object_data.append({**deepcopy(attrs), **obj})
+                    object_requests.append(i)
+
+            # Validate and create all the new objects, checking them for duplicate IP space at once
+            serializer_class = get_serializer_for_model(self.queryset.model)
+            with defer_duplicate_checks():
+                serializer = serializer_class(data=object_data, many=True, context={'request': request})
+                if not serializer.is_valid():
+                    return Response(
+                        self._get_request_errors(dict(enumerate(serializer.errors)), object_requests, len(allocations)),
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                try:
+                    with transaction.atomic():
+                        created = serializer.save()
+                        self._validate_objects(created)
+                        if errors := self.queryset.model.check_duplicates(created):
+                            errors = {i: error.message_dict for i, error in errors.items()}
+                            raise ValidationError(self._get_request_errors(errors, object_requests, len(allocations)))
+                except ObjectDoesNotExist:
+                    raise PermissionDenied()
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def _get_request_errors(object_errors, object_requests, request_count):
+        """
+        Attribute the errors raised for allocated objects (keyed by the position of each object) to the requests from
+        which the objects were allocated. Returns a list of errors ordered as the requests.
+        """
+        errors = [{} for _ in range(request_count)]
+        for i, error in object_errors.items():
+            if error and not errors[object_requests[i]]:
+                errors[object_requests[i]] = error
+        return errors
+
+
+class BulkAvailablePrefixesView(BulkAvailableObjectsView):
+    queryset = Prefix.objects.all()
+    write_serializer_class = serializers.PrefixAllocationSerializer
+    advisory_lock_key = 'available-prefixes'
+    allocation_fields = ('parent', 'prefix_length', 'count')
+
+    def allocate(self, parent, requests):
+        max_length = 32 if parent.family == 4 else 128
+        for request_data in requests:
+            if request_data['prefix_length'] > max_length:
+                raise ValidationError({
+                    'prefix_length': _("Invalid prefix length ({prefix_length}) for IPv{family}").format(
+                        prefix_length=request_data['prefix_length'],
+                        family=parent.family
+                    )
+                })
+
+        # Allocate all prefixes requested from the parent at once
+        prefix_lengths = []
+        for request_data in requests:
+            prefix_lengths.extend([request_data['prefix_length']] * request_data['count'])
+        allocated_prefixes = parent.get_available_prefix_space().allocate_prefixes(prefix_lengths)
+        if allocated_prefixes is None:
+            return None
+
+        allocated_prefixes = iter(allocated_prefixes)
+        return [
+            [
+                {'prefix': str(prefix), 'vrf': parent.vrf_id}
+                for prefix in islice(allocated_prefixes, request_data['count'])
+            ]
+            for request_data in requests
+        ]
+
+    @extend_schema(
+        methods=["post"],
+        responses={201: serializers.PrefixSerializer(many=True)},
+        request=serializers.PrefixAllocationSerializer(many=True),
+    )
+    def post(self, request):
+        return super().post(request)
+
+
+class BulkAvailableIPAddressesView(BulkAvailableObjectsView):
+    queryset = IPAddress.objects.all()
+    write_serializer_class = serializers.IPAddressAllocationSerializer
+    advisory_lock_key = 'available-ips'
+
+    def allocate(self, parent, requests):
+        available_ips = iter(parent.get_available_ip_space())
+        allocated_ips = []
+        for request_data in requests:
+            addresses = list(islice(available_ips, request_data['count']))
+            if len(addresses) < request_data['count']:
+                return None
+            allocated_ips.append([
+                {'address': f'{address}/{parent.mask_length}', 'vrf': parent.vrf_id} for address in addresses
+            ])
+
+        return allocated_ips
+
+    @extend_schema(
+        methods=["post"],
+        responses={201: serializers.IPAddressSerializer(many=True)},
+        request=serializers.IPAddressAllocationSerializer(many=True),
+    )
+    def post(self, request):
+        return super().post(request)
+
+
+class PrefixTreeView(APIView):
+    """
+    Stream the prefixes within a VRF (or the global table) in hierarchical order, optionally limited to those within
+    an aggregate and/or to a maximum depth. Prefixes are read from a single ordered cursor and emitted as they are read,
+    either as nested JSON or (if requested) as newline-delimited JSON in depth-first order, so that server memory use
+    does not grow with the size of the tree.
+    """
+    queryset = Prefix.objects.all()
+    renderer_classes = (JSONRenderer, NDJSONRenderer)
+    buffer_size = 1000
+
+    @staticmethod
+    def _get_id_param(request, name):
+        value = request.query_params.get(name)
+        if value is not None and not value.isdigit():
+            raise ValidationError({name: _("Must be a positive integer.")})
+        return int(value) if value is not None else None
+
+    def get_queryset(self, request):
+        queryset = self.queryset.restrict(request.user, 'view')
+
+        # Select the VRF (or the global table)
+        if request.query_params.get('vrf_id', 'null') == 'null':
+            queryset = queryset.filter(vrf__isnull=True)
+        else:
+            vrf_id = self._get_id_param(request, 'vrf_id')
+            queryset = queryset.filter(vrf=get_object_or_404(VRF.objects.restrict(request.user), pk=vrf_id))
+
+        # Limit to prefixes within an aggregate
+        if (aggregate_id := self._get_id_param(request, 'aggregate_id')) is not None:
+            aggregate = get_object_or_404(Aggregate.objects.restrict(request.user), pk=aggregate_id)
+            queryset = queryset.filter(prefix__net_contained_or_equal=str(aggregate.prefix))
+
+        # Limit the depth of the tree
+        if (max_depth := self._get_id_param(request, 'max_depth')) is not None:
+            queryset = queryset.filter(_depth__lte=max_depth)
+
+        # Each prefix is ordered before any child prefixes
+        return queryset.order_by('prefix', 'pk')
+
+    def _serialize(self, prefix, context):
+        data = serializers.PrefixSerializer(prefix, nested=True, context=context).data
+        data['children'] = prefix._children
+        return json.dumps(data, cls=JSONEncoder)
+
+    def _buffer(self, chunks):
+        buffer = []
+        for chunk in chunks:
+            buffer.append(chunk)
+            if len(buffer) >= self.buffer_size:
+                yield ''.join(buffer)
+                buffer = []
+        yield ''.join(buffer)
+
+    def _iter_ndjson(self, prefixes, context):
+        for prefix in prefixes:
+            yield self._serialize(prefix, context) + '\n'
+
+    def _iter_json(self, prefixes, context):
+        """
+        Nest each prefix within the nearest preceding prefix which contains it, using only a stack of the currently
+        open prefixes. Containment is tested directly rather than inferred from depth, as the user may not be
+        permitted to view every intermediate prefix.
+        """
+        open_prefixes = []
+        is_first = True
+        yield '['
+        for prefix in prefixes:
+            # Close any open prefixes which do not contain this one
+            while open_prefixes and not (
+                open_prefixes[-1].prefixlen < prefix.prefix.prefixlen and prefix.prefix in open_prefixes[-1]
+            ):
+                open_prefixes.pop()
+                yield ']}'
+                is_first = False
+            yield ('' if is_first else ',') + self._serialize(prefix, context)[:-1] + ', "child_prefixes": ['
+            open_prefixes.append(prefix.prefix)
+            is_first = True
+        yield ']}' * len(open_prefixes) + ']'
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('vrf_id', OpenApiTypes.STR, description='VRF ID, or "null" for the global table'),
+            OpenApiParameter('aggregate_id', OpenApiTypes.INT, description='Limit to prefixes within an aggregate'),
+            OpenApiParameter('max_depth', OpenApiTypes.INT, description='Maximum depth of prefixes to include'),
+        ],
+        responses={200: serializers.PrefixSerializer(nested=True, many=True)},
+    )
+    def get(self, request):
+        prefixes = self.get_queryset(request).iterator()
+        context = {'request': request}
+
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            content = self._iter_ndjson(prefixes, context)
+        else:
+            content = self._iter_json(prefixes, context)
+
+        return StreamingHttpResponse(self._buffer(content), content_type=request.accepted_renderer.media_type)
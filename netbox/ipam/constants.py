@@ -48,6 +48,24 @@ IPADDRESS_ROLES_NONUNIQUE = (
 )
 
 
+#
+# Allocation locks
+#
+
+# Allocation locks are striped across blocks of IP space of these prefix lengths, for each type of allocation. An
+# allocation confined to a single block locks only that block (within its VRF); any larger allocation locks the VRF.
+ALLOCATION_LOCK_PREFIX_LENGTHS = {
+    'available-ips': {4: 24, 6: 64},
+    'available-prefixes': {4: 16, 6: 48},
+}
+
+# The maximum number of blocks locked by a single operation before the entire VRF is locked instead
+ALLOCATION_LOCK_MAX_BLOCKS = 32
+
+# The maximum number of objects which may be created by a single bulk allocation request
+BULK_ALLOCATION_MAX_OBJECTS = 10000
+
+
 #
 # FHRP groups
 #
@@ -73,6 +91,9 @@ FHRP_PROTOCOL_ROLE_MAPPINGS = {
 VLAN_VID_MIN = 1
 VLAN_VID_MAX = 4094
 
+# Size (in bytes) of a bitmap with one bit for each possible 12-bit VLAN ID
+VLAN_VID_BITMAP_SIZE = 512
+
 # models values for ContentTypes which may be VLANGroup scope types
 VLANGROUP_SCOPE_TYPES = (
     'region', 'sitegroup', 'site', 'location', 'rack', 'clustergroup', 'cluster',
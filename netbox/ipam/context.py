@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+__all__ = (
+    'defer_duplicate_checks',
+    'duplicate_checks_deferred',
+)
+
+
+duplicate_checks_deferred = ContextVar('duplicate_checks_deferred', default=False)
+
+
+@contextmanager
+def defer_duplicate_checks():
+    """
+    Skip the enforcement of unique IP space as each Prefix or IPAddress is cleaned. The caller assumes responsibility
+    for checking all the affected objects at once by calling check_duplicates() on the model.
+    """
+    token = duplicate_checks_deferred.set(True)
+    try:
+        yield
+    finally:
+        duplicate_checks_deferred.reset(token)
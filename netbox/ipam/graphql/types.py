@@ -260,7 +260,7 @@ class VLANType(NetBoxObjectType):
 
 @strawberry_django.type(
     models.VLANGroup,
-    exclude=('scope_type', 'scope_id'),
+    exclude=('scope_type', 'scope_id', '_vid_bitmap'),
     filters=VLANGroupFilter
 )
 class VLANGroupType(OrganizationalObjectType):
@@ -0,0 +1,78 @@
+import zlib
+from contextlib import ExitStack, contextmanager
+
+from django_pglocks import advisory_lock
+
+from netbox.constants import ADVISORY_LOCK_KEYS
+from .constants import ALLOCATION_LOCK_MAX_BLOCKS, ALLOCATION_LOCK_PREFIX_LENGTHS
+
+__all__ = (
+    'allocation_lock',
+    'get_allocation_locks',
+)
+
+
+def _get_lock_id(*values):
+    """
+    Derive a signed 32-bit integer from the given values, for use as half of a two-part advisory lock key.
+    """
+    value = zlib.crc32(':'.join(str(v) for v in values).encode())
+    return value - 2 ** 32 if value >= 2 ** 31 else value
+
+
+def get_allocation_locks(lock_name, spans):
+    """
+    Return the advisory locks which must be held to allocate objects within the given spans of IP space, as a list of
+    (lock_id, shared) tuples in the order in which they must be acquired.
+
+    Each span is a tuple of a VRF ID (or None) and an object with first, last, and version attributes (e.g. an
+    IPNetwork or IPRange). IP space is divided into fixed-size blocks, each of which is guarded by its own lock. A span
+    confined to a single block requires a shared lock on its VRF and an exclusive lock on the block. A span which
+    extends across multiple blocks requires an exclusive lock on its VRF, excluding all other allocations within the
+    VRF. Any two overlapping spans thus always contend for the same lock.
+    """
+    vrf_locks = {}
+    block_locks = {}
+
+    for vrf_id, span in spans:
+        max_length = 32 if span.version == 4 else 128
+        shift = max_length - ALLOCATION_LOCK_PREFIX_LENGTHS[lock_name][span.version]
+        vrf_lock_id = (ADVISORY_LOCK_KEYS[f'{lock_name}-vrf'], _get_lock_id(vrf_id, span.version))
+        if span.first >> shift == span.last >> shift:
+            vrf_locks.setdefault(vrf_lock_id, True)
+            block_locks.setdefault(vrf_lock_id, set()).add(
+                (ADVISORY_LOCK_KEYS[lock_name], _get_lock_id(vrf_id, span.version, span.first >> shift))
+            )
+        else:
+            vrf_locks[vrf_lock_id] = False
+
+    # Lock the entire VRF in lieu of an excessive number of blocks
+    for vrf_lock_id, lock_ids in block_locks.items():
+        if len(lock_ids) > ALLOCATION_LOCK_MAX_BLOCKS:
+            vrf_locks[vrf_lock_id] = False
+
+    # Always acquire VRF locks before block locks, and each in a consistent order, to avoid deadlocks
+    return [
+        *sorted(vrf_locks.items()),
+        *sorted(
+            (lock_id, False)
+            for vrf_lock_id, lock_ids in block_locks.items() if vrf_locks[vrf_lock_id]
+            for lock_id in lock_ids
+        ),
+    ]
+
+
+@contextmanager
+def allocation_lock(lock_name, spans):
+    """
+    Acquire the advisory locks needed to safely allocate objects within the given spans of IP space (see
+    get_allocation_locks()). Allocations within unrelated blocks of IP space do not block one another.
+
+    Args:
+        lock_name: The name of the allocation lock (e.g. "available-ips")
+        spans: An iterable of (VRF ID, IPNetwork/IPRange) tuples
+    """
+    with ExitStack() as stack:
+        for lock_id, shared in get_allocation_locks(lock_name, spans):
+            stack.enter_context(advisory_lock(lock_id, shared=shared))
+        yield
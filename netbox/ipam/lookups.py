@@ -144,14 +144,17 @@ class NetHostContained(Lookup):
     """
     Check for the host portion of an IP address without regard to its mask. This allows us to find e.g. 192.0.2.1/24
     when specifying a parent prefix of 192.0.2.0/26.
+
+    The network of any such address necessarily overlaps the parent prefix, so the comparison is preceded by an
+    overlap (&&) test which can be served by a GiST inet_ops index on the field.
     """
     lookup_name = 'net_host_contained'
 
     def as_sql(self, qn, connection):
         lhs, lhs_params = self.process_lhs(qn, connection)
         rhs, rhs_params = self.process_rhs(qn, connection)
-        params = lhs_params + rhs_params
-        return 'CAST(HOST(%s) AS INET) <<= %s' % (lhs, rhs), params
+        params = lhs_params + rhs_params + lhs_params + rhs_params
+        return '(%s && %s AND CAST(HOST(%s) AS INET) <<= %s)' % (lhs, rhs, lhs, rhs), params
 
 
 class NetFamily(Transform):
@@ -1,27 +1,73 @@
-from django.core.management.base import BaseCommand
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.utils.translation import gettext as _
 
 from ipam.models import Prefix, VRF
 from ipam.utils import rebuild_prefixes
 
 
+def rebuild_vrf(vrf_id):
+    """
+    Rebuild the prefix hierarchy for the specified VRF (or the global table). Returns the VRF ID, the number of
+    prefixes updated, and the elapsed time in seconds.
+    """
+    start_time = time.monotonic()
+    updated_count = rebuild_prefixes(vrf_id)
+
+    return vrf_id, updated_count, time.monotonic() - start_time
+
+
 class Command(BaseCommand):
     help = "Rebuild the prefix hierarchy (depth and children counts)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Number of worker processes to use (default: 1)"
+        )
+
     def handle(self, *model_names, **options):
-        self.stdout.write(f'Rebuilding {Prefix.objects.count()} prefixes...')
+        if options['workers'] < 1:
+            raise CommandError(_("The number of workers must be at least 1."))
 
-        # Reset existing counts
-        Prefix.objects.update(_depth=0, _children=0)
+        # Count the prefixes in the global table & each VRF, rebuilding the largest first
+        prefix_counts = {
+            row['vrf']: row['count'] for row in Prefix.objects.order_by().values('vrf').annotate(count=Count('pk'))
+        }
+        vrf_names = {None: 'Global', **{vrf.pk: f'VRF {vrf}' for vrf in VRF.objects.all()}}
+        vrf_ids = sorted(prefix_counts, key=lambda vrf_id: prefix_counts[vrf_id], reverse=True)
+        self.stdout.write(
+            f'Rebuilding {sum(prefix_counts.values())} prefixes in {len(vrf_ids)} tables '
+            f'using {options["workers"]} workers...'
+        )
+        start_time = time.monotonic()
 
-        # Rebuild the global table
-        global_count = Prefix.objects.filter(vrf__isnull=True).count()
-        self.stdout.write(f'Global: {global_count} prefixes...')
-        rebuild_prefixes(None)
+        def record(result):
+            vrf_id, updated_count, elapsed = result
+            self.stdout.write(
+                f'  {vrf_names[vrf_id]}: {prefix_counts[vrf_id]} prefixes ({updated_count} updated) in {elapsed:.1f}s'
+            )
 
-        # Rebuild each VRF
-        for vrf in VRF.objects.all():
-            vrf_count = Prefix.objects.filter(vrf=vrf).count()
-            self.stdout.write(f'VRF {vrf}: {vrf_count} prefixes...')
-            rebuild_prefixes(vrf.pk)
+        if options['workers'] == 1:
+            for vrf_id in vrf_ids:
+                record(rebuild_vrf(vrf_id))
+        else:
+            # Close any open database connections prior to forking worker processes
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('fork')
+            ) as executor:
+                futures = [executor.submit(rebuild_vrf, vrf_id) for vrf_id in vrf_ids]
+                for future in as_completed(futures):
+                    record(future.result())
 
-        self.stdout.write(self.style.SUCCESS('Finished.'))
+        elapsed = time.monotonic() - start_time
+        self.stdout.write(self.style.SUCCESS(f'Finished in {elapsed:.1f}s.'))
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+import ipam.models.vlans
+from ipam.allocation import vids_to_bitmap
+
+
+def populate_vid_bitmaps(apps, schema_editor):
+    """
+    Record the VLAN IDs in use within each VLAN group.
+    """
+    VLANGroup = apps.get_model('ipam', 'VLANGroup')
+    VLAN = apps.get_model('ipam', 'VLAN')
+
+    group_vids = {}
+    for group_id, vid in VLAN.objects.filter(group__isnull=False).values_list('group', 'vid'):
+        group_vids.setdefault(group_id, []).append(vid)
+    for group_id, vids in group_vids.items():
+        VLANGroup.objects.filter(pk=group_id).update(_vid_bitmap=vids_to_bitmap(vids), _vlan_count=len(vids))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('ipam', '0076_natural_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vlangroup',
+            name='_vid_bitmap',
+            field=models.BinaryField(default=ipam.models.vlans.default_vid_bitmap),
+        ),
+        migrations.AddField(
+            model_name='vlangroup',
+            name='_vlan_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(code=populate_vid_bitmaps, reverse_code=migrations.RunPython.noop),
+    ]
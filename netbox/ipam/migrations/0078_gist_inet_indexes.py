@@ -0,0 +1,42 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('ipam', '0077_vlangroup_vid_bitmap'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='aggregate',
+            index=django.contrib.postgres.indexes.GistIndex(
+                django.contrib.postgres.indexes.OpClass('prefix', name='inet_ops'),
+                name='ipam_aggregate_prefix_gist',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='prefix',
+            index=django.contrib.postgres.indexes.GistIndex(
+                django.contrib.postgres.indexes.OpClass('prefix', name='inet_ops'),
+                name='ipam_prefix_prefix_gist',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='iprange',
+            index=django.contrib.postgres.indexes.GistIndex(
+                django.contrib.postgres.indexes.OpClass('start_address', name='inet_ops'),
+                name='ipam_iprange_start_address_gist',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='ipaddress',
+            index=django.contrib.postgres.indexes.GistIndex(
+                django.contrib.postgres.indexes.OpClass('address', name='inet_ops'),
+                name='ipam_ipaddress_address_gist',
+            ),
+        ),
+    ]
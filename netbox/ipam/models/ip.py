@@ -1,20 +1,27 @@
+import heapq
+from functools import reduce
+from operator import or_
+
 import netaddr
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.postgres.indexes import GistIndex, OpClass
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import F
+from django.db.models import F, Q
 from django.db.models.functions import Cast
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from core.models import ObjectType
 from dcim.models.mixins import CachedScopeMixin
+from ipam.allocation import AvailableSpace
 from ipam.choices import *
 from ipam.constants import *
+from ipam.context import duplicate_checks_deferred
 from ipam.fields import IPNetworkField, IPAddressField
-from ipam.lookups import Host
+from ipam.lookups import Host, Inet
 from ipam.managers import IPAddressManager
-from ipam.querysets import PrefixQuerySet
+from ipam.querysets import AggregateQuerySet, PrefixQuerySet
 from ipam.validators import DNSValidator
 from netbox.config import get_config
 from netbox.models import OrganizationalModel, PrimaryModel
@@ -32,9 +39,9 @@ __all__ = (
 
 class GetAvailablePrefixesMixin:
 
-    def get_available_prefixes(self):
+    def get_available_prefix_space(self):
         """
-        Return all available prefixes within this Aggregate or Prefix as an IPSet.
+        Return the space within this Aggregate or Prefix which is not occupied by a child prefix as an AvailableSpace.
         """
         params = {
             'prefix__net_contained': str(self.prefix)
@@ -42,17 +49,25 @@ class GetAvailablePrefixesMixin:
         if hasattr(self, 'vrf'):
             params['vrf'] = self.vrf
 
-        child_prefixes = Prefix.objects.filter(**params).values_list('prefix', flat=True)
-        return netaddr.IPSet(self.prefix) - netaddr.IPSet(child_prefixes)
+        child_prefixes = Prefix.objects.filter(**params).order_by('prefix').values_list('prefix', flat=True)
+        return AvailableSpace(
+            self.prefix.version,
+            self.prefix.first,
+            self.prefix.last,
+            ((prefix.first, prefix.last) for prefix in child_prefixes.iterator())
+        )
+
+    def get_available_prefixes(self):
+        """
+        Return all available prefixes within this Aggregate or Prefix as an IPSet.
+        """
+        return netaddr.IPSet(self.get_available_prefix_space().iter_cidrs())
 
     def get_first_available_prefix(self):
         """
         Return the first available child prefix within the prefix (or None).
         """
-        available_prefixes = self.get_available_prefixes()
-        if not available_prefixes:
-            return None
-        return available_prefixes.iter_cidrs()[0]
+        return next(self.get_available_prefix_space().iter_cidrs(), None)
 
 
 class RIR(OrganizationalModel):
@@ -100,6 +115,8 @@ class Aggregate(ContactsMixin, GetAvailablePrefixesMixin, PrimaryModel):
         null=True
     )
 
+    objects = AggregateQuerySet.as_manager()
+
     clone_fields = (
         'rir', 'tenant', 'date_added', 'description',
     )
@@ -109,6 +126,9 @@ class Aggregate(ContactsMixin, GetAvailablePrefixesMixin, PrimaryModel):
 
     class Meta:
         ordering = ('prefix', 'pk')  # prefix may be non-unique
+        indexes = (
+            GistIndex(OpClass('prefix', name='inet_ops'), name='ipam_aggregate_prefix_gist'),
+        )
         verbose_name = _('aggregate')
         verbose_name_plural = _('aggregates')
 
@@ -172,6 +192,10 @@ class Aggregate(ContactsMixin, GetAvailablePrefixesMixin, PrimaryModel):
         """
         Determine the prefix utilization of the aggregate and return it as a percentage.
         """
+        # Use the utilization annotated by AggregateQuerySet.annotate_utilization(), if present
+        if hasattr(self, 'utilization'):
+            return self.utilization
+
         queryset = Prefix.objects.filter(prefix__net_contained_or_equal=str(self.prefix))
         child_prefixes = netaddr.IPSet([p.prefix for p in queryset])
         utilization = float(child_prefixes.size) / self.prefix.size * 100
@@ -274,6 +298,9 @@ class Prefix(ContactsMixin, GetAvailablePrefixesMixin, CachedScopeMixin, Primary
 
     class Meta:
         ordering = (F('vrf').asc(nulls_first=True), 'prefix', 'pk')  # (vrf, prefix) may be non-unique
+        indexes = (
+            GistIndex(OpClass('prefix', name='inet_ops'), name='ipam_prefix_prefix_gist'),
+        )
         verbose_name = _('prefix')
         verbose_name_plural = _('prefixes')
 
@@ -299,16 +326,10 @@ class Prefix(ContactsMixin, GetAvailablePrefixesMixin, CachedScopeMixin, Primary
                 })
 
             # Enforce unique IP space (if applicable)
-            if (self.vrf is None and get_config().ENFORCE_GLOBAL_UNIQUE) or (self.vrf and self.vrf.enforce_unique):
+            if self.enforce_unique and not duplicate_checks_deferred.get():
                 duplicate_prefixes = self.get_duplicates()
                 if duplicate_prefixes:
-                    table = _("VRF {vrf}").format(vrf=self.vrf) if self.vrf else _("global table")
-                    raise ValidationError({
-                        'prefix': _("Duplicate prefix found in {table}: {prefix}").format(
-                            table=table,
-                            prefix=duplicate_prefixes.first(),
-                        )
-                    })
+                    raise self._get_duplicate_error(duplicate_prefixes.first())
 
     def save(self, *args, **kwargs):
 
@@ -370,9 +391,58 @@ class Prefix(ContactsMixin, GetAvailablePrefixesMixin, CachedScopeMixin, Primary
             f'prefix__{lookup}': self.prefix
         })
 
+    @property
+    def enforce_unique(self):
+        """
+        Indicates whether unique IP space is enforced within the Prefix's VRF (or the global table).
+        """
+        return self.vrf.enforce_unique if self.vrf else get_config().ENFORCE_GLOBAL_UNIQUE
+
     def get_duplicates(self):
         return Prefix.objects.filter(vrf=self.vrf, prefix=str(self.prefix)).exclude(pk=self.pk)
 
+    def _get_duplicate_error(self, duplicate):
+        table = _("VRF {vrf}").format(vrf=self.vrf) if self.vrf else _("global table")
+        return ValidationError({
+            'prefix': _("Duplicate prefix found in {table}: {prefix}").format(
+                table=table,
+                prefix=duplicate,
+            )
+        })
+
+    @classmethod
+    def check_duplicates(cls, prefixes):
+        """
+        Enforce unique IP space (where applicable) for many Prefixes at once, checking them against existing Prefixes
+        and against one another with a single query. Returns a dict mapping the position of each Prefix which duplicates
+        an existing Prefix (or one earlier in the list) to a ValidationError.
+        """
+        keys = {
+            i: (prefix.vrf_id, str(prefix.prefix))
+            for i, prefix in enumerate(prefixes) if prefix.prefix and prefix.enforce_unique
+        }
+        vrf_prefixes = {}
+        for vrf_id, prefix in keys.values():
+            vrf_prefixes.setdefault(vrf_id, set()).add(prefix)
+
+        # Find any existing Prefixes (other than those being checked) which might be duplicated
+        seen = {}
+        if vrf_prefixes:
+            existing_prefixes = cls.objects.filter(reduce(or_, (
+                Q(vrf=vrf_id, prefix__in=list(vrf_prefix_set)) for vrf_id, vrf_prefix_set in vrf_prefixes.items()
+            ))).exclude(pk__in=[prefix.pk for prefix in prefixes if prefix.pk])
+            for vrf_id, prefix in existing_prefixes.values_list('vrf', 'prefix'):
+                seen.setdefault((vrf_id, str(prefix)), prefix)
+
+        errors = {}
+        for i, key in keys.items():
+            if key in seen:
+                errors[i] = prefixes[i]._get_duplicate_error(seen[key])
+            else:
+                seen[key] = prefixes[i].prefix
+
+        return errors
+
     def get_child_prefixes(self):
         """
         Return all Prefixes within this Prefix and VRF. If this Prefix is a container in the global table, return child
@@ -403,46 +473,50 @@ class Prefix(ContactsMixin, GetAvailablePrefixesMixin, CachedScopeMixin, Primary
         else:
             return IPAddress.objects.filter(address__net_host_contained=str(self.prefix), vrf=self.vrf)
 
-    def get_available_ips(self):
+    def get_available_ip_space(self):
         """
-        Return all available IPs within this prefix as an IPSet.
+        Return the space within this prefix which is not occupied by a child IP address or range as an AvailableSpace.
         """
-        if self.mark_utilized:
-            return netaddr.IPSet()
+        first, last = self.prefix.first, self.prefix.last
 
-        prefix = netaddr.IPSet(self.prefix)
-        child_ips = netaddr.IPSet([ip.address.ip for ip in self.get_child_ips()])
-        child_ranges = []
-        for iprange in self.get_child_ranges():
-            child_ranges.append(iprange.range)
-        available_ips = prefix - child_ips - netaddr.IPSet(child_ranges)
+        if self.mark_utilized:
+            return AvailableSpace(self.family, first, last, [(first, last)])
 
         # IPv6 /127's, pool, or IPv4 /31-/32 sets are fully usable
-        if (self.family == 6 and self.prefix.prefixlen >= 127) or self.is_pool or (
+        if not ((self.family == 6 and self.prefix.prefixlen >= 127) or self.is_pool or (
                 self.family == 4 and self.prefix.prefixlen >= 31
-        ):
-            return available_ips
-
-        if self.family == 4:
-            # For "normal" IPv4 prefixes, omit first and last addresses
-            available_ips -= netaddr.IPSet([
-                netaddr.IPAddress(self.prefix.first),
-                netaddr.IPAddress(self.prefix.last),
-            ])
-        else:
-            # For IPv6 prefixes, omit the Subnet-Router anycast address
-            # per RFC 4291
-            available_ips -= netaddr.IPSet([netaddr.IPAddress(self.prefix.first)])
-        return available_ips
+        )):
+            if self.family == 4:
+                # For "normal" IPv4 prefixes, omit first and last addresses
+                first, last = first + 1, last - 1
+            else:
+                # For IPv6 prefixes, omit the Subnet-Router anycast address
+                # per RFC 4291
+                first += 1
+
+        # Merge child IPs and ranges in order of their (first) host address
+        child_ips = self.get_child_ips().values_list('address', flat=True)
+        child_ranges = self.get_child_ranges().order_by(Inet(Host('start_address'))).values_list(
+            'start_address', 'end_address'
+        )
+        return AvailableSpace(self.family, first, last, heapq.merge(
+            ((address.value, address.value) for address in child_ips.iterator()),
+            ((start.value, end.value) for start, end in child_ranges.iterator())
+        ))
+
+    def get_available_ips(self):
+        """
+        Return all available IPs within this prefix as an IPSet.
+        """
+        return netaddr.IPSet(self.get_available_ip_space().iter_cidrs())
 
     def get_first_available_ip(self):
         """
         Return the first available IP within the prefix (or None).
         """
-        available_ips = self.get_available_ips()
-        if not available_ips:
+        if (available_ip := next(iter(self.get_available_ip_space()), None)) is None:
             return None
-        return '{}/{}'.format(next(available_ips.__iter__()), self.prefix.prefixlen)
+        return '{}/{}'.format(available_ip, self.prefix.prefixlen)
 
     def get_utilization(self):
         """
@@ -452,6 +526,10 @@ class Prefix(ContactsMixin, GetAvailablePrefixesMixin, CachedScopeMixin, Primary
         if self.mark_utilized:
             return 100
 
+        # Use the utilization annotated by PrefixQuerySet.annotate_utilization(), if present
+        if hasattr(self, 'utilization'):
+            return self.utilization
+
         if self.status == PrefixStatusChoices.STATUS_CONTAINER:
             queryset = Prefix.objects.filter(
                 prefix__net_contained=str(self.prefix),
@@ -531,6 +609,9 @@ class IPRange(ContactsMixin, PrimaryModel):
 
     class Meta:
         ordering = (F('vrf').asc(nulls_first=True), 'start_address', 'pk')  # (vrf, start_address) may be non-unique
+        indexes = (
+            GistIndex(OpClass('start_address', name='inet_ops'), name='ipam_iprange_start_address_gist'),
+        )
         verbose_name = _('IP range')
         verbose_name_plural = _('IP ranges')
 
@@ -659,25 +740,33 @@ class IPRange(ContactsMixin, PrimaryModel):
             vrf=self.vrf
         )
 
+    def get_available_ip_space(self):
+        """
+        Return the space within this range which is not occupied by a child IP address as an AvailableSpace.
+        """
+        child_ips = self.get_child_ips().values_list('address', flat=True)
+        return AvailableSpace(
+            self.family,
+            self.start_address.ip.value,
+            self.end_address.ip.value,
+            ((address.value, address.value) for address in child_ips.iterator())
+        )
+
     def get_available_ips(self):
         """
         Return all available IPs within this range as an IPSet.
         """
-        range = netaddr.IPRange(self.start_address.ip, self.end_address.ip)
-        child_ips = netaddr.IPSet([ip.address.ip for ip in self.get_child_ips()])
-
-        return netaddr.IPSet(range) - child_ips
+        return netaddr.IPSet(self.get_available_ip_space().iter_cidrs())
 
     @cached_property
     def first_available_ip(self):
         """
         Return the first available IP within the range (or None).
         """
-        available_ips = self.get_available_ips()
-        if not available_ips:
+        if (available_ip := next(iter(self.get_available_ip_space()), None)) is None:
             return None
 
-        return '{}/{}'.format(next(available_ips.__iter__()), self.start_address.prefixlen)
+        return '{}/{}'.format(available_ip, self.start_address.prefixlen)
 
     @cached_property
     def utilization(self):
@@ -783,6 +872,7 @@ class IPAddress(ContactsMixin, PrimaryModel):
         ordering = ('address', 'pk')  # address may be non-unique
         indexes = (
             models.Index(Cast(Host('address'), output_field=IPAddressField()), name='ipam_ipaddress_host'),
+            GistIndex(OpClass('address', name='inet_ops'), name='ipam_ipaddress_address_gist'),
             models.Index(fields=('assigned_object_type', 'assigned_object_id')),
         )
         verbose_name = _('IP address')
@@ -798,12 +888,67 @@ class IPAddress(ContactsMixin, PrimaryModel):
         self._original_assigned_object_id = self.__dict__.get('assigned_object_id')
         self._original_assigned_object_type_id = self.__dict__.get('assigned_object_type_id')
 
+    @property
+    def enforce_unique(self):
+        """
+        Indicates whether unique IP space is enforced within the IP address's VRF (or the global table).
+        """
+        return self.vrf.enforce_unique if self.vrf else get_config().ENFORCE_GLOBAL_UNIQUE
+
     def get_duplicates(self):
         return IPAddress.objects.filter(
             vrf=self.vrf,
             address__net_host=str(self.address.ip)
         ).exclude(pk=self.pk)
 
+    def _get_duplicate_error(self, duplicate):
+        table = _("VRF {vrf}").format(vrf=self.vrf) if self.vrf else _("global table")
+        return ValidationError({
+            'address': _("Duplicate IP address found in {table}: {ipaddress}").format(
+                table=table,
+                ipaddress=duplicate,
+            )
+        })
+
+    @classmethod
+    def check_duplicates(cls, ipaddresses):
+        """
+        Enforce unique IP space (where applicable) for many IP addresses at once, checking them against existing IP
+        addresses and against one another with a single query. Returns a dict mapping the position of each IP address
+        which duplicates an existing IP address (or one earlier in the list) to a ValidationError. As in clean(),
+        duplicates are permitted only if all the IP addresses involved have a non-unique role (e.g. VIP).
+        """
+        keys = {
+            i: (ip.vrf_id, str(ip.address.ip))
+            for i, ip in enumerate(ipaddresses) if ip.address and ip.enforce_unique
+        }
+        vrf_hosts = {}
+        for vrf_id, host in keys.values():
+            vrf_hosts.setdefault(vrf_id, set()).add(host)
+
+        # Find any existing IP addresses (other than those being checked) which might be duplicated
+        seen = {}
+        if vrf_hosts:
+            existing_ips = cls.objects.filter(reduce(or_, (
+                Q(vrf=vrf_id, address__net_in=list(hosts)) for vrf_id, hosts in vrf_hosts.items()
+            ))).exclude(pk__in=[ip.pk for ip in ipaddresses if ip.pk])
+            for vrf_id, address, role in existing_ips.values_list('vrf', 'address', 'role'):
+                seen.setdefault((vrf_id, str(address.ip)), []).append((address, role))
+
+        errors = {}
+        for i, key in keys.items():
+            ip = ipaddresses[i]
+            duplicates = seen.setdefault(key, [])
+            if duplicates and (
+                    ip.role not in IPADDRESS_ROLES_NONUNIQUE or
+                    any(role not in IPADDRESS_ROLES_NONUNIQUE for address, role in duplicates)
+            ):
+                errors[i] = ip._get_duplicate_error(duplicates[0][0])
+            else:
+                duplicates.append((ip.address, ip.role))
+
+        return errors
+
     def get_next_available_ip(self):
         """
         Return the next available IP address within this IP's network (if any)
@@ -862,19 +1007,13 @@ class IPAddress(ContactsMixin, PrimaryModel):
                     raise ValidationError(msg)
 
             # Enforce unique IP space (if applicable)
-            if (self.vrf is None and get_config().ENFORCE_GLOBAL_UNIQUE) or (self.vrf and self.vrf.enforce_unique):
+            if self.enforce_unique and not duplicate_checks_deferred.get():
                 duplicate_ips = self.get_duplicates()
                 if duplicate_ips and (
                         self.role not in IPADDRESS_ROLES_NONUNIQUE or
                         any(dip.role not in IPADDRESS_ROLES_NONUNIQUE for dip in duplicate_ips)
                 ):
-                    table = _("VRF {vrf}").format(vrf=self.vrf) if self.vrf else _("global table")
-                    raise ValidationError({
-                        'address': _("Duplicate IP address found in {table}: {ipaddress}").format(
-                            table=table,
-                            ipaddress=duplicate_ips.first(),
-                        )
-                    })
+                    raise self._get_duplicate_error(duplicate_ips.first())
 
         if self._original_assigned_object_id and self._original_assigned_object_type_id:
             parent = getattr(self.assigned_object, 'parent_object', None)
@@ -8,6 +8,7 @@ from django.db.backends.postgresql.psycopg_any import NumericRange
 from django.utils.translation import gettext_lazy as _
 
 from dcim.models import Interface, Site, SiteGroup
+from ipam.allocation import iter_set_bits
 from ipam.choices import *
 from ipam.constants import *
 from ipam.querysets import VLANQuerySet, VLANGroupQuerySet
@@ -29,6 +30,10 @@ def default_vid_ranges():
     ]
 
 
+def default_vid_bitmap():
+    return bytes(VLAN_VID_BITMAP_SIZE)
+
+
 class VLANGroup(OrganizationalModel):
     """
     A VLAN group is an arbitrary collection of VLANs within which VLAN IDs and names must be unique. Each group must
@@ -67,6 +72,15 @@ class VLANGroup(OrganizationalModel):
         default=VLAN_VID_MAX - VLAN_VID_MIN + 1
     )
 
+    # Bitmap of the VLAN IDs in use within the group, and the number of VLANs assigned to it. These are maintained
+    # automatically as VLANs are created, modified, and deleted.
+    _vid_bitmap = models.BinaryField(
+        default=default_vid_bitmap
+    )
+    _vlan_count = models.PositiveIntegerField(
+        default=0
+    )
+
     objects = VLANGroupQuerySet.as_manager()
 
     class Meta:
@@ -128,29 +142,56 @@ class VLANGroup(OrganizationalModel):
         for vid_range in self.vid_ranges:
             self._total_vlan_ids += vid_range.upper - vid_range.lower + 1
 
+        # Avoid overwriting the VLAN ID bitmap & count (which are updated directly) with potentially stale values
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('_vid_bitmap', '_vlan_count')
+            ]
+
         super().save(*args, **kwargs)
 
+    def serialize_object(self, exclude=None):
+        return super().serialize_object(exclude=[*(exclude or []), '_vid_bitmap', '_vlan_count'])
+
+    def get_vid_bounds(self):
+        """
+        Return the first and last VLAN IDs (inclusive) of each of the group's VLAN ID ranges.
+        """
+        return [
+            (
+                vid_range.lower if vid_range.lower_inc else vid_range.lower + 1,
+                vid_range.upper if vid_range.upper_inc else vid_range.upper - 1,
+            )
+            for vid_range in self.vid_ranges
+        ]
+
+    def get_vid_bitmap(self):
+        """
+        Return an integer in which bit N is set if VLAN ID N is in use within this group. The bitmap is always read
+        from the database, so that it reflects any VLANs created since the group was retrieved.
+        """
+        if self.pk:
+            self.refresh_from_db(fields=('_vid_bitmap',))
+        return int.from_bytes(self._vid_bitmap, 'little')
+
+    def _get_available_vid_bitmap(self):
+        vid_mask = 0
+        for lower, upper in self.get_vid_bounds():
+            vid_mask |= (1 << (upper + 1)) - (1 << lower)
+        return vid_mask & ~self.get_vid_bitmap()
+
     def get_available_vids(self):
         """
         Return all available VLANs within this group.
         """
-        available_vlans = set()
-        for vlan_range in self.vid_ranges:
-            available_vlans = available_vlans.union({
-                vid for vid in range(vlan_range.lower, vlan_range.upper)
-            })
-        available_vlans -= set(VLAN.objects.filter(group=self).values_list('vid', flat=True))
-
-        return sorted(available_vlans)
+        return list(iter_set_bits(self._get_available_vid_bitmap()))
 
     def get_next_available_vid(self):
         """
         Return the first available VLAN ID (1-4094) in the group.
         """
-        available_vids = self.get_available_vids()
-        if available_vids:
-            return available_vids[0]
-        return None
+        return next(iter_set_bits(self._get_available_vid_bitmap()), None)
 
     def get_child_vlans(self):
         """
@@ -273,6 +314,13 @@ class VLAN(PrimaryModel):
         verbose_name = _('VLAN')
         verbose_name_plural = _('VLANs')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Cache the original group and VLAN ID so we can check if they have changed on post_save
+        self._group_id = self.__dict__.get('group_id')
+        self._vid = self.__dict__.get('vid')
+
     def __str__(self):
         return f'{self.name} ({self.vid})'
 
@@ -1,13 +1,15 @@
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models import BinaryField, Count, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Value
 from django.db.models.expressions import RawSQL
 from django.db.models.functions import Round
 
-from utilities.query import count_related
 from utilities.querysets import RestrictedQuerySet
+from .allocation import vids_to_bitmap
+from .choices import PrefixStatusChoices
 
 __all__ = (
     'ASNRangeQuerySet',
+    'AggregateQuerySet',
     'PrefixQuerySet',
     'VLANGroupQuerySet',
     'VLANQuerySet',
@@ -32,6 +34,56 @@ class ASNRangeQuerySet(RestrictedQuerySet):
         return self.annotate(asn_count=Subquery(asns))
 
 
+# The depth of a Prefix (the number of distinct containing prefixes) and its number of child prefixes, within its VRF.
+# Cast null VRF values to zero for comparison (NULL != NULL).
+PREFIX_DEPTH_SQL = (
+    'SELECT COUNT(DISTINCT U0."prefix") AS "c" '
+    'FROM "ipam_prefix" U0 '
+    'WHERE (U0."prefix" >> "ipam_prefix"."prefix" '
+    'AND COALESCE(U0."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0))'
+)
+PREFIX_CHILDREN_SQL = (
+    'SELECT COUNT(U1."prefix") AS "c" '
+    'FROM "ipam_prefix" U1 '
+    'WHERE (U1."prefix" << "ipam_prefix"."prefix" '
+    'AND COALESCE(U1."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0))'
+)
+
+# The number of addresses within a network (as NUMERIC, to accommodate IPv6)
+NETWORK_SIZE_SQL = 'POWER(2::numeric, (CASE FAMILY({0}) WHEN 4 THEN 32 ELSE 128 END) - MASKLEN({0}))'
+
+# The total size of all distinct child prefixes within a network which are not themselves contained by another child
+# prefix (i.e. the size of their union). Format with the network and an additional filter condition.
+PREFIX_COVERAGE_SQL = (
+    'SELECT COALESCE(SUM(' + NETWORK_SIZE_SQL.format('P."prefix"') + '), 0) FROM ('
+    'SELECT DISTINCT U0."prefix" FROM "ipam_prefix" U0 '
+    'WHERE U0."prefix" {lookup} {network} {condition} AND NOT EXISTS ('
+    'SELECT 1 FROM "ipam_prefix" U1 '
+    'WHERE U1."prefix" {lookup} {network} AND U1."prefix" >> U0."prefix" {condition_u1}'
+    ')) P'
+)
+
+
+class AggregateQuerySet(RestrictedQuerySet):
+
+    def annotate_utilization(self):
+        """
+        Annotate the utilization (as a percentage) of each Aggregate by child prefixes.
+        """
+        return self.annotate(
+            utilization=RawSQL(
+                'SELECT LEAST(100, ({}) * 100 / {})::double precision'.format(
+                    PREFIX_COVERAGE_SQL.format(
+                        lookup='<<=', network='"ipam_aggregate"."prefix"', condition='', condition_u1=''
+                    ),
+                    NETWORK_SIZE_SQL.format('"ipam_aggregate"."prefix"')
+                ),
+                (),
+                output_field=FloatField()
+            )
+        )
+
+
 class PrefixQuerySet(RestrictedQuerySet):
 
     def annotate_hierarchy(self):
@@ -40,19 +92,70 @@ class PrefixQuerySet(RestrictedQuerySet):
         comparison. (NULL != NULL).
         """
         return self.annotate(
-            hierarchy_depth=RawSQL(
-                'SELECT COUNT(DISTINCT U0."prefix") AS "c" '
-                'FROM "ipam_prefix" U0 '
-                'WHERE (U0."prefix" >> "ipam_prefix"."prefix" '
-                'AND COALESCE(U0."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0))',
-                ()
-            ),
-            hierarchy_children=RawSQL(
-                'SELECT COUNT(U1."prefix") AS "c" '
-                'FROM "ipam_prefix" U1 '
-                'WHERE (U1."prefix" << "ipam_prefix"."prefix" '
-                'AND COALESCE(U1."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0))',
-                ()
+            hierarchy_depth=RawSQL(PREFIX_DEPTH_SQL, ()),
+            hierarchy_children=RawSQL(PREFIX_CHILDREN_SQL, ())
+        )
+
+    def update_hierarchy(self):
+        """
+        Recalculate and save the depth and number of child prefixes for each Prefix in a single UPDATE.
+        """
+        return self.update(
+            _depth=RawSQL(PREFIX_DEPTH_SQL, ()),
+            _children=RawSQL(PREFIX_CHILDREN_SQL, ())
+        )
+
+    def annotate_utilization(self):
+        """
+        Annotate the utilization (as a percentage) of each Prefix, computed for all Prefixes in a single query. This
+        mirrors Prefix.get_utilization(): Utilization of container prefixes is determined by child prefixes, and that
+        of all other prefixes by child IP ranges and IP addresses.
+        """
+        prefix_size = NETWORK_SIZE_SQL.format('"ipam_prefix"."prefix"')
+        same_vrf = 'AND COALESCE({}."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0)'
+
+        # Child prefixes (for containers)
+        prefixes_used = PREFIX_COVERAGE_SQL.format(
+            lookup='<<',
+            network='"ipam_prefix"."prefix"',
+            condition=same_vrf.format('U0'),
+            condition_u1=same_vrf.format('U1')
+        )
+
+        # Child IP ranges & IP addresses (for all other prefixes). IP ranges within a VRF may not overlap, so only
+        # IP addresses outside any child range need to be counted separately. As with the net_host_contained lookup,
+        # each host comparison is preceded by an overlap (&&) test which can be served by a GiST inet_ops index.
+        child_range = (
+            '{0}."start_address" && "ipam_prefix"."prefix" '
+            'AND COALESCE({0}."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0) '
+            'AND CAST(HOST({0}."start_address") AS INET) <<= "ipam_prefix"."prefix" '
+            'AND CAST(HOST({0}."end_address") AS INET) <<= "ipam_prefix"."prefix"'
+        )
+        ips_used = (
+            '(SELECT COALESCE(SUM(U2."size"), 0) FROM "ipam_iprange" U2 WHERE ' + child_range.format('U2') + ') + '
+            '(SELECT COUNT(DISTINCT HOST(U3."address")) FROM "ipam_ipaddress" U3 '
+            'WHERE U3."address" && "ipam_prefix"."prefix" '
+            'AND CAST(HOST(U3."address") AS INET) <<= "ipam_prefix"."prefix" ' + same_vrf.format('U3') + ' '
+            'AND NOT EXISTS (SELECT 1 FROM "ipam_iprange" U4 WHERE ' + child_range.format('U4') + ' '
+            'AND CAST(HOST(U3."address") AS INET) '
+            'BETWEEN CAST(HOST(U4."start_address") AS INET) AND CAST(HOST(U4."end_address") AS INET)))'
+        )
+        # Exclude the network & broadcast addresses of IPv4 prefixes larger than /31 (unless the prefix is a pool)
+        ips_available = (
+            f'{prefix_size} - (CASE WHEN FAMILY("ipam_prefix"."prefix") = 4 AND MASKLEN("ipam_prefix"."prefix") < 31 '
+            f'AND NOT "ipam_prefix"."is_pool" THEN 2 ELSE 0 END)'
+        )
+
+        return self.annotate(
+            utilization=RawSQL(
+                'SELECT (CASE '
+                'WHEN "ipam_prefix"."mark_utilized" THEN 100 '
+                'WHEN "ipam_prefix"."status" = %s '
+                f'THEN LEAST(100, ({prefixes_used}) * 100 / {prefix_size}) '
+                f'ELSE LEAST(100, ({ips_used}) * 100 / ({ips_available})) '
+                'END)::double precision',
+                (PrefixStatusChoices.STATUS_CONTAINER,),
+                output_field=FloatField()
             )
         )
 
@@ -60,16 +163,50 @@ class PrefixQuerySet(RestrictedQuerySet):
 class VLANGroupQuerySet(RestrictedQuerySet):
 
     def annotate_utilization(self):
-        from .models import VLAN
-
         return self.annotate(
-            vlan_count=count_related(VLAN, 'group'),
-            utilization=Round(F('vlan_count') * 100.0 / F('_total_vlan_ids'), 2)
+            vlan_count=F('_vlan_count'),
+            utilization=Round(F('_vlan_count') * 100.0 / F('_total_vlan_ids'), 2)
         )
 
+    def update_vid(self, vid, in_use=True):
+        """
+        Set (or clear) the bit for the specified VLAN ID in the bitmap of each VLANGroup, adjusting its VLAN count to
+        match. This is idempotent: Marking a VLAN ID which is already in use has no effect.
+        """
+        bit = Func(F('_vid_bitmap'), Value(vid), function='get_bit', output_field=IntegerField())
+        return self.update(
+            _vid_bitmap=Func(
+                F('_vid_bitmap'), Value(vid), Value(int(in_use)), function='set_bit', output_field=BinaryField()
+            ),
+            _vlan_count=F('_vlan_count') + (1 - bit if in_use else -bit)
+        )
+
+    def rebuild_vid_bitmaps(self):
+        """
+        Recalculate the bitmap of VLAN IDs in use (and the VLAN count) of each VLANGroup from its child VLANs.
+        """
+        from .models import VLAN
+
+        group_vids = {pk: [] for pk in self.values_list('pk', flat=True)}
+        for group_id, vid in VLAN.objects.filter(group__in=group_vids).values_list('group', 'vid'):
+            group_vids[group_id].append(vid)
+        for pk, vids in group_vids.items():
+            self.model.objects.filter(pk=pk).update(_vid_bitmap=vids_to_bitmap(vids), _vlan_count=len(vids))
+
 
 class VLANQuerySet(RestrictedQuerySet):
 
+    def bulk_create(self, objs, *args, **kwargs):
+        from .models import VLANGroup
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+
+        # Signals are not sent for bulk creation, so update the VLAN ID bitmaps of any affected VLANGroups directly
+        if group_ids := {obj.group_id for obj in objs if obj.group_id}:
+            VLANGroup.objects.filter(pk__in=group_ids).rebuild_vid_bitmaps()
+
+        return objs
+
     def get_for_site(self, site):
         """
         Return all VLANs in the specified site
@@ -1,29 +1,29 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
 from dcim.models import Device
 from virtualization.models import VirtualMachine
-from .models import IPAddress, Prefix
+from .models import IPAddress, Prefix, VLAN, VLANGroup
 
 
-def update_parents_children(prefix):
+def update_surrounding_hierarchy(prefix, delta):
     """
-    Update depth on prefix & containing prefixes
+    Adjust the hierarchy of the prefixes surrounding a prefix which has been added to (delta=1) or removed from
+    (delta=-1) its VRF, using one UPDATE for all containing prefixes and another for all contained prefixes. The prefix
+    itself is excluded. (Values are clamped at zero to tolerate counts which have already drifted, e.g. as the result
+    of a bulk creation.)
     """
-    parents = prefix.get_parents(include_self=True).annotate_hierarchy()
-    for parent in parents:
-        parent._children = parent.hierarchy_children
-    Prefix.objects.bulk_update(parents, ['_children'], batch_size=100)
+    prefixes = Prefix.objects.filter(vrf_id=prefix.vrf_id).exclude(pk=prefix.pk)
 
+    # Each containing prefix gains/loses a child
+    prefixes.filter(prefix__net_contains=prefix.prefix).update(_children=Greatest(F('_children') + delta, 0))
 
-def update_children_depth(prefix):
-    """
-    Update children count on prefix & contained prefixes
-    """
-    children = prefix.get_children(include_self=True).annotate_hierarchy()
-    for child in children:
-        child._depth = child.hierarchy_depth
-    Prefix.objects.bulk_update(children, ['_depth'], batch_size=100)
+    # Each contained prefix moves one level deeper/shallower, unless a duplicate of the prefix exists (depth counts
+    # only distinct containing prefixes)
+    if not prefixes.filter(prefix=prefix.prefix).exists():
+        prefixes.filter(prefix__net_contained=prefix.prefix).update(_depth=Greatest(F('_depth') + delta, 0))
 
 
 @receiver(post_save, sender=Prefix)
@@ -32,21 +32,47 @@ def handle_prefix_saved(instance, created, **kwargs):
     # Prefix has changed (or new instance has been created)
     if created or instance.vrf_id != instance._vrf_id or instance.prefix != instance._prefix:
 
-        update_parents_children(instance)
-        update_children_depth(instance)
-
-        # If this is not a new prefix, clean up parent/children of previous prefix
+        # If this is not a new prefix, remove the previous prefix from the hierarchy
         if not created:
-            old_prefix = Prefix(vrf_id=instance._vrf_id, prefix=instance._prefix)
-            update_parents_children(old_prefix)
-            update_children_depth(old_prefix)
+            update_surrounding_hierarchy(Prefix(pk=instance.pk, vrf_id=instance._vrf_id, prefix=instance._prefix), -1)
+
+        update_surrounding_hierarchy(instance, 1)
+        Prefix.objects.filter(pk=instance.pk).update_hierarchy()
+
+        # Reset the cached prefix & VRF so that the change is not applied again on subsequent saves
+        instance._prefix = instance.prefix
+        instance._vrf_id = instance.vrf_id
 
 
 @receiver(post_delete, sender=Prefix)
 def handle_prefix_deleted(instance, **kwargs):
 
-    update_parents_children(instance)
-    update_children_depth(instance)
+    update_surrounding_hierarchy(instance, -1)
+
+
+@receiver(post_save, sender=VLAN)
+def handle_vlan_saved(instance, created, **kwargs):
+
+    # VLAN group or ID has changed (or new instance has been created)
+    if created or instance.group_id != instance._group_id or instance.vid != instance._vid:
+
+        # If this is not a new VLAN, release its previous VLAN ID
+        if not created and instance._group_id and instance._vid is not None:
+            VLANGroup.objects.filter(pk=instance._group_id).update_vid(instance._vid, in_use=False)
+
+        if instance.group_id:
+            VLANGroup.objects.filter(pk=instance.group_id).update_vid(instance.vid)
+
+        # Reset the cached group & VLAN ID so that the change is not applied again on subsequent saves
+        instance._group_id = instance.group_id
+        instance._vid = instance.vid
+
+
+@receiver(post_delete, sender=VLAN)
+def handle_vlan_deleted(instance, **kwargs):
+
+    if instance.group_id:
+        VLANGroup.objects.filter(pk=instance.group_id).update_vid(instance.vid, in_use=False)
 
 
 @receiver(pre_delete, sender=IPAddress)
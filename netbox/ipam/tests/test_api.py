@@ -4,10 +4,12 @@ from django.urls import reverse
 from netaddr import IPNetwork
 from rest_framework import status
 
+from core.models import ObjectType
 from dcim.models import Device, DeviceRole, DeviceType, Interface, Manufacturer, Site
 from ipam.choices import *
 from ipam.models import *
 from tenancy.models import Tenant
+from users.models import ObjectPermission
 from utilities.data import string_to_ranges
 from utilities.testing import APITestCase, APIViewTestCases, create_test_device, disable_warnings
 
@@ -382,6 +384,22 @@ class PrefixTest(APIViewTestCases.APIViewTestCase):
         )
         Prefix.objects.bulk_create(prefixes)
 
+    def test_utilization(self):
+        """
+        Test that utilization is included only where it has been computed for all objects at once.
+        """
+        Prefix.objects.filter(prefix='192.168.1.0/24').update(mark_utilized=True)
+        self.add_permissions('ipam.view_prefix', 'ipam.add_prefix')
+
+        response = self.client.get(self._get_list_url(), **self.header)
+        utilization = {p['prefix']: p['utilization'] for p in response.data['results']}
+        self.assertEqual(utilization['192.168.1.0/24'], 100)
+        self.assertEqual(utilization['192.168.2.0/24'], 0)
+
+        response = self.client.post(self._get_list_url(), self.create_data[0], format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.assertNotIn('utilization', response.data)
+
     def test_list_available_prefixes(self):
         """
         Test retrieval of all available prefixes within a parent prefix.
@@ -532,6 +550,166 @@ class PrefixTest(APIViewTestCases.APIViewTestCase):
         self.assertHttpStatus(response, status.HTTP_201_CREATED)
         self.assertEqual(len(response.data), 8)
 
+    def test_prefix_tree(self):
+        """
+        Test the streaming of the prefix hierarchy within a VRF.
+        """
+        vrf = VRF.objects.create(name='VRF 1')
+        aggregate = Aggregate.objects.create(
+            prefix=IPNetwork('10.0.0.0/8'), rir=RIR.objects.create(name='RIR 1', slug='rir-1')
+        )
+        for prefix in ('10.0.0.0/8', '10.1.0.0/16', '10.1.1.0/24', '10.1.2.0/24', '10.2.0.0/16', '172.16.0.0/12'):
+            Prefix.objects.create(prefix=IPNetwork(prefix), vrf=vrf)
+        url = reverse('ipam-api:prefix-tree')
+        self.add_permissions('ipam.view_prefix', 'ipam.view_vrf', 'ipam.view_aggregate')
+
+        def get_tree(**params):
+            response = self.client.get(url, {'vrf_id': vrf.pk, **params}, **self.header)
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            return b''.join(response.streaming_content).decode()
+
+        def flatten(nodes):
+            return [(node['prefix'], flatten(node['child_prefixes'])) for node in nodes]
+
+        # Nested JSON
+        tree = json.loads(get_tree())
+        self.assertEqual(flatten(tree), [
+            ('10.0.0.0/8', [
+                ('10.1.0.0/16', [('10.1.1.0/24', []), ('10.1.2.0/24', [])]),
+                ('10.2.0.0/16', []),
+            ]),
+            ('172.16.0.0/12', []),
+        ])
+        self.assertEqual(tree[0]['children'], 4)
+        self.assertEqual(tree[0]['child_prefixes'][0]['_depth'], 1)
+
+        # Depth limit and aggregate
+        tree = json.loads(get_tree(max_depth=1, aggregate_id=aggregate.pk))
+        self.assertEqual(flatten(tree), [('10.0.0.0/8', [('10.1.0.0/16', []), ('10.2.0.0/16', [])])])
+
+        # NDJSON
+        lines = get_tree(format='ndjson').splitlines()
+        self.assertEqual([json.loads(line)['prefix'] for line in lines], [
+            '10.0.0.0/8', '10.1.0.0/16', '10.1.1.0/24', '10.1.2.0/24', '10.2.0.0/16', '172.16.0.0/12',
+        ])
+
+        # Global table
+        tree = json.loads(get_tree(vrf_id='null'))
+        self.assertEqual([node['prefix'] for node in tree], ['192.168.1.0/24', '192.168.2.0/24', '192.168.3.0/24'])
+
+    def test_prefix_tree_constrained(self):
+        """
+        Test that prefixes are not nested within unrelated prefixes when the user cannot view an intermediate prefix.
+        """
+        vrf = VRF.objects.create(name='VRF 1')
+        Prefix.objects.create(prefix=IPNetwork('10.0.0.0/16'), vrf=vrf)
+        Prefix.objects.create(prefix=IPNetwork('10.1.0.0/16'), vrf=vrf, status=PrefixStatusChoices.STATUS_RESERVED)
+        Prefix.objects.create(prefix=IPNetwork('10.1.0.0/24'), vrf=vrf)
+        obj_perm = ObjectPermission(
+            name='View active prefixes',
+            constraints={'status': PrefixStatusChoices.STATUS_ACTIVE},
+            actions=['view']
+        )
+        obj_perm.save()
+        obj_perm.users.add(self.user)
+        obj_perm.object_types.add(ObjectType.objects.get_for_model(Prefix))
+        self.add_permissions('ipam.view_vrf')
+
+        response = self.client.get(reverse('ipam-api:prefix-tree'), {'vrf_id': vrf.pk}, **self.header)
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        tree = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            [(node['prefix'], node['child_prefixes']) for node in tree],
+            [('10.0.0.0/16', []), ('10.1.0.0/24', [])]
+        )
+
+    def test_bulk_allocate_available_prefixes(self):
+        """
+        Test the allocation of available prefixes from multiple parent prefixes in a single request.
+        """
+        vrf = VRF.objects.create(name='VRF 1')
+        prefix1 = Prefix.objects.create(prefix=IPNetwork('192.0.2.0/28'), vrf=vrf)
+        prefix2 = Prefix.objects.create(prefix=IPNetwork('2001:db8::/120'))
+        url = reverse('ipam-api:available-prefixes')
+        self.add_permissions('ipam.view_prefix', 'ipam.add_prefix')
+
+        # Try to allocate five /30s from a /28 (only four are available)
+        data = [
+            {'parent': prefix1.pk, 'prefix_length': 30, 'count': 5},
+            {'parent': prefix2.pk, 'prefix_length': 127, 'count': 4},
+        ]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_409_CONFLICT)
+        self.assertEqual(Prefix.objects.count(), 2)
+
+        # Allocate prefixes of differing lengths from both parents
+        data = [
+            {'parent': prefix1.pk, 'prefix_length': 31, 'count': 2, 'description': 'Link'},
+            {'parent': prefix2.pk, 'prefix_length': 127, 'count': 4},
+            {'parent': prefix1.pk, 'prefix_length': 30, 'count': 3},
+        ]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual([p['prefix'] for p in response.data], [
+            '192.0.2.0/31', '192.0.2.2/31',
+            '2001:db8::/127', '2001:db8::2/127', '2001:db8::4/127', '2001:db8::6/127',
+            '192.0.2.4/30', '192.0.2.8/30', '192.0.2.12/30',
+        ])
+        self.assertEqual(response.data[0]['vrf']['id'], vrf.pk)
+        self.assertEqual(response.data[0]['description'], 'Link')
+        self.assertIsNone(response.data[2]['vrf'])
+
+        # Invalid prefix length for the parent
+        data = [{'parent': prefix1.pk, 'prefix_length': 64}]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+
+        # Errors should be attributed to the request from which the invalid objects were allocated
+        Prefix.objects.filter(prefix__net_contained=prefix2.prefix).delete()
+        data = [
+            {'parent': prefix2.pk, 'prefix_length': 127, 'count': 2},
+            {'parent': prefix2.pk, 'prefix_length': 127, 'count': 2, 'status': 'invalid'},
+        ]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('status', response.data[1])
+
+    def test_bulk_allocate_available_ips(self):
+        """
+        Test the allocation of available IP addresses from multiple parent prefixes in a single request.
+        """
+        prefix1 = Prefix.objects.create(prefix=IPNetwork('192.0.2.0/29'), is_pool=True)
+        prefix2 = Prefix.objects.create(prefix=IPNetwork('198.51.100.0/29'))
+        url = reverse('ipam-api:available-ips')
+        self.add_permissions('ipam.view_prefix', 'ipam.add_ipaddress')
+
+        # Try to allocate seven IPs from a /29 which is not a pool (only six are available)
+        data = [
+            {'parent': prefix1.pk, 'count': 8},
+            {'parent': prefix2.pk, 'count': 7},
+        ]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_409_CONFLICT)
+        self.assertFalse(IPAddress.objects.exists())
+
+        # Allocate all available IPs from both parents
+        data = [
+            {'parent': prefix1.pk, 'count': 8, 'description': 'Pool'},
+            {'parent': prefix2.pk, 'count': 6},
+        ]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 14)
+        self.assertEqual(response.data[0]['address'], '192.0.2.0/29')
+        self.assertEqual(response.data[0]['description'], 'Pool')
+        self.assertEqual(response.data[8]['address'], '198.51.100.1/29')
+
+        # Nonexistent parent
+        response = self.client.post(url, [{'parent': 0}], format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+
 
 class IPRangeTest(APIViewTestCases.APIViewTestCase):
     model = IPRange
@@ -717,6 +895,31 @@ class IPAddressTest(APIViewTestCases.APIViewTestCase):
         response = self.client.patch(url, data, format='json', **self.header)
         self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
 
+    def test_bulk_create_duplicates(self):
+        """
+        Check that duplicate IP addresses are reported for the offending items when creating IP addresses in bulk.
+        """
+        url = reverse('ipam-api:ipaddress-list')
+        self.add_permissions('ipam.add_ipaddress')
+
+        # Duplicates an existing IP address
+        response = self.client.post(url, {'address': '192.168.0.1/32'}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('address', response.data)
+
+        # Duplicates an earlier IP address in the request
+        data = [
+            {'address': '192.168.0.4/24'},
+            {'address': '192.168.0.5/24'},
+            {'address': '192.168.0.4/25'},
+        ]
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1], {})
+        self.assertIn('address', response.data[2])
+        self.assertEqual(IPAddress.objects.count(), 3)
+
 
 class FHRPGroupTest(APIViewTestCases.APIViewTestCase):
     model = FHRPGroup
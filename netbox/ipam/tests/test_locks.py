@@ -0,0 +1,53 @@
+from django.test import TestCase
+from netaddr import IPNetwork, IPRange
+
+from ipam.locks import get_allocation_locks
+
+
+class AllocationLockTestCase(TestCase):
+
+    def assertContend(self, span1, span2, lock_name='available-ips'):
+        """
+        Assert that allocations within the two spans require at least one conflicting lock.
+        """
+        locks1 = dict(get_allocation_locks(lock_name, [span1]))
+        locks2 = dict(get_allocation_locks(lock_name, [span2]))
+        self.assertTrue(any(
+            not (locks1[lock_id] and locks2[lock_id]) for lock_id in set(locks1) & set(locks2)
+        ))
+
+    def assertNotContend(self, span1, span2, lock_name='available-ips'):
+        locks1 = dict(get_allocation_locks(lock_name, [span1]))
+        locks2 = dict(get_allocation_locks(lock_name, [span2]))
+        self.assertTrue(all(
+            locks1[lock_id] and locks2[lock_id] for lock_id in set(locks1) & set(locks2)
+        ))
+
+    def test_unrelated_prefixes(self):
+        self.assertNotContend((None, IPNetwork('10.0.0.0/24')), (None, IPNetwork('10.0.1.0/24')))
+        self.assertNotContend((None, IPNetwork('2001:db8:0:1::/64')), (None, IPNetwork('2001:db8:0:2::/64')))
+
+    def test_different_vrfs(self):
+        self.assertNotContend((1, IPNetwork('10.0.0.0/24')), (2, IPNetwork('10.0.0.0/24')))
+        self.assertNotContend((None, IPNetwork('10.0.0.0/8')), (1, IPNetwork('10.0.0.0/24')))
+
+    def test_overlapping_prefixes(self):
+        self.assertContend((None, IPNetwork('10.0.0.0/24')), (None, IPNetwork('10.0.0.0/26')))
+        self.assertContend((None, IPNetwork('10.0.0.0/24')), (None, IPNetwork('10.0.0.5/32')))
+        self.assertContend((None, IPNetwork('10.0.0.0/16')), (None, IPNetwork('10.0.7.5/32')))
+        self.assertContend((None, IPNetwork('10.0.0.0/16')), (None, IPNetwork('10.1.0.0/16')))
+        self.assertContend((None, IPRange('10.0.0.200', '10.0.1.50')), (None, IPNetwork('10.0.1.0/24')))
+
+    def test_prefix_allocation(self):
+        self.assertNotContend(
+            (None, IPNetwork('10.0.0.0/16')), (None, IPNetwork('10.1.0.0/16')), lock_name='available-prefixes'
+        )
+        self.assertContend(
+            (None, IPNetwork('10.0.0.0/16')), (None, IPNetwork('10.0.1.0/24')), lock_name='available-prefixes'
+        )
+
+    def test_many_blocks(self):
+        spans = [(None, IPNetwork(f'10.0.{i}.1/32')) for i in range(100)]
+        self.assertEqual(get_allocation_locks('available-ips', spans), [
+            get_allocation_locks('available-ips', [(None, IPNetwork('10.0.0.0/16'))])[0]
+        ])
@@ -1,12 +1,19 @@
+import itertools
+
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from netaddr import IPNetwork, IPSet
 from utilities.data import string_to_ranges
 
 from dcim.models import Site, SiteGroup
+from ipam.allocation import iter_set_bits
 from ipam.choices import *
+from ipam.constants import VLAN_VID_BITMAP_SIZE
 from ipam.models import *
+from ipam.utils import rebuild_prefixes
 
 
 class TestAggregate(TestCase):
@@ -37,6 +44,24 @@ class TestAggregate(TestCase):
         ))
         self.assertEqual(aggregate.get_utilization(), 100)
 
+    def test_annotate_utilization(self):
+        rir = RIR.objects.create(name='RIR 1', slug='rir-1')
+        aggregates = (
+            Aggregate(prefix=IPNetwork('10.0.0.0/8'), rir=rir),
+            Aggregate(prefix=IPNetwork('2001:db8::/32'), rir=rir),
+        )
+        Aggregate.objects.bulk_create(aggregates)
+        Prefix.objects.bulk_create((
+            Prefix(prefix=IPNetwork('10.0.0.0/9')),
+            Prefix(prefix=IPNetwork('10.0.0.0/10')),  # Overlaps with 10.0.0.0/9
+            Prefix(prefix=IPNetwork('10.128.0.0/10'), vrf=VRF.objects.create(name='VRF 1')),
+            Prefix(prefix=IPNetwork('2001:db8::/34')),
+        ))
+
+        for aggregate in Aggregate.objects.annotate_utilization():
+            self.assertEqual(aggregate.get_utilization(), Aggregate.objects.get(pk=aggregate.pk).get_utilization())
+        self.assertEqual(Aggregate.objects.annotate_utilization().get(pk=aggregates[0].pk).utilization, 75)
+
 
 class TestIPRange(TestCase):
 
@@ -229,6 +254,47 @@ class TestPrefix(TestCase):
 
         self.assertEqual(available_ips, missing_ips)
 
+    def test_get_available_ip_space_ipv6(self):
+
+        parent_prefix = Prefix.objects.create(prefix=IPNetwork('2001:db8::/64'))
+        IPAddress.objects.bulk_create((
+            IPAddress(address=IPNetwork('2001:db8::1/64')),
+            IPAddress(address=IPNetwork('2001:db8::2/128')),
+            IPAddress(address=IPNetwork('2001:db8::4/64')),
+        ))
+        IPRange.objects.create(
+            start_address=IPNetwork('2001:db8::5/64'),
+            end_address=IPNetwork('2001:db8::10/64')
+        )
+        available_ips = parent_prefix.get_available_ip_space()
+
+        self.assertEqual(
+            [str(ip) for ip in itertools.islice(available_ips, 3)],
+            ['2001:db8::3', '2001:db8::11', '2001:db8::12']
+        )
+        self.assertEqual(available_ips.size, 2 ** 64 - 1 - 3 - 12)
+
+    def test_allocate_available_prefixes(self):
+
+        prefixes = Prefix.objects.bulk_create((
+            Prefix(prefix=IPNetwork('10.0.0.0/16')),  # Parent prefix
+            Prefix(prefix=IPNetwork('10.0.0.0/20')),
+            Prefix(prefix=IPNetwork('10.0.32.0/20')),
+            Prefix(prefix=IPNetwork('10.0.128.0/18')),
+        ))
+        available_space = prefixes[0].get_available_prefix_space()
+
+        self.assertEqual(
+            available_space.allocate_prefixes([24, 18, 20, 20]),
+            [
+                IPNetwork('10.0.16.0/24'),
+                IPNetwork('10.0.64.0/18'),
+                IPNetwork('10.0.48.0/20'),
+                IPNetwork('10.0.192.0/20'),
+            ]
+        )
+        self.assertIsNone(available_space.allocate_prefixes([18, 18, 18]))
+
     def test_get_first_available_prefix(self):
 
         prefixes = Prefix.objects.bulk_create((
@@ -292,6 +358,33 @@ class TestPrefix(TestCase):
         IPRange.objects.create(start_address=IPNetwork('10.0.0.33/24'), end_address=IPNetwork('10.0.0.64/24'))
         self.assertEqual(prefix.get_utilization(), 64 / 254 * 100)  # ~25% utilization
 
+    def test_annotate_utilization(self):
+        vrf = VRF.objects.create(name='VRF 1')
+        Prefix.objects.bulk_create((
+            Prefix(prefix=IPNetwork('10.0.0.0/16'), status=PrefixStatusChoices.STATUS_CONTAINER),
+            Prefix(prefix=IPNetwork('10.0.0.0/24')),
+            Prefix(prefix=IPNetwork('10.0.0.0/25')),  # Nested within 10.0.0.0/24
+            Prefix(prefix=IPNetwork('10.0.1.0/24'), is_pool=True),
+            Prefix(prefix=IPNetwork('10.0.2.0/24'), mark_utilized=True),
+            Prefix(prefix=IPNetwork('10.0.3.0/24'), vrf=vrf),
+            Prefix(prefix=IPNetwork('2001:db8::/120')),
+        ))
+        IPRange.objects.create(start_address=IPNetwork('10.0.0.33/24'), end_address=IPNetwork('10.0.0.64/24'))
+        IPAddress.objects.bulk_create([
+            # Includes IPs within the child range, which should not be counted twice
+            *[IPAddress(address=IPNetwork(f'10.0.0.{i}/24')) for i in range(1, 49)],
+            *[IPAddress(address=IPNetwork(f'10.0.1.{i}/24')) for i in range(0, 16)],
+            *[IPAddress(address=IPNetwork(f'10.0.3.{i}/24'), vrf=vrf) for i in range(1, 9)],
+            *[IPAddress(address=IPNetwork(f'2001:db8::{i}/64')) for i in range(1, 17)],
+        ])
+
+        for prefix in Prefix.objects.annotate_utilization():
+            self.assertAlmostEqual(
+                prefix.get_utilization(),
+                Prefix.objects.get(pk=prefix.pk).get_utilization(),
+                msg=f'Utilization of {prefix} does not match'
+            )
+
     #
     # Uniqueness enforcement tests
     #
@@ -319,6 +412,43 @@ class TestPrefix(TestCase):
         duplicate_prefix = Prefix(vrf=vrf, prefix=IPNetwork('192.0.2.0/24'))
         self.assertRaises(ValidationError, duplicate_prefix.clean)
 
+    def test_check_duplicates(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1', enforce_unique=False)
+        existing_prefix = Prefix.objects.create(prefix=IPNetwork('192.0.2.0/24'))
+        prefixes = [
+            existing_prefix,                                        # Matches only itself
+            Prefix(prefix=IPNetwork('192.0.2.0/24')),               # Duplicates an existing prefix
+            Prefix(prefix=IPNetwork('198.51.100.0/24')),
+            Prefix(prefix=IPNetwork('198.51.100.0/24')),            # Duplicates an earlier prefix
+            Prefix(vrf=vrf, prefix=IPNetwork('198.51.100.0/24')),   # Uniqueness not enforced
+            Prefix(vrf=vrf, prefix=IPNetwork('198.51.100.0/24')),
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            errors = Prefix.check_duplicates(prefixes)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "ipam_prefix"' in q['sql']]), 1)
+        self.assertEqual(sorted(errors), [1, 3])
+        self.assertIn('prefix', errors[1].message_dict)
+
+        with override_settings(ENFORCE_GLOBAL_UNIQUE=False):
+            self.assertEqual(Prefix.check_duplicates(prefixes), {})
+
+    def test_containment_lookups_indexed(self):
+        Prefix.objects.bulk_create((
+            Prefix(prefix=IPNetwork('10.0.0.0/8')),
+            Prefix(prefix=IPNetwork('10.1.0.0/16')),
+            Prefix(prefix=IPNetwork('192.0.2.0/24')),
+        ))
+        queryset = Prefix.objects.filter(prefix__net_contains_or_equals='10.1.2.0/24').order_by('prefix')
+        self.assertEqual([str(p.prefix) for p in queryset], ['10.0.0.0/8', '10.1.0.0/16'])
+
+        # Containment tests must be served by the GiST index
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for lookup in ('net_contains_or_equals', 'net_contains', 'net_contained', 'net_contained_or_equal'):
+            plan = Prefix.objects.filter(**{f'prefix__{lookup}': '10.1.0.0/16'}).order_by().explain()
+            self.assertIn('ipam_prefix_prefix_gist', plan)
+
 
 class TestPrefixHierarchy(TestCase):
     """
@@ -517,6 +647,69 @@ class TestPrefixHierarchy(TestCase):
         self.assertEqual(prefixes[3]._depth, 2)
         self.assertEqual(prefixes[3]._children, 0)
 
+    def test_delete_duplicate_prefix4(self):
+        # Duplicate 10.0.0.0/16, then delete the original
+        duplicate_prefix = Prefix(prefix='10.0.0.0/16')
+        duplicate_prefix.save()
+        Prefix.objects.filter(prefix='10.0.0.0/16').exclude(pk=duplicate_prefix.pk).delete()
+
+        prefixes = Prefix.objects.filter(prefix__family=4)
+        self.assertEqual(prefixes[0].prefix, IPNetwork('10.0.0.0/8'))
+        self.assertEqual(prefixes[0]._depth, 0)
+        self.assertEqual(prefixes[0]._children, 2)
+        self.assertEqual(prefixes[1].prefix, IPNetwork('10.0.0.0/16'))
+        self.assertEqual(prefixes[1]._depth, 1)
+        self.assertEqual(prefixes[1]._children, 1)
+        self.assertEqual(prefixes[2].prefix, IPNetwork('10.0.0.0/24'))
+        self.assertEqual(prefixes[2]._depth, 2)
+        self.assertEqual(prefixes[2]._children, 0)
+
+    def test_save_prefix_repeatedly(self):
+        # Create 10.0.0.0/12 and save it twice more
+        prefix = Prefix(prefix=IPNetwork('10.0.0.1/12'))
+        prefix.save()
+        prefix.save()
+        prefix.prefix = '10.0.0.0/12'
+        prefix.save()
+
+        prefixes = Prefix.objects.filter(prefix__family=4)
+        self.assertEqual(prefixes[0]._children, 3)
+        self.assertEqual(prefixes[1]._depth, 1)
+        self.assertEqual(prefixes[1]._children, 2)
+        self.assertEqual(prefixes[2]._depth, 2)
+        self.assertEqual(prefixes[3]._depth, 3)
+
+    def test_rebuild_prefixes(self):
+        Prefix.objects.create(prefix='10.0.0.0/16')  # Duplicate
+        Prefix.objects.update(_depth=0, _children=0)
+
+        self.assertEqual(rebuild_prefixes(None), 7)
+
+        prefixes = Prefix.objects.filter(prefix__family=4)
+        self.assertEqual(prefixes[0].prefix, IPNetwork('10.0.0.0/8'))
+        self.assertEqual(prefixes[0]._depth, 0)
+        self.assertEqual(prefixes[0]._children, 3)
+        for prefix in prefixes[1:3]:
+            self.assertEqual(prefix.prefix, IPNetwork('10.0.0.0/16'))
+            self.assertEqual(prefix._depth, 1)
+            self.assertEqual(prefix._children, 1)
+        self.assertEqual(prefixes[3].prefix, IPNetwork('10.0.0.0/24'))
+        self.assertEqual(prefixes[3]._depth, 2)
+        self.assertEqual(prefixes[3]._children, 0)
+
+    def test_hierarchy_update_count(self):
+        # The hierarchy should be updated using a fixed number of statements, regardless of the tree's size
+        def count_updates(queries):
+            return len([q for q in queries if q['sql'].startswith('UPDATE "ipam_prefix"')])
+
+        with CaptureQueriesContext(connection) as queries:
+            prefix = Prefix.objects.create(prefix='10.0.0.0/12')
+        self.assertEqual(count_updates(queries), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            prefix.delete()
+        self.assertEqual(count_updates(queries), 2)
+
 
 class TestIPAddress(TestCase):
 
@@ -571,6 +764,39 @@ class TestIPAddress(TestCase):
         IPAddress.objects.create(address=IPNetwork('192.0.2.1/24'), role=IPAddressRoleChoices.ROLE_VIP)
         IPAddress.objects.create(address=IPNetwork('192.0.2.1/24'), role=IPAddressRoleChoices.ROLE_VIP)
 
+    def test_check_duplicates(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1', enforce_unique=True)
+        IPAddress.objects.create(address=IPNetwork('192.0.2.1/24'))
+        IPAddress.objects.create(address=IPNetwork('192.0.2.2/24'), role=IPAddressRoleChoices.ROLE_VIP)
+        ips = [
+            IPAddress(address=IPNetwork('192.0.2.1/32')),                                    # Existing (any mask)
+            IPAddress(address=IPNetwork('192.0.2.2/24'), role=IPAddressRoleChoices.ROLE_VIP),  # Non-unique role
+            IPAddress(vrf=vrf, address=IPNetwork('192.0.2.1/24')),
+            IPAddress(vrf=vrf, address=IPNetwork('192.0.2.1/25')),                           # Earlier IP in VRF
+            IPAddress(address=IPNetwork('2001:db8::1/64')),
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            errors = IPAddress.check_duplicates(ips)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "ipam_ipaddress"' in q['sql']]), 1)
+        self.assertEqual(sorted(errors), [0, 3])
+        self.assertIn('address', errors[3].message_dict)
+
+    def test_net_host_contained(self):
+        IPAddress.objects.bulk_create((
+            IPAddress(address=IPNetwork('192.0.2.1/24')),
+            IPAddress(address=IPNetwork('192.0.2.65/24')),
+            IPAddress(address=IPNetwork('192.0.0.1/16')),  # Network overlaps the parent, but the host does not
+            IPAddress(address=IPNetwork('198.51.100.1/24')),
+        ))
+        queryset = IPAddress.objects.filter(address__net_host_contained='192.0.2.0/26').order_by()
+        self.assertEqual([str(ip.address) for ip in queryset], ['192.0.2.1/24'])
+
+        # The containment test must be served by the GiST index
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('ipam_ipaddress_address_gist', queryset.explain())
+
 
 class TestVLANGroup(TestCase):
 
@@ -603,6 +829,51 @@ class TestVLANGroup(TestCase):
         VLAN.objects.create(name='VLAN 104', vid=104, group=vlangroup)
         self.assertEqual(vlangroup.get_next_available_vid(), 105)
 
+    def test_vid_bitmap(self):
+        vlangroup = VLANGroup.objects.first()
+        vlangroup2 = VLANGroup.objects.create(name='VLAN Group 2', slug='vlan-group-2')
+
+        def assertVIDs(group, vids):
+            group.refresh_from_db()
+            self.assertEqual(list(iter_set_bits(group.get_vid_bitmap())), vids)
+            self.assertEqual(group._vlan_count, len(vids))
+
+        # VLANs created in bulk
+        assertVIDs(vlangroup, [100, 101, 102, 103])
+
+        # Create a VLAN
+        vlan = VLAN.objects.create(name='VLAN 150', vid=150, group=vlangroup)
+        assertVIDs(vlangroup, [100, 101, 102, 103, 150])
+
+        # Change the VLAN ID
+        vlan.vid = 160
+        vlan.save()
+        vlan.save()
+        assertVIDs(vlangroup, [100, 101, 102, 103, 160])
+
+        # Move the VLAN to another group
+        vlan.group = vlangroup2
+        vlan.save()
+        assertVIDs(vlangroup, [100, 101, 102, 103])
+        assertVIDs(vlangroup2, [160])
+
+        # Saving the group must not overwrite its bitmap
+        vlangroup.vid_ranges = string_to_ranges('100-299')
+        vlangroup._vid_bitmap = bytes(VLAN_VID_BITMAP_SIZE)
+        vlangroup.save()
+        assertVIDs(vlangroup, [100, 101, 102, 103])
+
+        # Delete a VLAN
+        VLAN.objects.filter(vid=101).delete()
+        assertVIDs(vlangroup, [100, 102, 103])
+        self.assertEqual(VLANGroup.objects.annotate_utilization().get(pk=vlangroup.pk).vlan_count, 3)
+
+        # Rebuild the bitmaps from scratch
+        VLANGroup.objects.update(_vid_bitmap=bytes(VLAN_VID_BITMAP_SIZE), _vlan_count=0)
+        VLANGroup.objects.rebuild_vid_bitmaps()
+        assertVIDs(vlangroup, [100, 102, 103])
+        assertVIDs(vlangroup2, [160])
+
     def test_vid_validation(self):
         vlangroup = VLANGroup.objects.first()
 
@@ -1,5 +1,11 @@
+import heapq
+import itertools
+import operator
+
 import netaddr
+from django.db import connection, transaction
 
+from .allocation import iter_gaps, iter_set_bits
 from .constants import *
 from .models import Prefix, VLAN
 
@@ -7,10 +13,13 @@ __all__ = (
     'add_available_ipaddresses',
     'add_available_vlans',
     'add_requested_prefixes',
-    'get_next_available_prefix',
+    'get_prefix_hierarchy',
     'rebuild_prefixes',
 )
 
+# Number of prefixes read and written per batch when rebuilding the prefix hierarchy
+PREFIX_REBUILD_BATCH_SIZE = 10000
+
 
 def add_requested_prefixes(parent, prefix_list, show_available=True, show_assigned=True):
     """
@@ -45,102 +54,45 @@ def add_requested_prefixes(parent, prefix_list, show_available=True, show_assign
 def add_available_ipaddresses(prefix, ipaddress_list, is_pool=False):
     """
     Annotate ranges of available IP addresses within a given prefix. If is_pool is True, the first and last IP will be
-    considered usable (regardless of mask length).
+    considered usable (regardless of mask length). IP addresses must be ordered by host address.
     """
-
-    output = []
-    prev_ip = None
-
     # Ignore the network and broadcast addresses for non-pool IPv4 prefixes larger than /31.
     if prefix.version == 4 and prefix.prefixlen < 31 and not is_pool:
-        first_ip_in_prefix = netaddr.IPAddress(prefix.first + 1)
-        last_ip_in_prefix = netaddr.IPAddress(prefix.last - 1)
+        first_ip_in_prefix, last_ip_in_prefix = prefix.first + 1, prefix.last - 1
     else:
-        first_ip_in_prefix = netaddr.IPAddress(prefix.first)
-        last_ip_in_prefix = netaddr.IPAddress(prefix.last)
-
-    if not ipaddress_list:
-        return [(
-            int(last_ip_in_prefix - first_ip_in_prefix + 1),
-            '{}/{}'.format(first_ip_in_prefix, prefix.prefixlen)
-        )]
-
-    # Account for any available IPs before the first real IP
-    if ipaddress_list[0].address.ip > first_ip_in_prefix:
-        skipped_count = int(ipaddress_list[0].address.ip - first_ip_in_prefix)
-        first_skipped = '{}/{}'.format(first_ip_in_prefix, prefix.prefixlen)
-        output.append((skipped_count, first_skipped))
-
-    # Iterate through existing IPs and annotate free ranges
-    for ip in ipaddress_list:
-        if prev_ip:
-            diff = int(ip.address.ip - prev_ip.address.ip)
-            if diff > 1:
-                first_skipped = '{}/{}'.format(prev_ip.address.ip + 1, prefix.prefixlen)
-                output.append((diff - 1, first_skipped))
-        output.append(ip)
-        prev_ip = ip
-
-    # Include any remaining available IPs
-    if prev_ip.address.ip < last_ip_in_prefix:
-        skipped_count = int(last_ip_in_prefix - prev_ip.address.ip)
-        first_skipped = '{}/{}'.format(prev_ip.address.ip + 1, prefix.prefixlen)
-        output.append((skipped_count, first_skipped))
-
-    return output
-
-
-def available_vlans_from_range(vlans, vlan_group, vid_range):
-    """
-    Create fake records for all gaps between used VLANs
-    """
-    min_vid = int(vid_range.lower) if vid_range else VLAN_VID_MIN
-    max_vid = int(vid_range.upper) if vid_range else VLAN_VID_MAX
+        first_ip_in_prefix, last_ip_in_prefix = prefix.first, prefix.last
 
-    if not vlans:
-        return [{
-            'vid': min_vid,
-            'vlan_group': vlan_group,
-            'available': max_vid - min_vid
-        }]
-
-    prev_vid = min_vid - 1
-    new_vlans = []
-    for vlan in vlans:
-
-        # Ignore VIDs outside the range
-        if not min_vid <= vlan.vid < max_vid:
-            continue
-
-        # Annotate any available VIDs between the previous (or minimum) VID
-        # and the current VID
-        if vlan.vid - prev_vid > 1:
-            new_vlans.append({
-                'vid': prev_vid + 1,
-                'vlan_group': vlan_group,
-                'available': vlan.vid - prev_vid - 1,
-            })
-
-        prev_vid = vlan.vid
-
-    # Annotate any remaining available VLANs
-    if prev_vid < max_vid:
-        new_vlans.append({
-            'vid': prev_vid + 1,
-            'vlan_group': vlan_group,
-            'available': max_vid - prev_vid - 1,
-        })
+    ipaddress_list = [(ip.address.value, ip) for ip in ipaddress_list]
+    available_ranges = [
+        (start, (end - start + 1, '{}/{}'.format(netaddr.IPAddress(start, prefix.version), prefix.prefixlen)))
+        for start, end in iter_gaps(
+            first_ip_in_prefix,
+            last_ip_in_prefix,
+            ((value, value) for value, ip in ipaddress_list)
+        )
+    ]
 
-    return new_vlans
+    # Interleave IP addresses and available ranges
+    return [
+        item for value, item in heapq.merge(ipaddress_list, available_ranges, key=operator.itemgetter(0))
+    ]
 
 
 def add_available_vlans(vlans, vlan_group):
     """
-    Create fake records for all gaps between used VLANs
+    Create fake records for all gaps between used VLANs. Gaps are determined from the VLAN group's bitmap of VLAN IDs
+    in use, so the VLANs provided need not include every VLAN in the group.
     """
-    new_vlans = []
-    for vid_range in vlan_group.vid_ranges:
-        new_vlans.extend(available_vlans_from_range(vlans, vlan_group, vid_range))
+    used_vids = list(iter_set_bits(vlan_group.get_vid_bitmap()))
+    new_vlans = [
+        {
+            'vid': start,
+            'vlan_group': vlan_group,
+            'available': end - start + 1,
+        }
+        for lower, upper in vlan_group.get_vid_bounds()
+        for start, end in iter_gaps(lower, upper, ((vid, vid) for vid in used_vids))
+    ]
 
     vlans = list(vlans) + new_vlans
     vlans.sort(key=lambda v: v.vid if type(v) is VLAN else v['vid'])
@@ -148,73 +100,72 @@ def add_available_vlans(vlans, vlan_group):
     return vlans
 
 
-def rebuild_prefixes(vrf):
+def get_prefix_hierarchy(prefixes):
     """
-    Rebuild the prefix hierarchy for all prefixes in the specified VRF (or global table).
+    Given an iterable of (pk, prefix) tuples sorted by prefix, yield a (pk, depth, children) tuple for each prefix in a
+    single pass. Depth counts distinct containing prefixes, whereas children counts all contained prefixes (including
+    duplicates).
     """
-    def contains(parent, child):
-        return child in parent and child != parent
-
-    def push_to_stack(prefix):
-        # Increment child count on parent nodes
-        for n in stack:
-            n['children'] += 1
-        stack.append({
-            'pk': [prefix['pk']],
-            'prefix': prefix['prefix'],
-            'children': 0,
-        })
-
+    # Each node on the stack is [prefix, pks, position]: position records the number of prefixes seen when the node
+    # was pushed, so that its children can be counted as the number of prefixes seen since (less its own duplicates).
     stack = []
-    update_queue = []
-    prefixes = Prefix.objects.filter(vrf=vrf).values('pk', 'prefix')
+    seen = 0
 
-    # Iterate through all Prefixes in the VRF, growing and shrinking the stack as we go
-    for i, p in enumerate(prefixes):
+    def pop():
+        prefix, pks, position = stack.pop()
+        children = seen - position - len(pks)
+        for pk in pks:
+            yield pk, len(stack), children
 
-        # Grow the stack if this is a child of the most recent prefix
-        if not stack or contains(stack[-1]['prefix'], p['prefix']):
-            push_to_stack(p)
+    for pk, prefix in prefixes:
 
-        # Handle duplicate prefixes
-        elif stack[-1]['prefix'] == p['prefix']:
-            stack[-1]['pk'].append(p['pk'])
+        # Pop nodes from the stack until we reach a parent prefix (or a duplicate, or the root)
+        while stack:
+            parent = stack[-1][0]
+            if parent.version == prefix.version and parent.first <= prefix.first and prefix.last <= parent.last:
+                break
+            yield from pop()
 
-        # If this is a sibling or parent of the most recent prefix, pop nodes from the
-        # stack until we reach a parent prefix (or the root)
+        if stack and stack[-1][0] == prefix:
+            stack[-1][1].append(pk)
         else:
-            while stack and not contains(stack[-1]['prefix'], p['prefix']):
-                node = stack.pop()
-                for pk in node['pk']:
-                    update_queue.append(
-                        Prefix(pk=pk, _depth=len(stack), _children=node['children'])
-                    )
-            push_to_stack(p)
-
-        # Flush the update queue once it reaches 100 Prefixes
-        if len(update_queue) >= 100:
-            Prefix.objects.bulk_update(update_queue, ['_depth', '_children'])
-            update_queue = []
+            stack.append([prefix, [pk], seen])
+        seen += 1
 
     # Clear out any prefixes remaining in the stack
     while stack:
-        node = stack.pop()
-        for pk in node['pk']:
-            update_queue.append(
-                Prefix(pk=pk, _depth=len(stack), _children=node['children'])
-            )
+        yield from pop()
 
-    # Final flush of any remaining Prefixes
-    Prefix.objects.bulk_update(update_queue, ['_depth', '_children'])
 
-
-def get_next_available_prefix(ipset, prefix_size):
+def rebuild_prefixes(vrf):
     """
-    Given a prefix length, allocate the next available prefix from an IPSet.
+    Rebuild the prefix hierarchy for all prefixes in the specified VRF (or global table). The hierarchy is computed in
+    a single ordered pass over the VRF's prefixes, copied into a temporary table, and written with one UPDATE. Returns
+    the number of prefixes which were updated.
     """
-    for available_prefix in ipset.iter_cidrs():
-        if prefix_size >= available_prefix.prefixlen:
-            allocated_prefix = f"{available_prefix.network}/{prefix_size}"
-            ipset.remove(allocated_prefix)
-            return allocated_prefix
-    return None
+    prefixes = Prefix.objects.filter(vrf=vrf).order_by('prefix', 'pk').values_list('pk', 'prefix')
+    hierarchy = get_prefix_hierarchy(prefixes.iterator(chunk_size=PREFIX_REBUILD_BATCH_SIZE))
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE "ipam_prefix_hierarchy" '
+                '("id" bigint PRIMARY KEY, "depth" smallint NOT NULL, "children" bigint NOT NULL)'
+            )
+
+            # Write the hierarchy in batches, to avoid holding an entire VRF in memory
+            while batch := list(itertools.islice(hierarchy, PREFIX_REBUILD_BATCH_SIZE)):
+                with cursor.copy('COPY "ipam_prefix_hierarchy" ("id", "depth", "children") FROM STDIN') as copy:
+                    for row in batch:
+                        copy.write_row(row)
+
+            cursor.execute(
+                'UPDATE "ipam_prefix" SET "_depth" = H."depth", "_children" = H."children" '
+                'FROM "ipam_prefix_hierarchy" H '
+                'WHERE "ipam_prefix"."id" = H."id" '
+                'AND ("ipam_prefix"."_depth" <> H."depth" OR "ipam_prefix"."_children" <> H."children")'
+            )
+            updated_count = cursor.rowcount
+            cursor.execute('DROP TABLE "ipam_prefix_hierarchy"')
+
+    return updated_count
@@ -1,4 +1,5 @@
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 from django.db.models import Prefetch
 from django.db.models.expressions import RawSQL
 from django.shortcuts import get_object_or_404, redirect, render
@@ -21,10 +22,30 @@ from virtualization.models import VMInterface
 from . import filtersets, forms, tables
 from .choices import PrefixStatusChoices
 from .constants import *
+from .context import defer_duplicate_checks
 from .models import *
 from .utils import add_requested_prefixes, add_available_ipaddresses, add_available_vlans
 
 
+class BulkImportDuplicateCheckMixin:
+    """
+    Check all imported Prefixes or IP addresses for duplicate IP space at once, rather than querying for the duplicates
+    of each object as it is validated.
+    """
+    def create_and_update_objects(self, form, request):
+        with defer_duplicate_checks():
+            saved_objects = super().create_and_update_objects(form, request)
+
+        if errors := self.queryset.model.check_duplicates(saved_objects):
+            for i, error in sorted(errors.items()):
+                for field, messages in error.message_dict.items():
+                    for message in messages:
+                        form.add_error(None, f'Record {i + 1} {field}: {message}')
+            raise ValidationError("")
+
+        return saved_objects
+
+
 #
 # VRFs
 #
@@ -355,6 +376,12 @@ class AggregateListView(generic.ObjectListView):
     filterset_form = forms.AggregateFilterForm
     table = tables.AggregateTable
 
+    def get_table(self, data, request, bulk_actions=True):
+        # Compute utilization for all listed objects at once, if the utilization column is displayed
+        if self.table(data, user=request.user).columns['utilization'].visible:
+            data = data.annotate_utilization()
+        return super().get_table(data, request, bulk_actions)
+
 
 @register_model_view(Aggregate)
 class AggregateView(generic.ObjectView):
@@ -379,7 +406,7 @@ class AggregatePrefixesView(generic.ObjectChildrenView):
     def get_children(self, request, parent):
         return Prefix.objects.restrict(request.user, 'view').filter(
             prefix__net_contained_or_equal=str(parent.prefix)
-        ).prefetch_related('scope', 'role', 'tenant', 'tenant__group', 'vlan')
+        ).prefetch_related('scope', 'role', 'tenant', 'tenant__group', 'vlan').annotate_utilization()
 
     def prep_table_data(self, request, queryset, parent):
         # Determine whether to show assigned prefixes, available prefixes, or both
@@ -510,6 +537,12 @@ class PrefixListView(generic.ObjectListView):
     table = tables.PrefixTable
     template_name = 'ipam/prefix_list.html'
 
+    def get_table(self, data, request, bulk_actions=True):
+        # Compute utilization for all listed objects at once, if the utilization column is displayed
+        if self.table(data, user=request.user).columns['utilization'].visible:
+            data = data.annotate_utilization()
+        return super().get_table(data, request, bulk_actions)
+
 
 @register_model_view(Prefix)
 class PrefixView(generic.ObjectView):
@@ -576,7 +609,7 @@ class PrefixPrefixesView(generic.ObjectChildrenView):
     def get_children(self, request, parent):
         return parent.get_child_prefixes().restrict(request.user, 'view').prefetch_related(
             'scope', 'vrf', 'vlan', 'role', 'tenant', 'tenant__group'
-        )
+        ).annotate_utilization()
 
     def prep_table_data(self, request, queryset, parent):
         # Determine whether to show assigned prefixes, available prefixes, or both
@@ -664,7 +697,7 @@ class PrefixDeleteView(generic.ObjectDeleteView):
 
 
 @register_model_view(Prefix, 'bulk_import', path='import', detail=False)
-class PrefixBulkImportView(generic.BulkImportView):
+class PrefixBulkImportView(BulkImportDuplicateCheckMixin, generic.BulkImportView):
     queryset = Prefix.objects.all()
     model_form = forms.PrefixImportForm
 
@@ -927,7 +960,7 @@ class IPAddressBulkCreateView(generic.BulkCreateView):
 
 
 @register_model_view(IPAddress, 'bulk_import', path='import', detail=False)
-class IPAddressBulkImportView(generic.BulkImportView):
+class IPAddressBulkImportView(BulkImportDuplicateCheckMixin, generic.BulkImportView):
     queryset = IPAddress.objects.all()
     model_form = forms.IPAddressImportForm
 
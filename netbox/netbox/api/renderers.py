@@ -1,7 +1,8 @@
-from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
 
 __all__ = (
     'FormlessBrowsableAPIRenderer',
+    'NDJSONRenderer',
     'TextRenderer',
 )
 
@@ -17,6 +18,22 @@ class FormlessBrowsableAPIRenderer(BrowsableAPIRenderer):
         return None
 
 
+class NDJSONRenderer(JSONRenderer):
+    """
+    Render a list of objects as newline-delimited JSON, with one object per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        render = super().render
+        return b''.join(render(item, accepted_media_type, renderer_context) + b'\n' for item in data)
+
+
 class TextRenderer(BaseRenderer):
     """
     Return raw data as plain text.
@@ -10,7 +10,9 @@ RQ_QUEUE_LOW = 'low'
 ADVISORY_LOCK_KEYS = {
     # Available object locks
     'available-prefixes': 100100,
+    'available-prefixes-vrf': 100110,
     'available-ips': 100200,
+    'available-ips-vrf': 100210,
     'available-vlans': 100300,
     'available-asns': 100400,
 
@@ -1,10 +1,14 @@
 from contextvars import ContextVar
 
 __all__ = (
+    'changelog_queue',
     'current_request',
     'events_queue',
+    'search_queue',
 )
 
 
+changelog_queue = ContextVar('changelog_queue', default=None)
 current_request = ContextVar('current_request', default=None)
 events_queue = ContextVar('events_queue', default=dict())
+search_queue = ContextVar('search_queue', default=None)
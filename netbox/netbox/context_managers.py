@@ -1,8 +1,14 @@
+from collections import defaultdict
 from contextlib import contextmanager
 
-from netbox.context import current_request, events_queue
+from django.conf import settings
+
+from core.changelog import ObjectChangeQueue
+from netbox.context import changelog_queue, current_request, events_queue, search_queue
+from netbox.search.backends import flush_search_queue
+from netbox.search.cache import batch_index_version
 from netbox.utils import register_request_processor
-from extras.events import flush_events
+from extras.events import event_rule_index, flush_events
 
 
 @register_request_processor
@@ -15,14 +21,49 @@ def event_tracking(request):
     :param request: WSGIRequest object with a unique `id` set
     """
     current_request.set(request)
+    changelog_queue.set(ObjectChangeQueue())
     events_queue.set({})
 
-    yield
+    # Ensure that the EventRules against which queued events are checked are current
+    event_rule_index.refresh()
 
-    # Flush queued webhooks to RQ
-    if events := list(events_queue.get().values()):
-        flush_events(events)
+    try:
+        yield
 
-    # Clear context vars
-    current_request.set(None)
-    events_queue.set({})
+        # Flush queued webhooks to RQ
+        if events := list(events_queue.get().values()):
+            flush_events(events)
+    finally:
+        # Change records are written as each transaction is committed; write any which remain outstanding
+        changelog_queue.get().flush()
+
+        # Clear context vars
+        current_request.set(None)
+        changelog_queue.set(None)
+        events_queue.set({})
+
+
+@register_request_processor
+@contextmanager
+def search_indexing(request):
+    """
+    When deferred or background search indexing is enabled, record the objects created, modified, or deleted while
+    processing a request, then index them in a single batch once the request has completed. Invalidation of cached
+    search results is likewise limited to once per transaction.
+
+    :param request: WSGIRequest object
+    """
+    with batch_index_version():
+        if settings.SEARCH_INDEXING_MODE == 'synchronous':
+            yield
+            return
+
+        search_queue.set(defaultdict(set))
+        try:
+            yield
+        finally:
+            # Objects are recorded only once their changes have been committed, so index them even if an exception
+            # has been raised
+            queue = search_queue.get()
+            search_queue.set(None)
+            flush_search_queue(queue)
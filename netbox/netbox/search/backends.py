@@ -1,27 +1,38 @@
+import re
+import uuid
 from collections import defaultdict
+from functools import partial
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.search import SearchQuery, SearchVector, TrigramSimilarity
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
 from django.db.models import F, Window, Q, prefetch_related_objects
 from django.db.models.fields.related import ForeignKey
 from django.db.models.functions import window
 from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
+from django_rq import get_queue
 import netaddr
 from netaddr.core import AddrFormatError
 
 from core.models import ObjectType
 from extras.models import CachedValue, CustomField
+from netbox.context import search_queue
 from netbox.registry import registry
 from utilities.object_types import object_type_identifier
 from utilities.querysets import RestrictedPrefetch
+from utilities.rqworker import get_queue_for_model, get_rq_retry
 from utilities.string import title
 from . import FieldTypes, LookupTypes, get_indexer
+from .cache import SearchResultCache, bump_index_version, get_index_version
 
 DEFAULT_LOOKUP_TYPE = LookupTypes.PARTIAL
 MAX_RESULTS = 1000
+RESULT_CACHE_SIZE = 128
 
 
 class SearchBackend:
@@ -60,22 +71,62 @@ class SearchBackend:
 
     def caching_handler(self, sender, instance, created, **kwargs):
         """
-        Receiver for the post_save signal, responsible for caching object creation/changes.
+        Receiver for the post_save signal, responsible for caching object creation/changes. If deferred indexing is
+        active, the object is queued for indexing instead.
         """
+        if (queue := search_queue.get()) is not None:
+            self.enqueue(queue, instance)
+            return
         self.cache(instance, remove_existing=not created)
 
     def removal_handler(self, sender, instance, **kwargs):
         """
-        Receiver for the post_delete signal, responsible for caching object deletion.
+        Receiver for the post_delete signal, responsible for caching object deletion. If deferred indexing is active,
+        the object is queued for removal instead.
         """
+        if (queue := search_queue.get()) is not None:
+            self.enqueue(queue, instance)
+            return
         self.remove(instance)
 
+    @staticmethod
+    def enqueue(queue, instance):
+        """
+        Record an object in a deferred indexing queue, which maps model labels to sets of primary keys, once the
+        current transaction has been committed. Objects which are not indexed for search are ignored.
+        """
+        label = f'{instance._meta.app_label}.{instance._meta.model_name}'
+        if label in registry['search'] and instance.pk is not None:
+            transaction.on_commit(partial(queue[label].add, instance.pk))
+
+    def refresh(self, objects):
+        """
+        Rebuild the cached representations of a set of objects, specified as a mapping of model labels to primary
+        keys. Cached data for any objects which no longer exist is removed.
+        """
+        counter = 0
+        for label, pks in objects.items():
+            indexer = registry['search'][label]
+            for pk in pks:
+                self.remove(indexer.model(pk=pk))
+            queryset = indexer.model.objects.filter(pk__in=pks)
+            counter += self.cache(queryset.iterator(), indexer=indexer, remove_existing=False)
+
+        return counter
+
     def cache(self, instances, indexer=None, remove_existing=True):
         """
         Create or update the cached representation of an instance.
         """
         raise NotImplementedError
 
+    def load(self, instances, indexer):
+        """
+        Bulk-load the cached representations of a set of objects, replacing any existing cached data. Backends may
+        override this method to employ a more efficient loading mechanism than cache().
+        """
+        return self.cache(instances, indexer=indexer, remove_existing=True)
+
     def remove(self, instance):
         """
         Delete any cached representation of an instance.
@@ -105,33 +156,30 @@ class SearchBackend:
 
 class CachedValueSearchBackend(SearchBackend):
 
+    def __init__(self):
+        self.result_cache = SearchResultCache(max_size=RESULT_CACHE_SIZE)
+
     def search(self, value, user=None, object_types=None, lookup=DEFAULT_LOOKUP_TYPE):
 
-        # Build the filter used to find relevant CachedValue records
-        query_filter = Q(**{f'value__{lookup}': value})
-        if object_types:
-            # Limit results by object type
-            query_filter &= Q(object_type__in=object_types)
-        if lookup in (LookupTypes.STARTSWITH, LookupTypes.ENDSWITH):
-            # "Starts/ends with" matches are valid only on string values
-            query_filter &= Q(type=FieldTypes.STRING)
-        elif lookup == LookupTypes.PARTIAL:
-            try:
-                # If the value looks like an IP address, add an extra match for CIDR values
-                address = str(netaddr.IPNetwork(value.strip()).cidr)
-                query_filter |= Q(type=FieldTypes.CIDR) & Q(value__net_contains_or_equals=address)
-            except (AddrFormatError, ValueError):
-                pass
+        # Results obtained within a transaction may reflect uncommitted changes, so they are never cached
+        if transaction.get_connection().in_atomic_block:
+            return self.get_results(value, user=user, object_types=object_types, lookup=lookup)
+
+        # Return the cached results of an identical search, provided the search index has not changed since
+        key = self.result_cache.get_key(value, lookup, object_types, user)
+        version = get_index_version()
+        if (results := self.result_cache.get(key, version)) is None:
+            results = self.get_results(value, user=user, object_types=object_types, lookup=lookup)
+            self.result_cache.set(key, version, results)
 
+        return list(results)
+
+    def get_results(self, value, user=None, object_types=None, lookup=DEFAULT_LOOKUP_TYPE):
+        """
+        Execute a search, returning a list of the matching CachedValues which the user has permission to view.
+        """
         # Construct the base queryset to retrieve matching results
-        queryset = CachedValue.objects.filter(query_filter).annotate(
-            # Annotate the rank of each result for its object according to its weight
-            row_number=Window(
-                expression=window.RowNumber(),
-                partition_by=[F('object_type'), F('object_id')],
-                order_by=[F('weight').asc()],
-            )
-        )[:MAX_RESULTS]
+        queryset = self.get_queryset(value, object_types=object_types, lookup=lookup)
 
         # Gather all ObjectTypes present in the search results (used for prefetching related
         # objects). This must be done before generating the final results list, which returns
@@ -184,6 +232,43 @@ class CachedValueSearchBackend(SearchBackend):
 
         return ret
 
+    def get_filter(self, value, object_types=None, lookup=DEFAULT_LOOKUP_TYPE):
+        """
+        Return a Q object matching the CachedValues relevant to the given search.
+        """
+        query_filter = Q(**{f'value__{lookup}': value})
+        if object_types:
+            # Limit results by object type
+            query_filter &= Q(object_type__in=object_types)
+        if lookup in (LookupTypes.STARTSWITH, LookupTypes.ENDSWITH):
+            # "Starts/ends with" matches are valid only on string values
+            query_filter &= Q(type=FieldTypes.STRING)
+        elif lookup == LookupTypes.PARTIAL:
+            try:
+                # If the value looks like an IP address, add an extra match for CIDR values
+                address = str(netaddr.IPNetwork(value.strip()).cidr)
+                query_filter |= Q(type=FieldTypes.CIDR) & Q(value__net_contains_or_equals=address)
+            except (AddrFormatError, ValueError):
+                pass
+
+        return query_filter
+
+    def get_queryset(self, value, object_types=None, lookup=DEFAULT_LOOKUP_TYPE):
+        """
+        Return a queryset of matching CachedValues, annotated with the rank of each result for its object
+        (`row_number`).
+        """
+        return CachedValue.objects.filter(
+            self.get_filter(value, object_types=object_types, lookup=lookup)
+        ).annotate(
+            # Annotate the rank of each result for its object according to its weight
+            row_number=Window(
+                expression=window.RowNumber(),
+                partition_by=[F('object_type'), F('object_id')],
+                order_by=[F('weight').asc()],
+            )
+        )[:MAX_RESULTS]
+
     def cache(self, instances, indexer=None, remove_existing=True):
         object_type = None
         custom_fields = None
@@ -236,6 +321,37 @@ class CachedValueSearchBackend(SearchBackend):
         if buffer:
             counter += len(CachedValue.objects.bulk_create(buffer))
 
+        if counter:
+            bump_index_version()
+
+        return counter
+
+    def load(self, instances, indexer):
+        instances = list(instances)
+        object_type = ObjectType.objects.get_for_model(indexer.model)
+        custom_fields = CustomField.objects.filter(object_types=object_type).exclude(search_weight=0)
+
+        # Wipe out any previously cached values for the objects
+        qs = CachedValue.objects.filter(object_type=object_type, object_id__in=[instance.pk for instance in instances])
+        qs._raw_delete(using=qs.db)
+
+        # Stream the new values into the table using COPY
+        columns = ('id', 'timestamp', 'object_type_id', 'object_id', 'field', 'type', 'weight', 'value')
+        sql = f'COPY {CachedValue._meta.db_table} ({", ".join(columns)}) FROM STDIN'
+        timestamp = timezone.now()
+        counter = 0
+        with connection.cursor() as cursor:
+            with cursor.copy(sql) as copy:
+                for instance in instances:
+                    for field in indexer.to_cache(instance, custom_fields=custom_fields):
+                        copy.write_row((
+                            uuid.uuid4(), timestamp, object_type.pk, instance.pk, field.name, field.type, field.weight,
+                            str(field.value)
+                        ))
+                        counter += 1
+
+        bump_index_version()
+
         return counter
 
     def remove(self, instance):
@@ -249,7 +365,29 @@ class CachedValueSearchBackend(SearchBackend):
         qs = CachedValue.objects.filter(object_type=ct, object_id=instance.pk)
 
         # Call _raw_delete() on the queryset to avoid first loading instances into memory
-        return qs._raw_delete(using=qs.db)
+        deleted = qs._raw_delete(using=qs.db)
+
+        # Invalidate cached results only after the values have been deleted
+        bump_index_version()
+
+        return deleted
+
+    def refresh(self, objects):
+        counter = 0
+        for label, pks in objects.items():
+            indexer = registry['search'][label]
+            object_type = ObjectType.objects.get_for_model(indexer.model)
+
+            # Wipe out any previously cached values for all the objects at once
+            qs = CachedValue.objects.filter(object_type=object_type, object_id__in=pks)
+            qs._raw_delete(using=qs.db)
+
+            queryset = indexer.model.objects.filter(pk__in=pks)
+            counter += self.cache(queryset.iterator(), indexer=indexer, remove_existing=False)
+
+        bump_index_version()
+
+        return counter
 
     def clear(self, object_types=None):
         qs = CachedValue.objects.all()
@@ -257,7 +395,12 @@ class CachedValueSearchBackend(SearchBackend):
             qs = qs.filter(object_type__in=object_types)
 
         # Call _raw_delete() on the queryset to avoid first loading instances into memory
-        return qs._raw_delete(using=qs.db)
+        deleted = qs._raw_delete(using=qs.db)
+
+        # Invalidate cached results only after the values have been deleted
+        bump_index_version()
+
+        return deleted
 
     def count(self, object_types=None):
         qs = CachedValue.objects.all()
@@ -270,6 +413,40 @@ class CachedValueSearchBackend(SearchBackend):
         return CachedValue.objects.count()
 
 
+class PostgresSearchBackend(CachedValueSearchBackend):
+    """
+    Extends CachedValueSearchBackend to answer partial, exact, and "starts with" searches from the full text and
+    trigram indexes maintained on cached values. Results are ranked first by weight, then by their similarity to the
+    search value.
+    """
+    def get_filter(self, value, object_types=None, lookup=DEFAULT_LOOKUP_TYPE):
+        query_filter = super().get_filter(value, object_types=object_types, lookup=lookup)
+
+        # Narrow exact matches using the full text index. (The case-insensitive comparison is still applied to the
+        # candidate rows.) A value without any word characters yields an empty tsquery, which matches nothing.
+        if lookup == LookupTypes.EXACT and re.search(r'\w', value):
+            query_filter &= Q(search_vector=SearchQuery(value, config='simple', search_type='phrase'))
+
+        return query_filter
+
+    def get_queryset(self, value, object_types=None, lookup=DEFAULT_LOOKUP_TYPE):
+        # The search vector expression must match that of the full text index on CachedValue
+        return CachedValue.objects.alias(
+            search_vector=SearchVector('value', config='simple')
+        ).filter(
+            self.get_filter(value, object_types=object_types, lookup=lookup)
+        ).annotate(
+            similarity=TrigramSimilarity('value', value)
+        ).annotate(
+            # Annotate the rank of each result for its object according to its weight & similarity
+            row_number=Window(
+                expression=window.RowNumber(),
+                partition_by=[F('object_type'), F('object_id')],
+                order_by=[F('weight').asc(), F('similarity').desc()],
+            )
+        ).order_by('weight', '-similarity', 'object_type', 'object_id')[:MAX_RESULTS]
+
+
 def get_backend():
     """
     Initializes and returns the configured search backend.
@@ -283,6 +460,29 @@ def get_backend():
     return backend_cls()
 
 
+def flush_search_queue(queue):
+    """
+    Index all objects recorded in a deferred indexing queue, either immediately or (if SEARCH_INDEXING_MODE is
+    "background") by way of a background task.
+    """
+    objects = {label: list(pks) for label, pks in queue.items() if pks}
+    if not objects:
+        return
+
+    if settings.SEARCH_INDEXING_MODE == 'background':
+        rq_queue = get_queue(get_queue_for_model('search'))
+        rq_queue.enqueue('netbox.search.backends.refresh_cached_values', objects, retry=get_rq_retry())
+    else:
+        search_backend.refresh(objects)
+
+
+def refresh_cached_values(objects):
+    """
+    Background task for refreshing the cached representations of a set of objects.
+    """
+    return search_backend.refresh(objects)
+
+
 search_backend = get_backend()
 
 # Connect handlers to the appropriate model signals
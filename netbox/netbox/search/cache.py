@@ -0,0 +1,161 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+
+from users.constants import CONSTRAINT_TOKEN_USER
+
+__all__ = (
+    'SearchResultCache',
+    'batch_index_version',
+    'bump_index_version',
+    'get_index_version',
+    'get_permission_fingerprint',
+)
+
+INDEX_VERSION_KEY = 'search_index_version'
+
+
+def get_index_version():
+    """
+    Return the current version of the search index. This is shared by all NetBox processes.
+    """
+    return cache.get(INDEX_VERSION_KEY, 0)
+
+
+# Records whether the index has changed within the current thread without the version having been incremented
+_local = threading.local()
+
+
+def _increment_index_version():
+    # Increment the version only for the first callback scheduled within a transaction
+    if getattr(_local, 'pending', False):
+        _local.pending = False
+        cache.add(INDEX_VERSION_KEY, 0, None)
+        cache.incr(INDEX_VERSION_KEY)
+
+
+def bump_index_version():
+    """
+    Increment the version of the search index once the current transaction has been committed, invalidating any
+    previously cached search results. The version is incremented only once per transaction. (If a transaction is
+    rolled back, the version is instead incremented when the next one is committed, which is harmless.)
+
+    Within batch_index_version(), a callback is scheduled only if no increment is already outstanding. Changes made
+    outside a transaction, and any whose increment is lost because their transaction was rolled back, are accounted
+    for when the batch ends.
+    """
+    if getattr(_local, 'batched', False):
+        if not getattr(_local, 'pending', False):
+            _local.pending = True
+            if transaction.get_connection().in_atomic_block:
+                transaction.on_commit(_increment_index_version)
+        return
+
+    _local.pending = True
+    transaction.on_commit(_increment_index_version)
+
+
+@contextmanager
+def batch_index_version():
+    """
+    Limit the increments of the search index version to one for each transaction committed within the context, and
+    increment it upon exit if any change remains unaccounted for.
+    """
+    batched = getattr(_local, 'batched', False)
+    _local.batched = True
+    try:
+        yield
+    finally:
+        _local.batched = batched
+        if not batched:
+            _increment_index_version()
+
+
+def get_permission_fingerprint(user):
+    """
+    Return a string identifying the set of view permissions held by a user. Users with identical permissions share
+    the same fingerprint, unless their permissions are constrained by reference to the user.
+    """
+    if user is None:
+        return 'unrestricted'
+    if not user.is_authenticated:
+        return 'anonymous'
+    if user.is_superuser:
+        return 'superuser'
+
+    # Populate the user's cache of permissions & constraints
+    user.get_all_permissions()
+    permissions = {
+        name: constraints for name, constraints in getattr(user, '_object_perm_cache', {}).items()
+        if '.view_' in name
+    }
+    data = json.dumps(permissions, sort_keys=True, default=str)
+    if CONSTRAINT_TOKEN_USER in data:
+        data += f':{user.pk}'
+
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class SearchResultCache:
+    """
+    A bounded, least-recently-used cache of search results local to the process. Each entry is stored along with the
+    search index version at the time of the search; entries belonging to any other version are treated as misses.
+
+    Attributes:
+        max_size: The maximum number of entries to retain
+        hits: The number of lookups which returned a cached result
+        misses: The number of lookups which did not return a cached result
+    """
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def get_key(value, lookup, object_types, user):
+        """
+        Return the cache key for a search.
+        """
+        # All lookups except regular expressions are case-insensitive
+        if not lookup.endswith('regex'):
+            value = value.lower()
+        object_type_ids = tuple(sorted(ot.pk for ot in object_types or ()))
+
+        return value, lookup, object_type_ids, get_permission_fingerprint(user)
+
+    def get(self, key, version):
+        """
+        Return the cached results for the given key and index version, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, results):
+        """
+        Store the results of a search, evicting the least recently used entry if the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = (version, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -157,6 +157,7 @@ RQ_RETRY_INTERVAL = getattr(configuration, 'RQ_RETRY_INTERVAL', 60)
 RQ_RETRY_MAX = getattr(configuration, 'RQ_RETRY_MAX', 0)
 SCRIPTS_ROOT = getattr(configuration, 'SCRIPTS_ROOT', os.path.join(BASE_DIR, 'scripts')).rstrip('/')
 SEARCH_BACKEND = getattr(configuration, 'SEARCH_BACKEND', 'netbox.search.backends.CachedValueSearchBackend')
+SEARCH_INDEXING_MODE = getattr(configuration, 'SEARCH_INDEXING_MODE', 'synchronous')
 SECRET_KEY = getattr(configuration, 'SECRET_KEY')  # Required
 SECURE_HSTS_INCLUDE_SUBDOMAINS = getattr(configuration, 'SECURE_HSTS_INCLUDE_SUBDOMAINS', False)
 SECURE_HSTS_PRELOAD = getattr(configuration, 'SECURE_HSTS_PRELOAD', False)
@@ -176,12 +177,19 @@ STORAGE_BACKEND = getattr(configuration, 'STORAGE_BACKEND', None)
 STORAGE_CONFIG = getattr(configuration, 'STORAGE_CONFIG', {})
 TIME_ZONE = getattr(configuration, 'TIME_ZONE', 'UTC')
 TRANSLATION_ENABLED = getattr(configuration, 'TRANSLATION_ENABLED', True)
+WEBHOOK_CONCURRENCY = getattr(configuration, 'WEBHOOK_CONCURRENCY', 1)
 DISK_BASE_UNIT = getattr(configuration, 'DISK_BASE_UNIT', 1000)
 if DISK_BASE_UNIT not in [1000, 1024]:
     raise ImproperlyConfigured(f"DISK_BASE_UNIT must be 1000 or 1024 (found {DISK_BASE_UNIT})")
 RAM_BASE_UNIT = getattr(configuration, 'RAM_BASE_UNIT', 1000)
 if RAM_BASE_UNIT not in [1000, 1024]:
     raise ImproperlyConfigured(f"RAM_BASE_UNIT must be 1000 or 1024 (found {RAM_BASE_UNIT})")
+if SEARCH_INDEXING_MODE not in ('synchronous', 'deferred', 'background'):
+    raise ImproperlyConfigured(
+        f"SEARCH_INDEXING_MODE must be 'synchronous', 'deferred', or 'background' (found {SEARCH_INDEXING_MODE})"
+    )
+if type(WEBHOOK_CONCURRENCY) is not int or WEBHOOK_CONCURRENCY < 1:
+    raise ImproperlyConfigured(f"WEBHOOK_CONCURRENCY must be a positive integer (found {WEBHOOK_CONCURRENCY})")
 
 # Load any dynamic configuration parameters which have been hard-coded in the configuration file
 for param in CONFIG_PARAMS:
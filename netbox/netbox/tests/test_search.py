@@ -1,10 +1,19 @@
+from unittest.mock import patch
+
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 
+from core.models import ObjectType
 from dcim.models import Site
 from dcim.search import SiteIndex
 from extras.models import CachedValue
-from netbox.search.backends import search_backend
+from netbox.context_managers import search_indexing
+from netbox.search import LookupTypes
+from netbox.search.backends import CachedValueSearchBackend, PostgresSearchBackend, search_backend
+from netbox.search.cache import SearchResultCache, batch_index_version, bump_index_version, get_index_version
+from users.models import ObjectPermission, User
+from utilities.exceptions import AbortTransaction
 
 
 class SearchBackendTestCase(TestCase):
@@ -90,6 +99,24 @@ class SearchBackendTestCase(TestCase):
                     ),
                 )
 
+    def test_load_multiple_objects(self):
+        """
+        Test that load() caches multiple objects, replacing any existing entries
+        """
+        sites = Site.objects.all()
+        search_backend.cache(sites)
+        search_backend.load(sites, indexer=SiteIndex)
+
+        content_type = ContentType.objects.get_for_model(Site)
+        self.assertEqual(
+            CachedValue.objects.filter(object_type=content_type).count(),
+            len(SiteIndex.fields) * sites.count()
+        )
+        for site in sites:
+            self.assertTrue(
+                CachedValue.objects.filter(object_type=content_type, object_id=site.pk, value=site.name).exists()
+            )
+
     def test_cache_on_save(self):
         """
         Test that an object is automatically cached on calling save().
@@ -123,6 +150,77 @@ class SearchBackendTestCase(TestCase):
             CachedValue.objects.filter(object_type=content_type, object_id=site.pk).exists()
         )
 
+    def test_refresh(self):
+        """
+        Test that refresh() rebuilds the cached values for the specified objects.
+        """
+        sites = Site.objects.all()
+        search_backend.cache(sites)
+        site = sites.first()
+        Site.objects.filter(pk=site.pk).update(facility='Zulu')
+
+        search_backend.refresh({'dcim.site': [site.pk]})
+
+        content_type = ContentType.objects.get_for_model(Site)
+        self.assertTrue(
+            CachedValue.objects.filter(object_type=content_type, object_id=site.pk, value='Zulu').exists()
+        )
+        self.assertFalse(
+            CachedValue.objects.filter(object_type=content_type, object_id=site.pk, value='Alpha').exists()
+        )
+        self.assertEqual(CachedValue.objects.count(), len(SiteIndex.fields) * sites.count())
+
+    @override_settings(SEARCH_INDEXING_MODE='deferred')
+    def test_deferred_indexing(self):
+        """
+        Test that objects saved or deleted while deferred indexing is active are indexed only upon completion.
+        """
+        content_type = ContentType.objects.get_for_model(Site)
+        site = Site.objects.first()
+        search_backend.cache(site)
+
+        with search_indexing(None):
+            with self.captureOnCommitCallbacks(execute=True):
+                new_site = Site(name='Site 4', slug='site-4', facility='Delta')
+                new_site.save()
+                new_site.description = 'Fourth test site'
+                new_site.save()
+                site.delete()
+            self.assertFalse(
+                CachedValue.objects.filter(object_type=content_type, object_id=new_site.pk).exists()
+            )
+            self.assertTrue(
+                CachedValue.objects.filter(object_type=content_type, object_id=site.pk).exists()
+            )
+
+        self.assertEqual(
+            CachedValue.objects.filter(object_type=content_type, object_id=new_site.pk).count(),
+            4  # name, slug, facility, description
+        )
+        self.assertFalse(
+            CachedValue.objects.filter(object_type=content_type, object_id=site.pk).exists()
+        )
+
+    @override_settings(SEARCH_INDEXING_MODE='deferred')
+    def test_deferred_indexing_rollback(self):
+        """
+        Test that objects are indexed only once their changes have been committed, including when an exception is
+        raised while deferred indexing is active.
+        """
+        with patch.object(search_backend, 'refresh') as mock_refresh:
+            with self.assertRaises(AbortTransaction), search_indexing(None):
+                with self.captureOnCommitCallbacks(execute=True):
+                    site = Site.objects.create(name='Site 4', slug='site-4')
+                    try:
+                        with transaction.atomic():
+                            Site.objects.create(name='Site 5', slug='site-5')
+                            raise AbortTransaction()
+                    except AbortTransaction:
+                        pass
+                raise AbortTransaction()
+
+        mock_refresh.assert_called_once_with({'dcim.site': [site.pk]})
+
     def test_clear_all(self):
         """
         Test that calling clear() on the backend removes all cached entries.
@@ -151,3 +249,131 @@ class SearchBackendTestCase(TestCase):
         self.assertEqual(len(results), 1)
         results = search_backend.search('xxxxx')
         self.assertEqual(len(results), 0)
+
+    def test_search_postgres_backend(self):
+        """
+        Test various searches using the PostgreSQL full text & trigram backend.
+        """
+        backend = PostgresSearchBackend()
+        sites = Site.objects.all()
+        backend.cache(sites)
+
+        results = backend.search('site')
+        self.assertEqual(len(results), 3)
+        results = backend.search('first')
+        self.assertEqual(len(results), 1)
+        results = backend.search('site 1', lookup=LookupTypes.EXACT)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].object, sites.get(name='Site 1'))
+        results = backend.search('site', lookup=LookupTypes.STARTSWITH)
+        self.assertEqual(len(results), 3)
+        results = backend.search('xxxxx')
+        self.assertEqual(len(results), 0)
+
+
+class SearchResultCacheTestCase(TestCase):
+
+    def test_get_and_set(self):
+        result_cache = SearchResultCache(max_size=2)
+        key = result_cache.get_key('Foo', 'icontains', None, None)
+
+        self.assertIsNone(result_cache.get(key, 1))
+        result_cache.set(key, 1, ['foo'])
+        self.assertEqual(result_cache.get(key, 1), ['foo'])
+        self.assertEqual(result_cache.get(result_cache.get_key('FOO', 'icontains', None, None), 1), ['foo'])
+
+        # Results cached for a prior version of the index should be ignored
+        self.assertIsNone(result_cache.get(key, 2))
+        self.assertEqual(result_cache.hits, 2)
+        self.assertEqual(result_cache.misses, 2)
+
+    def test_eviction(self):
+        result_cache = SearchResultCache(max_size=2)
+        result_cache.set('a', 1, [])
+        result_cache.set('b', 1, [])
+        result_cache.get('a', 1)
+        result_cache.set('c', 1, [])
+
+        # The least recently used entry should have been evicted
+        self.assertEqual(len(result_cache), 2)
+        self.assertIsNone(result_cache.get('b', 1))
+        self.assertIsNotNone(result_cache.get('a', 1))
+        self.assertIsNotNone(result_cache.get('c', 1))
+
+
+class SearchResultCachingTestCase(TransactionTestCase):
+    """
+    Search results are cached only outside of a transaction, so these tests must commit their changes.
+    """
+    def setUp(self):
+        self.backend = CachedValueSearchBackend()
+        self.sites = Site.objects.bulk_create((
+            Site(name='Site 1', slug='site-1'),
+            Site(name='Site 2', slug='site-2'),
+        ))
+        self.backend.cache(self.sites)
+
+    def test_cached_results(self):
+        results = self.backend.search('site')
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.backend.result_cache.misses, 1)
+
+        # An identical search should be served from the cache
+        self.assertEqual(self.backend.search('SITE'), results)
+        self.assertEqual(self.backend.result_cache.hits, 1)
+
+    def test_invalidation(self):
+        self.assertEqual(len(self.backend.search('site')), 2)
+
+        # Caching a new object should invalidate previous results
+        site = Site.objects.bulk_create([Site(name='Site 3', slug='site-3')])[0]
+        self.backend.cache(site)
+        self.assertEqual(len(self.backend.search('site')), 3)
+        self.assertEqual(self.backend.result_cache.misses, 2)
+
+        # As should removing an object
+        self.backend.remove(site)
+        self.assertEqual(len(self.backend.search('site')), 2)
+        self.assertEqual(self.backend.result_cache.misses, 3)
+        self.assertEqual(self.backend.result_cache.hits, 0)
+
+    def test_batch_invalidation(self):
+        version = get_index_version()
+
+        # The version should be incremented once for each committed transaction, and once upon exiting the batch for
+        # any change whose transaction was rolled back
+        with batch_index_version():
+            with transaction.atomic():
+                bump_index_version()
+                bump_index_version()
+            self.assertEqual(get_index_version(), version + 1)
+            try:
+                with transaction.atomic():
+                    bump_index_version()
+                    raise AbortTransaction()
+            except AbortTransaction:
+                pass
+            with transaction.atomic():
+                bump_index_version()
+            self.assertEqual(get_index_version(), version + 1)
+        self.assertEqual(get_index_version(), version + 2)
+
+    def test_permission_fingerprint(self):
+        users = (
+            User.objects.create_user(username='User 1'),
+            User.objects.create_user(username='User 2'),
+        )
+        superuser = User.objects.create_user(username='Superuser', is_superuser=True)
+        obj_perm = ObjectPermission.objects.create(name='View site 1', constraints={'name': 'Site 1'}, actions=['view'])
+        obj_perm.users.add(*users)
+        obj_perm.object_types.add(ObjectType.objects.get_for_model(Site))
+
+        self.assertEqual([r.object for r in self.backend.search('site', user=users[0])], [self.sites[0]])
+
+        # Users holding identical permissions share cached results
+        self.assertEqual([r.object for r in self.backend.search('site', user=users[1])], [self.sites[0]])
+        self.assertEqual(self.backend.result_cache.hits, 1)
+
+        # Users holding different permissions do not
+        self.assertEqual(len(self.backend.search('site', user=superuser)), 2)
+        self.assertEqual(self.backend.result_cache.misses, 2)
@@ -1,3 +1,8 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
 from django.apps import apps
 from jinja2 import BaseLoader, TemplateNotFound
 from jinja2.meta import find_referenced_templates
@@ -7,8 +12,106 @@ from netbox.config import get_config
 
 __all__ = (
     'DataFileLoader',
+    'compile_template',
+    'get_environment',
+    'render_jinja2',
 )
 
+# Maximum number of compiled templates (and of environments) retained by each process
+TEMPLATE_CACHE_SIZE = 1024
+
+
+class TemplateCache:
+    """
+    A bounded, least-recently-used cache local to the process.
+
+    Attributes:
+        max_size: The maximum number of entries to retain
+    """
+    def __init__(self, max_size=TEMPLATE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_set(self, key, func):
+        """
+        Return the cached value for the given key. If none exists, call func() to populate it.
+        """
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            except KeyError:
+                pass
+
+        value = func()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Compiled template code, keyed by a hash of the template source and the environment's parameters
+template_cache = TemplateCache()
+
+# Environments without a template loader, keyed by their parameters
+environment_cache = TemplateCache()
+
+
+def _get_environment_key(environment):
+    """
+    Return a key identifying the configuration of a Jinja2 environment which affects template compilation.
+    """
+    return getattr(environment, 'netbox_params', None), tuple(sorted(environment.filters)), type(environment)
+
+
+def _create_environment(loader, params):
+    environment = SandboxedEnvironment(loader=loader, **params) if loader else SandboxedEnvironment(**params)
+    environment.filters.update(get_config().JINJA2_FILTERS)
+    environment.netbox_params = json.dumps(params, sort_keys=True, default=str)
+    return environment
+
+
+def get_environment(loader=None, **params):
+    """
+    Return a sandboxed Jinja2 environment with the configured filters and the specified parameters. Environments
+    without a loader are shared among all callers requesting the same parameters.
+    """
+    if loader is not None:
+        return _create_environment(loader, params)
+
+    filters = get_config().JINJA2_FILTERS
+    key = (
+        json.dumps(params, sort_keys=True, default=str),
+        tuple(sorted(filters.items(), key=lambda item: item[0])),
+    )
+    return environment_cache.get_or_set(key, lambda: _create_environment(None, params))
+
+
+def compile_template(environment, source, name=None, filename=None, globals=None, uptodate=None):
+    """
+    Return a Template instantiated from the given source. The compiled code is cached, so that repeated use of the
+    same template skips lexing, parsing, and compilation.
+    """
+    key = (
+        hashlib.sha256(source.encode()).hexdigest(),
+        name,
+        filename,
+        _get_environment_key(environment),
+    )
+    code = template_cache.get_or_set(key, lambda: environment.compile(source, name, filename))
+
+    return environment.template_class.from_code(environment, code, environment.make_globals(globals), uptodate)
+
 
 class DataFileLoader(BaseLoader):
     """
@@ -28,7 +131,14 @@ class DataFileLoader(BaseLoader):
             raise TemplateNotFound(template)
 
         # Find and pre-fetch referenced templates
-        if referenced_templates := tuple(find_referenced_templates(environment.parse(template_source))):
+        key = (
+            'references',
+            hashlib.sha256(template_source.encode()).hexdigest(),
+            _get_environment_key(environment),
+        )
+        if referenced_templates := template_cache.get_or_set(
+            key, lambda: tuple(find_referenced_templates(environment.parse(template_source)))
+        ):
             related_files = DataFile.objects.filter(source=self.data_source)
             # None indicates the use of dynamic resolution. If dependent files are statically
             # defined, we can filter by path for optimization.
@@ -40,6 +150,10 @@ class DataFileLoader(BaseLoader):
 
         return template_source, template, lambda: True
 
+    def load(self, environment, name, globals=None):
+        source, filename, uptodate = self.get_source(environment, name)
+        return compile_template(environment, source, name, filename, globals, uptodate)
+
     def cache_templates(self, templates):
         self._template_cache.update(templates)
 
@@ -52,6 +166,5 @@ def render_jinja2(template_code, context):
     """
     Render a Jinja2 template with the provided context. Return the rendered content.
     """
-    environment = SandboxedEnvironment()
-    environment.filters.update(get_config().JINJA2_FILTERS)
-    return environment.from_string(source=template_code).render(**context)
+    environment = get_environment()
+    return compile_template(environment, template_code).render(**context)
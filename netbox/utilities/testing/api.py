@@ -7,7 +7,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient as _APIClient
 from strawberry.types.base import StrawberryList, StrawberryOptional
 from strawberry.types.lazy_type import LazyType
 from strawberry.types.union import StrawberryUnion
@@ -17,7 +17,7 @@ from core.models import ObjectChange, ObjectType
 from ipam.graphql.types import IPAddressFamilyType
 from users.models import ObjectPermission, Token, User
 from utilities.api import get_graphql_type_for_model
-from .base import ModelTestCase
+from .base import CommitCallbacksMixin, ModelTestCase
 from .utils import disable_logging, disable_warnings
 
 __all__ = (
@@ -30,6 +30,10 @@ __all__ = (
 # REST/GraphQL API Tests
 #
 
+class APIClient(CommitCallbacksMixin, _APIClient):
+    pass
+
+
 class APITestCase(ModelTestCase):
     """
     Base test case for API requests.
@@ -6,7 +6,7 @@ from django.contrib.postgres.fields import ArrayField, RangeField
 from django.core.exceptions import FieldDoesNotExist
 from django.db.models import ManyToManyField, ManyToManyRel, JSONField
 from django.forms.models import model_to_dict
-from django.test import Client, TestCase as _TestCase
+from django.test import Client as _Client, TestCase as _TestCase
 from netaddr import IPNetwork
 from taggit.managers import TaggableManager
 
@@ -23,6 +23,21 @@ __all__ = (
 )
 
 
+class CommitCallbacksMixin:
+    """
+    Run the on_commit() callbacks registered while processing each request made by a test client. Tests run within
+    a transaction which is never committed, so these callbacks (which e.g. write change records) would otherwise never
+    run.
+    """
+    def request(self, **request):
+        with _TestCase.captureOnCommitCallbacks(execute=True):
+            return super().request(**request)
+
+
+class Client(CommitCallbacksMixin, _Client):
+    pass
+
+
 class TestCase(_TestCase):
     user_permissions = ()
 
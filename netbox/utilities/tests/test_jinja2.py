@@ -0,0 +1,36 @@
+from django.test import TestCase
+
+from utilities.jinja2 import TemplateCache, compile_template, get_environment, render_jinja2, template_cache
+
+
+class TemplateCacheTestCase(TestCase):
+
+    def setUp(self):
+        template_cache.clear()
+
+    def test_render_jinja2(self):
+        template_code = '{% for i in items %}{{ i }},{% endfor %}'
+
+        self.assertEqual(render_jinja2(template_code, {'items': [1, 2]}), '1,2,')
+        self.assertEqual(render_jinja2(template_code, {'items': [3]}), '3,')
+
+        # The template should have been compiled only once
+        self.assertEqual(len(template_cache), 1)
+
+    def test_environment_parameters(self):
+        template_code = '{% if True %}\nfoo\n{% endif %}'
+
+        self.assertEqual(compile_template(get_environment(), template_code).render(), '\nfoo\n')
+        self.assertEqual(compile_template(get_environment(trim_blocks=True), template_code).render(), 'foo\n')
+        self.assertIs(get_environment(trim_blocks=True), get_environment(trim_blocks=True))
+
+    def test_eviction(self):
+        cache = TemplateCache(max_size=2)
+        cache.get_or_set('a', lambda: 1)
+        cache.get_or_set('b', lambda: 2)
+        cache.get_or_set('a', lambda: None)
+        cache.get_or_set('c', lambda: 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_or_set('a', lambda: None), 1)
+        self.assertIsNone(cache.get_or_set('b', lambda: None))